@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+#
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+"""
+Generate a synthetic libvirt replay fixture for scale benchmarks.
+
+The output can be served offline with a magic replay URI, ex:
+
+    ./tests/benchmarks/genfixture.py --domains 10000 --volumes 10000 /tmp/10k.json.gz
+    virt-manager --connect \\
+        "__virtinst_test__test:///default,replay=/tmp/10k.json.gz,latency=2"
+
+Fixtures recorded from a real host with the 'record=' magic URI
+option work the same way.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+# pylint: disable=wrong-import-position
+from virtinst import replayconn
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic libvirt replay fixture")
+    parser.add_argument("output", help="Path of the gzipped fixture to write")
+    parser.add_argument("--domains", type=int, default=1000)
+    parser.add_argument("--volumes", type=int, default=1000)
+    parser.add_argument("--nodedevs", type=int, default=0)
+    parser.add_argument("--uri", default="qemu:///system", help="URI the fixture reports")
+    options = parser.parse_args()
+
+    data = replayconn.generate_fixture(
+        options.domains, options.volumes, options.nodedevs, uri=options.uri
+    )
+    replayconn.save_fixture(options.output, data)
+    print(
+        "Wrote %s: %d domains, %d volumes, %d nodedevs, %d bytes"
+        % (
+            options.output,
+            options.domains,
+            options.volumes,
+            options.nodedevs,
+            os.path.getsize(options.output),
+        )
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
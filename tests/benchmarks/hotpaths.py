@@ -0,0 +1,630 @@
+#!/usr/bin/env python3
+#
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+"""
+Benchmarks for virtinst and virt-manager hot paths.
+
+Every case builds its input up front, then times only the interesting
+call. Object counts are multiplied by --scale, so CI can run a quick
+pass while a full run uses thousands of domains. Results are written
+as JSON, and can be compared against a previous run:
+
+    ./tests/benchmarks/hotpaths.py --output old.json
+    ...
+    ./tests/benchmarks/hotpaths.py --baseline old.json --threshold 20
+
+The same cases run under pytest with:
+
+    pytest --benchmarks tests/benchmarks
+"""
+
+import argparse
+import json
+import os
+import platform
+import shlex
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+TOPDIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, TOPDIR)
+
+RESULTS_VERSION = 1
+
+# name -> (setup function, iterations)
+CASES = {}
+
+
+def _benchmark(name, iterations):
+    def wrap(func):
+        CASES[name] = (func, iterations)
+        return func
+
+    return wrap
+
+
+class SkipBenchmark(Exception):
+    """
+    Raised from a case setup when its dependencies are not available
+    """
+
+
+####################
+# Input generators #
+####################
+
+
+def _disk_target(idx):
+    letters = ""
+    idx += 1
+    while idx:
+        idx, rem = divmod(idx - 1, 26)
+        letters = chr(ord("a") + rem) + letters
+    return "vd" + letters
+
+
+def make_guest_xml(ndevices, name="bench"):
+    """
+    Domain XML with ndevices devices, a rotating mix of disks, NICs,
+    serial ports, and controllers
+    """
+    devices = []
+    for idx in range(ndevices):
+        kind = idx % 4
+        if kind == 0:
+            devices.append(
+                "<disk type='file' device='disk'>"
+                "<driver name='qemu' type='qcow2'/>"
+                "<source file='/var/lib/libvirt/images/%s-%d.qcow2'/>"
+                "<target dev='%s' bus='virtio'/></disk>" % (name, idx, _disk_target(idx // 4))
+            )
+        elif kind == 1:
+            devices.append(
+                "<interface type='network'><source network='default'/>"
+                "<mac address='52:54:00:%02x:%02x:%02x'/><model type='virtio'/></interface>"
+                % ((idx >> 16) & 0xFF, (idx >> 8) & 0xFF, idx & 0xFF)
+            )
+        elif kind == 2:
+            devices.append("<serial type='pty'><target port='%d'/></serial>" % (idx // 4))
+        else:
+            devices.append("<controller type='scsi' index='%d' model='virtio-scsi'/>" % (idx // 4))
+
+    return (
+        "<domain type='kvm'>"
+        "<name>%s</name>"
+        "<uuid>00000000-1111-2222-3333-444444444444</uuid>"
+        "<memory>1048576</memory><currentMemory>1048576</currentMemory><vcpu>2</vcpu>"
+        "<os><type arch='x86_64' machine='q35'>hvm</type></os>"
+        "<features><acpi/><apic/></features>"
+        "<devices><emulator>/usr/bin/qemu-system-x86_64</emulator>%s</devices>"
+        "</domain>" % (name, "".join(devices))
+    )
+
+
+def make_testdriver_xml(ndomains, nvolumes, npcidevs=0):
+    """
+    test:/// driver XML with ndomains domains, and nvolumes volumes in
+    a single dir pool. Domain N uses volume N, if there is one.
+    npcidevs SR-IOV PCI nodedevs are added, each with a child net
+    device and a child mdev.
+    """
+    domains = []
+    for idx in range(ndomains):
+        domains.append(
+            "<domain type='test'><name>bench-%05d</name>"
+            "<uuid>%08d-0000-0000-0000-000000000000</uuid>"
+            "<memory>1048576</memory><currentMemory>1048576</currentMemory><vcpu>1</vcpu>"
+            "<os><type arch='i686'>hvm</type></os>"
+            "<devices><disk type='file' device='disk'>"
+            "<source file='/bench-pool/vol-%05d.qcow2'/><target dev='vda' bus='virtio'/></disk>"
+            "<interface type='network'><source network='default'/></interface>"
+            "</devices></domain>" % (idx, idx, idx)
+        )
+
+    volumes = []
+    for idx in range(nvolumes):
+        volumes.append(
+            "<volume type='file'><name>vol-%05d.qcow2</name>"
+            "<capacity>1000000</capacity><allocation>50000</allocation>"
+            "<target><format type='qcow2'/></target></volume>" % idx
+        )
+
+    nodedevs = []
+    for idx in range(npcidevs):
+        bus, slot = divmod(idx, 32)
+        pciname = "pci_0000_%02x_%02x_0" % (bus, slot)
+        nodedevs.append(
+            "<device><name>%(pci)s</name><parent>computer</parent>"
+            "<capability type='pci'><domain>0</domain><bus>%(bus)d</bus><slot>%(slot)d</slot>"
+            "<function>0</function><product id='0x10ed'>Virtual Function</product>"
+            "<vendor id='0x8086'>Intel Corporation</vendor>"
+            "<capability type='virt_functions' maxCount='1'/></capability></device>"
+            "<device><name>net_bench%(idx)05d</name><parent>%(pci)s</parent>"
+            "<capability type='net'><interface>bench%(idx)05d</interface>"
+            "<address>52:54:00:%(mac)s</address></capability></device>"
+            "<device><name>mdev_bench_%(idx)05d</name><parent>%(pci)s</parent>"
+            "<capability type='mdev'><type id='bench-type'/>"
+            "<iommuGroup number='%(idx)d'/></capability></device>"
+            % {
+                "pci": pciname,
+                "bus": bus,
+                "slot": slot,
+                "idx": idx,
+                "mac": "%02x:%02x:%02x" % (idx >> 16, (idx >> 8) & 0xFF, idx & 0xFF),
+            }
+        )
+
+    return (
+        "<node><cpu><nodes>1</nodes><sockets>4</sockets><cores>4</cores><threads>1</threads>"
+        "<active>16</active><mhz>4000</mhz><model>i686</model></cpu>"
+        "<memory>100000000</memory>"
+        "%s"
+        "<network><name>default</name><uuid>00000000-0000-0000-0000-0000000000ff</uuid>"
+        "<bridge name='virbr0'/><forward/><ip address='192.168.122.1' netmask='255.255.255.0'/>"
+        "</network>"
+        "<pool type='dir'><name>bench-pool</name>"
+        "<uuid>00000000-0000-0000-0000-0000000000fe</uuid>"
+        "<capacity unit='TiB'>32</capacity><allocation>0</allocation>"
+        "<available unit='TiB'>32</available><source/>"
+        "<target><path>/bench-pool</path></target>%s</pool>"
+        "%s"
+        "</node>" % ("".join(domains), "".join(volumes), "".join(nodedevs))
+    )
+
+
+_TESTDRIVER_FILES = {}
+_TMPFILES = []
+
+
+def _open_testdriver(ndomains, nvolumes, npcidevs=0):
+    from virtinst import cli
+
+    key = (ndomains, nvolumes, npcidevs)
+    if key not in _TESTDRIVER_FILES:
+        fd, path = tempfile.mkstemp(prefix="virtinst-bench-", suffix=".xml")
+        with os.fdopen(fd, "w") as f:
+            f.write(make_testdriver_xml(ndomains, nvolumes, npcidevs))
+        _TESTDRIVER_FILES[key] = path
+    return cli.getConnection("test://%s" % _TESTDRIVER_FILES[key])
+
+
+def cleanup():
+    for path in list(_TESTDRIVER_FILES.values()) + _TMPFILES:
+        os.unlink(path)
+    _TESTDRIVER_FILES.clear()
+    _TMPFILES.clear()
+
+
+def _scaled(count, scale):
+    return max(int(count * scale), 1)
+
+
+#########
+# Cases #
+#########
+
+
+def _guest_parse(ndevices):
+    from virtinst import Guest
+
+    conn = _open_testdriver(1, 1)
+    xml = make_guest_xml(ndevices)
+
+    def run():
+        return Guest(conn, parsexml=xml)
+
+    return run, {"devices": ndevices}
+
+
+def _guest_serialize(ndevices):
+    from virtinst import Guest
+
+    conn = _open_testdriver(1, 1)
+    guest = Guest(conn, parsexml=make_guest_xml(ndevices))
+
+    def run():
+        # Touch the XML so the serializer can't take any shortcuts
+        guest.name = guest.name
+        return guest.get_xml()
+
+    return run, {"devices": ndevices}
+
+
+@_benchmark("guest_parse_small", iterations=200)
+def _bench_guest_parse_small(scale):
+    ignore = scale
+    return _guest_parse(8)
+
+
+@_benchmark("guest_parse_large", iterations=10)
+def _bench_guest_parse_large(scale):
+    ignore = scale
+    return _guest_parse(500)
+
+
+@_benchmark("guest_serialize_small", iterations=200)
+def _bench_guest_serialize_small(scale):
+    ignore = scale
+    return _guest_serialize(8)
+
+
+@_benchmark("guest_serialize_large", iterations=10)
+def _bench_guest_serialize_large(scale):
+    ignore = scale
+    return _guest_serialize(500)
+
+
+@_benchmark("xmlbuilder_getset", iterations=20)
+def _bench_xmlbuilder_getset(scale):
+    from virtinst import Guest
+
+    ignore = scale
+    conn = _open_testdriver(1, 1)
+    guest = Guest(conn, parsexml=make_guest_xml(40))
+    disks = guest.devices.disk
+    loops = 100
+
+    def run():
+        for idx in range(loops):
+            guest.memory = guest.memory + 1
+            guest.vcpus = guest.vcpus
+            guest.description = "bench %d" % idx
+            for disk in disks:
+                disk.driver_cache = disk.driver_cache or "none"
+                ignore = disk.target
+                ignore = disk.get_source_path()
+
+    return run, {"loops": loops, "disks": len(disks)}
+
+
+@_benchmark("fetch_all_domains", iterations=3)
+def _bench_fetch_all_domains(scale):
+    ndomains = _scaled(2000, scale)
+    conn = _open_testdriver(ndomains, 1)
+
+    def run():
+        # Drop the connection's object cache so every run refetches
+        conn._fetch_cache = {}  # pylint: disable=protected-access
+        return conn.fetch_all_domains()
+
+    return run, {"domains": ndomains}
+
+
+@_benchmark("paths_in_use_by", iterations=5)
+def _bench_paths_in_use_by(scale):
+    from virtinst import DeviceDisk
+
+    ndomains = _scaled(2000, scale)
+    conn = _open_testdriver(ndomains, ndomains)
+    paths = ["/bench-pool/vol-%05d.qcow2" % idx for idx in range(0, ndomains, 40)]
+    # Prime the domain and volume caches, we only time the lookup
+    conn.fetch_all_domains()
+    conn.fetch_all_vols()
+
+    def run():
+        return DeviceDisk.paths_in_use_by(conn, paths)
+
+    return run, {"domains": ndomains, "volumes": ndomains, "paths": len(paths)}
+
+
+@_benchmark("cli_parse", iterations=20)
+def _bench_cli_parse(scale):
+    from virtinst import cli
+    from virtinst import Guest
+    from virtinst import virtinstall
+
+    ignore = scale
+    conn = _open_testdriver(1, 1)
+    argv = ["virt-install"] + shlex.split(
+        "--name bench --memory 2048,maxmemory=4096 "
+        "--vcpus 4,sockets=1,cores=2,threads=2 --cpu host-passthrough "
+        "--disk /bench-pool/vol-00000.qcow2,bus=virtio,cache=none "
+        "--disk /bench-pool/vol-00000.qcow2,device=cdrom,bus=sata "
+        "--network network=default,model=virtio --graphics vnc,listen=0.0.0.0 "
+        "--controller usb,model=qemu-xhci --rng /dev/urandom --boot hd,menu=on "
+        "--features acpi=on,apic=on --osinfo generic --import --print-xml"
+    )
+
+    def run():
+        origargv = sys.argv
+        sys.argv = argv
+        try:
+            options = virtinstall.parse_args()
+        finally:
+            sys.argv = origargv
+        guest = Guest(conn)
+        cli.run_all_parsers(options, guest)
+        return guest
+
+    return run, {"args": len(argv)}
+
+
+@_benchmark("osinfo_lookup", iterations=20)
+def _bench_osinfo_lookup(scale):
+    ignore = scale
+    try:
+        from virtinst import OSDB
+
+        OSDB.lookup_os("generic")
+    except Exception as e:
+        raise SkipBenchmark("libosinfo unavailable: %s" % e) from None
+
+    names = ["fedora-unknown", "rhel9.0", "win11", "ubuntu22.04", "debian12", "generic", "bogus"]
+
+    def run():
+        for name in names:
+            osobj = OSDB.lookup_os(name)
+            if osobj:
+                osobj.get_recommended_resources()
+
+    return run, {"lookups": len(names)}
+
+
+@_benchmark("volume_upload_stream", iterations=5)
+def _bench_volume_upload_stream(scale):
+    from virtinst import progress
+    from virtinst.install import volumeupload
+
+    # pylint: disable=protected-access
+    mib = _scaled(256, scale)
+    fd, path = tempfile.mkstemp(prefix="virtinst-bench-", suffix=".img")
+    _TMPFILES.append(path)
+    block = os.urandom(1024 * 1024)
+    with os.fdopen(fd, "wb") as f:
+        for dummy in range(mib):
+            f.write(block)
+    meter = progress.make_meter(quiet=True)
+
+    def run():
+        size = mib * 1024 * 1024
+        stream = volumeupload._MockStream()
+        meter.start("upload", size)
+        with open(path, "rb") as fileobj:
+            volumeupload._stream_file(
+                stream, fileobj, size, meter, volumeupload.DEFAULT_BLOCK_SIZE, False
+            )
+        meter.end()
+        return stream
+
+    return run, {"mib": mib, "block_size": volumeupload.DEFAULT_BLOCK_SIZE}
+
+
+def _open_vmm_connection(uri):
+    """
+    Open a vmmConnection with no display and no vmmEngine. Ticks that
+    would be scheduled through the engine run directly on the calling
+    thread, and we pump the GLib main context ourselves.
+    """
+    try:
+        from gi.repository import GLib
+
+        from virtinst import BuildConfig
+        from virtManager import config
+        from virtManager.connection import vmmConnection
+        from virtManager.lib.testmock import CLITestOptionsClass
+    except Exception as e:
+        raise SkipBenchmark("virtManager unavailable: %s" % e) from None
+
+    # pylint: disable=protected-access
+    if BuildConfig.running_from_srcdir:
+        from virtManager import virtmanager
+
+        virtmanager._setup_gsettings_path(BuildConfig.gsettings_dir)
+    os.environ["GSETTINGS_SCHEMA_DIR"] = BuildConfig.gsettings_dir
+    config.vmmConfig.get_instance(BuildConfig, CLITestOptionsClass(["first-run"]))
+
+    conn = vmmConnection(uri)
+    conn.schedule_priority_tick = lambda **kwargs: conn.tick_from_engine(**kwargs)
+    errors = []
+    conn.connect("open-completed", lambda src, err: errors.append(err))
+    conn.open()
+
+    context = GLib.MainContext.default()
+    timeout = time.monotonic() + 300
+    while not errors and time.monotonic() < timeout:
+        context.iteration(False)
+        time.sleep(0.001)
+    while context.pending():
+        context.iteration(False)
+    if not conn.is_active():
+        raise RuntimeError("Failed to open %s: %s" % (uri, errors))
+    return conn, context
+
+
+@_benchmark("vmmconnection_tick", iterations=5)
+def _bench_vmmconnection_tick(scale):
+    ndomains = _scaled(1000, scale)
+    # Opening the virtinst conn just writes out the test driver XML
+    uri = _open_testdriver(ndomains, ndomains).uri
+    conn, context = _open_vmm_connection(uri)
+
+    def run():
+        conn.tick_from_engine(
+            stats_update=True, pollvm=True, pollnet=True, pollpool=True, force=True
+        )
+        while context.pending():
+            context.iteration(False)
+
+    return run, {"domains": ndomains, "volumes": ndomains}
+
+
+@_benchmark("hostdev_picker_populate", iterations=5)
+def _bench_hostdev_picker_populate(scale):
+    npcidevs = _scaled(2000, scale)
+    uri = _open_testdriver(1, 1, npcidevs).uri
+    conn, ignore = _open_vmm_connection(uri)
+
+    def run():
+        # Include the cost of building the nodedev index, which happens
+        # the first time a dialog asks for it
+        conn._nodedev_index = None  # pylint: disable=protected-access
+
+        # The same lookups addhardware and createnet do to label rows
+        labels = []
+        for dev in conn.filter_nodedevs("pci"):
+            for subdev in conn.get_nodedev_children(dev.xmlobj.name, "net"):
+                labels.append("%s (%s)" % (dev.pretty_name(), subdev.pretty_name()))
+        for dev in conn.filter_nodedevs("mdev"):
+            parentdev = conn.get_nodedev_parent(dev)
+            labels.append("%s %s" % (parentdev.pretty_name(), dev.pretty_name()))
+        return labels
+
+    return run, {"nodedevs": npcidevs * 3}
+
+
+##########
+# Runner #
+##########
+
+
+def run_case(name, scale=1.0, iterations=None):
+    """
+    Run a single case, returning its results dict. Raises SkipBenchmark
+    if the case can't run here
+    """
+    setup, default_iterations = CASES[name]
+    iterations = iterations or default_iterations
+    func, params = setup(scale)
+
+    # Warm up caches and lazy imports
+    func()
+    samples = []
+    for dummy in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "iterations": iterations,
+        "params": params,
+        "ms_median": statistics.median(samples),
+        "ms_min": min(samples),
+        "ms_mean": statistics.mean(samples),
+    }
+
+
+def _git_commit():
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"], cwd=TOPDIR, stderr=subprocess.DEVNULL
+            )
+            .decode("utf-8")
+            .strip()
+        )
+    except Exception:
+        return None
+
+
+def build_results(results, skipped, scale, runner):
+    """
+    Wrap per case results with the info needed to compare runs. The
+    pytest runner enables test suite XML tracking, so its numbers are
+    only comparable with other pytest runs.
+    """
+    return {
+        "version": RESULTS_VERSION,
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "runner": runner,
+        "scale": scale,
+        "results": results,
+        "skipped": skipped,
+    }
+
+
+def measure(names, scale, iterations=None):
+    results = {}
+    skipped = {}
+    for name in names:
+        try:
+            results[name] = run_case(name, scale, iterations)
+        except SkipBenchmark as e:
+            skipped[name] = str(e)
+    return build_results(results, skipped, scale, "standalone")
+
+
+def compare(results, baseline, threshold):
+    """
+    Return a list of regression messages for cases whose median time
+    grew more than threshold percent over baseline. Cases run with
+    different parameters are not comparable and are skipped.
+    """
+    regressions = []
+    if baseline.get("runner") != results["runner"]:
+        return [
+            "baseline runner '%s' doesn't match '%s'" % (baseline.get("runner"), results["runner"])
+        ]
+    for name, data in results["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not old or old["params"] != data["params"]:
+            continue
+        oldms = old["ms_median"]
+        newms = data["ms_median"]
+        if oldms and (newms - oldms) / oldms * 100 > threshold:
+            regressions.append(
+                "%s: %.2fms -> %.2fms (+%.0f%%)"
+                % (name, oldms, newms, (newms - oldms) / oldms * 100)
+            )
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark virtinst and virt-manager hot paths")
+    parser.add_argument("cases", nargs="*", help="Cases to run, default all: %s" % ", ".join(CASES))
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for object counts")
+    parser.add_argument("--iterations", type=int, help="Override per case iteration count")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--baseline", help="JSON results from a previous run to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=20,
+        help="Allowed median regression over --baseline, in percent",
+    )
+    return parser.parse_args()
+
+
+def main():
+    options = parse_args()
+    names = options.cases or list(CASES)
+    for name in names:
+        if name not in CASES:
+            print("Unknown case '%s'" % name, file=sys.stderr)
+            return 1
+
+    try:
+        results = measure(names, options.scale, options.iterations)
+    finally:
+        cleanup()
+
+    for name, data in results["results"].items():
+        print(
+            "%-24s median=%9.2fms min=%9.2fms  %s"
+            % (name, data["ms_median"], data["ms_min"], data["params"])
+        )
+    for name, reason in results["skipped"].items():
+        print("%-24s skipped: %s" % (name, reason))
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    failures = []
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        failures += compare(results, baseline, options.threshold)
+
+    for msg in failures:
+        print("FAIL: %s" % msg, file=sys.stderr)
+    return bool(failures)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
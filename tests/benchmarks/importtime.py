@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+#
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+"""
+Measure the import time of the virtinst CLI entry points.
+
+Every sample is a fresh python process, so the numbers include the
+interpreter startup cost. That is constant across commits though, and
+it is what users actually pay.
+
+Example:
+
+    ./tests/benchmarks/importtime.py --output new.json
+    ./tests/benchmarks/importtime.py --baseline new.json --threshold 20
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+TOPDIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_TARGETS = [
+    "virtinst",
+    "virtinst.cli",
+    "virtinst.virtxml",
+    "virtinst.virtinstall",
+    "virtinst.virtclone",
+]
+
+# Modules that should not be pulled in just by importing the CLI tools
+LAZY_MODULES = [
+    "gi.repository.Libosinfo",
+    "requests",
+]
+
+_CHILD_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import %s
+end = time.perf_counter()
+print(json.dumps({"seconds": end - start,
+                  "loaded": [m for m in %r if m in sys.modules]}))
+"""
+
+
+def _sample(target):
+    script = _CHILD_SCRIPT % (target, LAZY_MODULES)
+    start = time.perf_counter()
+    out = subprocess.check_output([sys.executable, "-c", script], cwd=TOPDIR)
+    wall = time.perf_counter() - start
+    data = json.loads(out.decode("utf-8").splitlines()[-1])
+    data["wall"] = wall
+    return data
+
+
+def measure(targets, iterations):
+    results = {}
+    for target in targets:
+        samples = [_sample(target) for dummy in range(iterations)]
+        imports = [s["seconds"] * 1000 for s in samples]
+        walls = [s["wall"] * 1000 for s in samples]
+        results[target] = {
+            "import_ms_median": statistics.median(imports),
+            "import_ms_min": min(imports),
+            "wall_ms_median": statistics.median(walls),
+            "eager_modules": samples[-1]["loaded"],
+        }
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Return a list of regression messages for targets whose median
+    import time grew more than threshold percent over baseline
+    """
+    regressions = []
+    for target, data in results.items():
+        if target not in baseline:
+            continue
+        old = baseline[target]["import_ms_median"]
+        new = data["import_ms_median"]
+        if old and (new - old) / old * 100 > threshold:
+            regressions.append(
+                "%s: %.1fms -> %.1fms (+%.0f%%)" % (target, old, new, (new - old) / old * 100)
+            )
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark virtinst import time")
+    parser.add_argument("targets", nargs="*", default=DEFAULT_TARGETS, help="Modules to import")
+    parser.add_argument("--iterations", type=int, default=10, help="Samples per target")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--baseline", help="JSON results from a previous run to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=20,
+        help="Allowed median regression over --baseline, in percent",
+    )
+    parser.add_argument(
+        "--max-ms", type=float, help="Fail if any target's median import exceeds this"
+    )
+    return parser.parse_args()
+
+
+def main():
+    options = parse_args()
+    results = measure(options.targets, options.iterations)
+
+    failures = []
+    for target, data in results.items():
+        print(
+            "%-24s median=%7.1fms min=%7.1fms wall=%7.1fms"
+            % (target, data["import_ms_median"], data["import_ms_min"], data["wall_ms_median"])
+        )
+        if data["eager_modules"]:
+            failures.append("%s: eagerly imports %s" % (target, ", ".join(data["eager_modules"])))
+        if options.max_ms and data["import_ms_median"] > options.max_ms:
+            failures.append(
+                "%s: %.1fms exceeds --max-ms %.1fms"
+                % (target, data["import_ms_median"], options.max_ms)
+            )
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        failures += compare(results, baseline, options.threshold)
+
+    for msg in failures:
+        print("FAIL: %s" % msg, file=sys.stderr)
+    return bool(failures)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
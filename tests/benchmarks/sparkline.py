@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+#
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+"""
+Headless render benchmark for CellRendererSparkline.
+
+Simulates the manager window redrawing a list of VM rows with the
+stats graph columns, where the stats data only changes every
+--frames-per-tick redraws, like scrolling between stats ticks.
+Rendering goes to an offscreen cairo image surface, so no display
+is required beyond what importing Gtk needs.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+# pylint: disable=wrong-import-position
+import cairo
+import gi
+
+gi.require_version("Gdk", "3.0")
+gi.require_version("Gtk", "3.0")
+from gi.repository import Gdk
+
+from virtManager.lib.graphwidgets import CellRendererSparkline
+
+CELL_WIDTH = 120
+CELL_HEIGHT = 25
+GRAPH_LEN = 40
+
+
+def _make_rows(rows, columns):
+    def _graph():
+        return [random.random() for _ in range(GRAPH_LEN)]
+
+    return [[_graph() for _ in range(columns)] for _ in range(rows)]
+
+
+def _tick(data):
+    for row in data:
+        for graph in row:
+            graph.pop()
+            graph.insert(0, random.random())
+
+
+def run(rows, columns, frames, frames_per_tick, cached):
+    renderer = CellRendererSparkline()
+    renderer.set_property("xalign", 0)
+    if not cached:
+        renderer.CACHE_SIZE = 0
+
+    data = _make_rows(rows, columns)
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, CELL_WIDTH * columns, CELL_HEIGHT * rows)
+    cr = cairo.Context(surface)
+
+    start = time.perf_counter()
+    for frame in range(frames):
+        if frame and not frame % frames_per_tick:
+            _tick(data)
+
+        for rowidx, row in enumerate(data):
+            for colidx, graph in enumerate(row):
+                area = Gdk.Rectangle()
+                area.x = colidx * CELL_WIDTH
+                area.y = rowidx * CELL_HEIGHT
+                area.width = CELL_WIDTH
+                area.height = CELL_HEIGHT
+                renderer.set_property("data_array", graph)
+                renderer.do_render(cr, None, area, area, 0)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sparkline cell rendering")
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--columns", type=int, default=5)
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--frames-per-tick", type=int, default=10)
+    options = parser.parse_args()
+
+    random.seed(0)
+    results = {}
+    for cached in (False, True):
+        secs = run(options.rows, options.columns, options.frames, options.frames_per_tick, cached)
+        results[cached] = secs
+        print(
+            "%-9s %7.1fms total, %6.3fms per frame"
+            % (cached and "cached" or "uncached", secs * 1000, secs * 1000 / options.frames)
+        )
+    print("speedup: %.1fx" % (results[False] / results[True]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
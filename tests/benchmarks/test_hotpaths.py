@@ -0,0 +1,39 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import json
+
+import pytest
+
+from tests.benchmarks import hotpaths
+
+pytestmark = pytest.mark.benchmark
+
+_RESULTS = {}
+_SKIPPED = {}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def _write_results(request):
+    yield
+    hotpaths.cleanup()
+
+    output = request.config.getoption("--benchmark-output")
+    if not output:
+        return
+    results = hotpaths.build_results(
+        _RESULTS, _SKIPPED, request.config.getoption("--benchmark-scale"), "pytest"
+    )
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+@pytest.mark.parametrize("name", list(hotpaths.CASES))
+def test_benchmark(request, name):
+    scale = request.config.getoption("--benchmark-scale")
+    try:
+        _RESULTS[name] = hotpaths.run_case(name, scale)
+    except hotpaths.SkipBenchmark as e:
+        _SKIPPED[name] = str(e)
+        pytest.skip(str(e))
+    assert _RESULTS[name]["ms_median"] >= 0
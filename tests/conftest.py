@@ -17,6 +17,20 @@ def pytest_addoption(parser):
         "--regenerate-output", action="store_true", default=False, help="Regenerate test output"
     )
 
+    parser.addoption(
+        "--benchmarks",
+        action="store_true",
+        default=False,
+        help="Run the tests/benchmarks performance suite",
+    )
+    parser.addoption(
+        "--benchmark-scale",
+        type=float,
+        default=0.1,
+        help="Multiplier for benchmark object counts",
+    )
+    parser.addoption("--benchmark-output", help="Write benchmark JSON results to this file")
+
     # test_urls options
     parser.addoption(
         "--urls-skip-libosinfo",
@@ -68,6 +82,10 @@ def _impl_pytest_ignore_collect(collection_path, config):
     ):
         return True
 
+    benchmark_file = "tests/benchmarks" in str(collection_path)
+    if benchmark_file and not config.getoption("--benchmarks"):
+        return True
+
     uitest_file = "tests/uitests" in str(collection_path)
     if uitest_file and not uitests_requested:
         return True
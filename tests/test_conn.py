@@ -6,6 +6,7 @@ import os
 import pytest
 
 from virtinst import cli
+from virtinst import DeviceDisk
 from virtinst import pollhelpers
 from virtinst import StoragePool
 from virtinst import URI
@@ -94,3 +95,131 @@ def test_poll():
     poolobj1.undefine()
     poolobj2.destroy()
     poolobj2.undefine()
+
+
+def test_caps_cache(tmp_path, monkeypatch):
+    # Exercise the persistent capabilities cache
+    from virtinst import capscache
+
+    monkeypatch.setitem(os.environ, "XDG_CACHE_HOME", str(tmp_path))
+    cachedir = str(tmp_path / "virt-manager" / "capscache")
+
+    conn = cli.getConnection("test:///default", use_cache=False)
+    assert not os.path.exists(cachedir)
+    conn.close()
+
+    conn = cli.getConnection("test:///default", use_cache=True)
+    assert conn.support.conn_domain()
+    assert conn.support.domain_state(conn.lookupByName("test"))
+    key = capscache.build_cache_key(conn)
+    conn.close()
+
+    cache = capscache.CapsCache(cachedir, key)
+    assert "<capabilities>" in cache.get_caps()
+    assert cache.get_support("conn_domain") is True
+    # Checks against a specific object are not persisted
+    assert cache.get_support("domain_state") is None
+
+    # Cached values are used on the next open
+    cache.set_support("conn_domain", False)
+    cache.flush()
+    conn = cli.getConnection("test:///default", use_cache=True)
+    assert conn.support.conn_domain() is False
+    conn.invalidate_caps()
+    conn.close()
+    assert capscache.CapsCache(cachedir, key).get_caps() is None
+
+    # Any key change discards the cache
+    cache = capscache.CapsCache(cachedir, key)
+    cache.set_caps("<capabilities/>")
+    cache.set_domcaps(None, "x86_64", None, "kvm", "<domainCapabilities/>")
+    assert cache.get_domcaps(None, "x86_64", None, "kvm") == "<domainCapabilities/>"
+    assert cache.get_domcaps(None, "i686", None, "kvm") is None
+    assert capscache.CapsCache(cachedir, dict(key, hypervisor=1)).get_caps() is None
+
+    # So does touching a tracked emulator
+    emulator = tmp_path / "qemu-kvm"
+    emulator.write_text("foo")
+    cache = capscache.CapsCache(cachedir, key)
+    cache.set_caps("<capabilities/>")
+    cache.track_emulator(str(emulator))
+    cache.flush()
+    assert capscache.CapsCache(cachedir, key).get_caps() == "<capabilities/>"
+    stat = os.stat(str(emulator))
+    os.utime(str(emulator), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert capscache.CapsCache(cachedir, key).get_caps() is None
+
+    # Corrupt files are ignored
+    with open(cache.get_path(), "w") as f:
+        f.write("{")
+    assert capscache.CapsCache(cachedir, key).get_caps() is None
+
+    # Setters only change memory, the file is written once per flush
+    replaced = []
+    origreplace = os.replace
+    monkeypatch.setattr(
+        capscache.os, "replace", lambda *args: replaced.append(args) or origreplace(*args)
+    )
+    cache = capscache.CapsCache(cachedir, key)
+    cache.set_caps("<capabilities/>")
+    cache.set_support("conn_domain", True)
+    cache.set_domcaps(None, "x86_64", None, "kvm", "<domainCapabilities/>")
+    assert replaced == []
+    cache.flush()
+    cache.flush()
+    assert len(replaced) == 1
+
+    # A failed write doesn't leave the temporary file behind
+    def _fail(*args):
+        raise OSError("fake error")
+
+    monkeypatch.setattr(capscache.os, "replace", _fail)
+    cache.set_caps("<capabilities></capabilities>")
+    cache.flush()
+    assert os.listdir(cachedir) == [os.path.basename(cache.get_path())]
+
+
+def test_record_replay(tmp_path):
+    # Record test driver traffic to a fixture, then serve it offline
+    from virtinst import replayconn
+
+    fixture = str(tmp_path / "fixture.json.gz")
+    conn = cli.getConnection("__virtinst_test__test:///default,record=%s" % fixture)
+    origvms = [g.name for g in conn.fetch_all_domains()]
+    origvols = sorted(v.name for v in conn.fetch_all_vols())
+    origstats = conn.getAllDomainStats(0, 0)
+    assert conn.close() == 0
+    assert os.path.exists(fixture)
+
+    conn = cli.getConnection("__virtinst_test__test:///default,replay=%s,latency=1" % fixture)
+    assert [g.name for g in conn.fetch_all_domains()] == origvms
+    assert sorted(v.name for v in conn.fetch_all_vols()) == origvols
+    stats = conn.getAllDomainStats(0, 0)
+    assert [d.name() for d, dummy in stats] == [d.name() for d, dummy in origstats]
+    subset = conn.domainListGetStats([stats[0][0]], 0, 0)
+    assert [d.name() for d, dummy in subset] == [stats[0][0].name()]
+    # Anything not recorded is reported as unsupported
+    with pytest.raises(Exception) as e:
+        conn.getSysinfo(0)
+    assert conn.support.is_error_nosupport(e.value)
+    assert conn.close() == 0
+
+
+def test_synthetic_fixture(tmp_path):
+    from virtinst import replayconn
+
+    fixture = str(tmp_path / "synthetic.json.gz")
+    data = replayconn.generate_fixture(50, 40, nnodedevs=5)
+    replayconn.save_fixture(fixture, data)
+    assert replayconn.load_fixture(fixture) == data
+
+    uri = "__virtinst_test__test:///default,replay=%s,fakeuri=qemu:///system" % fixture
+    conn = cli.getConnection(uri)
+    assert conn.is_qemu()
+    assert len(conn.fetch_all_domains()) == 50
+    assert len(conn.fetch_all_vols()) == 40
+    assert len(conn.fetch_all_nodedevs()) == 5
+    assert conn.caps.guest_lookup().arch == "x86_64"
+    path = "/var/lib/libvirt/images/vol-00003.qcow2"
+    assert DeviceDisk.path_in_use_by(conn, path) == ["vm-00003"]
+    assert len(conn.getAllDomainStats(0, 0)) == 50
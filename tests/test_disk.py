@@ -3,7 +3,11 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import collections
+import errno
 import os
+import stat
+import struct
 import tempfile
 
 import pytest
@@ -108,7 +112,11 @@ def test_disk_dir_searchable(monkeypatch):
         assert not bool(errdict)
 
         # Mock setfacl to definitely fail
+        def _no_xattrs(*args, **kwargs):
+            raise OSError(errno.ENOTSUP, "fake no xattr support")
+
         with monkeypatch.context() as m:
+            m.setattr("virtinst.diskbackend._set_acl_xattr", _no_xattrs)
             m.setattr("virtinst.diskbackend.SETFACL", "getfacl")
             errdict = virtinst.DeviceDisk.fix_path_search(searchdata)
 
@@ -118,6 +126,108 @@ def test_disk_dir_searchable(monkeypatch):
         os.chmod(tmpdir, 0o777)
 
 
+def test_disk_dir_searchable_acl(monkeypatch):
+    # pylint: disable=protected-access
+    # Build a tree with ACLs set directly through the xattr, and check
+    # we parse and set them in process
+    from virtinst import diskbackend
+
+    # Don't share cached results with other tests
+    monkeypatch.setattr(diskbackend, "_searchable_cache", collections.OrderedDict())
+
+    xattr = "system.posix_acl_access"
+    uid = 54321
+    undefined = 0xFFFFFFFF
+
+    def _make_acl(userperm, maskperm):
+        entries = [
+            (0x01, 7, undefined),
+            (0x02, userperm, uid),
+            (0x04, 0, undefined),
+            (0x10, maskperm, undefined),
+            (0x20, 0, undefined),
+        ]
+        return struct.pack("<I", 2) + b"".join(struct.pack("<HHI", *e) for e in entries)
+
+    tmpobj = tempfile.TemporaryDirectory(prefix="virtinst-test-acl")
+    topdir = tmpobj.name
+    subdir = os.path.join(topdir, "sub")
+    path = os.path.join(subdir, "disk.img")
+    os.mkdir(subdir)
+    try:
+        try:
+            os.getxattr(topdir, xattr)
+        except OSError as e:
+            if e.errno != errno.ENODATA:
+                pytest.skip("No ACL xattr support: %s" % e)
+
+        os.chmod(topdir, 0o700)
+        os.chmod(subdir, 0o700)
+        assert diskbackend.is_path_searchable(path, uid, "fakeuser") == [subdir, topdir]
+
+        # Named user entry with x, allowed by the mask
+        os.setxattr(topdir, xattr, _make_acl(1, 1))
+        assert diskbackend.is_path_searchable(path, uid, "fakeuser") == [subdir]
+
+        # The mask strips the x, so the entry isn't effective
+        os.setxattr(topdir, xattr, _make_acl(1, 0))
+        assert diskbackend.is_path_searchable(path, uid, "fakeuser") == [subdir, topdir]
+
+        # Dirs changed in the last couple seconds aren't cached, their
+        # ctime may not change on the next edit
+        getxattr_calls = []
+
+        def _getxattr(*args, **kwargs):
+            getxattr_calls.append(args[0])
+            return origgetxattr(*args, **kwargs)
+
+        origgetxattr = os.getxattr
+        monkeypatch.setattr(os, "getxattr", _getxattr)
+        assert diskbackend.is_path_searchable(path, uid, "fakeuser") == [subdir, topdir]
+        assert sorted(getxattr_calls) == [topdir, subdir]
+
+        # Otherwise results are cached until the dir ctime changes
+        monkeypatch.setattr(diskbackend, "_SEARCHABLE_RACY_NS", 0)
+        getxattr_calls.clear()
+        assert diskbackend.is_path_searchable(path, uid, "fakeuser") == [subdir, topdir]
+        assert diskbackend.is_path_searchable(path, uid, "fakeuser") == [subdir, topdir]
+        assert sorted(getxattr_calls) == [topdir, subdir]
+        getxattr_calls.clear()
+
+        # The cache is bounded
+        monkeypatch.setattr(diskbackend, "_SEARCHABLE_CACHE_SIZE", 1)
+        diskbackend._searchable_cache.clear()
+        assert diskbackend.is_path_searchable(path, uid, "fakeuser") == [subdir, topdir]
+        assert len(diskbackend._searchable_cache) == 1
+        getxattr_calls.clear()
+
+        # Fixing goes through the xattr too. setfacl will fail, and
+        # that would fall back to chmod o+x
+        class _FakePw:
+            pw_uid = uid
+
+        monkeypatch.setattr(diskbackend.pwd, "getpwnam", lambda name: _FakePw)
+        monkeypatch.setattr(diskbackend, "SETFACL", "/bin/false")
+        assert diskbackend.set_dirs_searchable([subdir, topdir], "fakeuser") == {}
+        assert diskbackend.is_path_searchable(path, uid, "fakeuser") == []
+        assert sorted(getxattr_calls) == [topdir, topdir, subdir, subdir]
+        assert not os.stat(subdir).st_mode & stat.S_IXOTH
+
+        entries = diskbackend._parse_acl(origgetxattr(subdir, xattr))
+        assert entries == [
+            (0x01, 7, undefined),
+            (0x02, 1, uid),
+            (0x04, 0, undefined),
+            (0x10, 1, undefined),
+            (0x20, 0, undefined),
+        ]
+        entries = diskbackend._parse_acl(origgetxattr(topdir, xattr))
+        assert (0x02, 1, uid) in entries
+        assert (0x10, 1, undefined) in entries
+    finally:
+        tmpobj.cleanup()
+
+
 def test_disk_path_in_use_kernel():
     # Extra tests for DeviceDisk.path_in_use
     conn = utils.URIs.open_kvm()
@@ -0,0 +1,82 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import os
+import types
+
+from virtManager.lib import inspection
+from virtManager.object.domain import vmmInspectionApplication, vmmInspectionData
+
+
+class _FakeDisk:
+    def __init__(self, path):
+        self._path = path
+
+    def get_source_path(self):
+        return self._path
+
+
+class _FakeVM:
+    def __init__(self, cachedir, paths):
+        self._cachedir = cachedir
+        disks = [_FakeDisk(p) for p in paths]
+        self.xmlobj = types.SimpleNamespace(devices=types.SimpleNamespace(disk=disks))
+
+    def get_cache_dir(self):
+        return self._cachedir
+
+
+def _make_data():
+    data = vmmInspectionData()
+    data.os_type = "linux"
+    data.distro = "fedora"
+    data.major_version = 40
+    data.minor_version = 0
+    data.hostname = "test_hostname"
+    data.icon = b"\x89PNG\x00\xff"
+    app = vmmInspectionApplication()
+    app.name = "test_app"
+    app.version = "1.0"
+    data.applications = [app]
+    return data
+
+
+def test_inspection_disk_cache(tmp_path):
+    # pylint: disable=protected-access
+    diskpath = str(tmp_path / "disk.img")
+    with open(diskpath, "wb") as f:
+        f.write(b"\0" * 1024)
+    cachedir = str(tmp_path / "cache")
+    os.mkdir(cachedir)
+    # Disks without a source path are skipped
+    vm = _FakeVM(cachedir, [diskpath, None])
+
+    diskkey = inspection._get_disk_key(vm)
+    st = os.stat(diskpath)
+    assert diskkey == [[diskpath, 1024, st.st_mtime_ns, st.st_ino]]
+    assert inspection._load_cached_data(vm, diskkey) is None
+
+    inspection._save_cached_data(vm, diskkey, _make_data())
+    assert os.listdir(cachedir) == ["inspection.json"]
+
+    # JSON round trip, like a fresh app startup
+    diskkey = inspection._get_disk_key(vm)
+    data = inspection._load_cached_data(vm, diskkey)
+    assert data.distro == "fedora"
+    assert data.major_version == 40
+    assert data.icon == b"\x89PNG\x00\xff"
+    assert data.errorstr is None
+    assert len(data.applications) == 1
+    assert data.applications[0].name == "test_app"
+    assert data.applications[0].version == "1.0"
+
+    # Disk contents changed, so the cache is ignored
+    with open(diskpath, "ab") as f:
+        f.write(b"\0" * 1024)
+    newkey = inspection._get_disk_key(vm)
+    assert newkey != diskkey
+    assert inspection._load_cached_data(vm, newkey) is None
+
+    # Missing disk means we can't trust any cache
+    os.unlink(diskpath)
+    assert inspection._get_disk_key(vm) is None
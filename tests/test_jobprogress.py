@@ -0,0 +1,229 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import threading
+import time
+import types
+
+from virtManager.lib.jobprogress import JobProgress, JobProgressRegistry, jobinfo_to_stats
+
+from tests import utils
+
+
+class _FakeMeter:
+    def __init__(self):
+        self.text = None
+        self.size = None
+        self.updates = []
+        self.details = []
+
+    def is_started(self):
+        return self.size is not None
+
+    def start(self, text, size):
+        self.text = text
+        self.size = size
+
+    def update(self, new_total):
+        self.updates.append(new_total)
+
+    def set_details(self, details):
+        self.details.append(details)
+
+
+class _FakeDomain:
+    """
+    Stands in for vmmDomain during a migration: job stats are changed
+    by the test, and each change is announced with a synthetic
+    migration iteration event, like libvirt would send
+    """
+
+    def __init__(self):
+        self.stats = {"data_total": 0}
+        self.progress = None
+        self.lock = threading.Lock()
+
+    def job_stats(self):
+        with self.lock:
+            return self.stats.copy()
+
+    def iterate(self, iteration, remaining, dirty_rate):
+        with self.lock:
+            self.stats = {
+                "data_total": 1000 * 1024 * 1024,
+                "data_remaining": remaining * 1024 * 1024,
+                "memory_iteration": iteration,
+                "memory_dirty_rate": dirty_rate,
+                "memory_page_size": 4096,
+            }
+        self.progress.job_event(completed=False)
+
+    def complete(self):
+        self.progress.job_event(completed=True)
+
+
+def testJobInfoToStats():
+    stats = jobinfo_to_stats([2, 100, None, 4096, 1024, 3072, 0, 0, 0, 0, 0, 0])
+    assert stats["type"] == 2
+    assert stats["data_total"] == 4096
+    assert stats["data_remaining"] == 3072
+    assert "time_remaining" not in stats
+
+
+def testJobProgressEvents():
+    dom = _FakeDomain()
+    meter = _FakeMeter()
+    dom.progress = JobProgress(
+        dom.job_stats, meter, "Migrating", use_events=True, event_max_interval=30
+    )
+    dom.progress.start()
+
+    # Nothing is reported until the job has started, and the slow
+    # backstop poll doesn't hit during the test
+    time.sleep(0.1)
+    assert not meter.is_started()
+
+    dom.iterate(1, 600, 0)
+    utils.wait_for(lambda: len(meter.updates) == 1)
+    assert meter.text == "Migrating"
+    assert meter.size == 1000 * 1024 * 1024
+    assert meter.updates == [400 * 1024 * 1024]
+    assert meter.details[-1] == "600 MB left"
+
+    dom.iterate(2, 100, 2560)
+    utils.wait_for(lambda: len(meter.updates) == 2)
+    assert meter.updates[-1] == 900 * 1024 * 1024
+    assert meter.details[-1] == "100 MB left, dirtying 10 MB/s"
+
+    # A completed event ends reporting without another stats fetch
+    fetches = dom.progress.fetch_count
+    dom.complete()
+    dom.progress.join(5)
+    assert not dom.progress._thread.is_alive()  # pylint: disable=protected-access
+    assert dom.progress.fetch_count == fetches
+
+
+def testJobProgressPollBackoff():
+    dom = _FakeDomain()
+    meter = _FakeMeter()
+    progress = JobProgress(dom.job_stats, meter, "Saving", min_interval=0.02, max_interval=0.16)
+    fetches = []
+
+    def _get_stats():
+        stats = dom.job_stats()
+        fetches.append((time.monotonic(), stats))
+        return stats
+
+    progress._get_stats = _get_stats  # pylint: disable=protected-access
+    progress.start()
+
+    # Stats aren't changing, so the interval doubles up to max_interval
+    utils.wait_for(lambda: len(fetches) >= 6)
+    gaps = [b[0] - a[0] for a, b in zip(fetches, fetches[1:])]
+    assert gaps[0] < 0.1
+    assert all(gap >= 0.15 for gap in gaps[3:])
+
+    # A change drops back to the fast rate
+    with dom.lock:
+        dom.stats = {"data_total": 100, "data_remaining": 40}
+    utils.wait_for(lambda: meter.updates)
+    utils.wait_for(lambda: fetches[-1][1]["data_total"] and fetches[-2][1]["data_total"])
+    idx = [stats["data_total"] for dummy, stats in fetches].index(100)
+    assert fetches[idx + 1][0] - fetches[idx][0] < 0.1
+
+    progress.stop()
+    progress.join(5)
+    assert meter.updates[-1] == 60
+
+
+def testJobProgressEventBackoff():
+    # With events, stats changing on every poll don't reset the backoff
+    # of the backstop poll, only events do
+    remaining = [1000]
+    fetches = []
+
+    def _get_stats():
+        fetches.append(time.monotonic())
+        remaining[0] -= 1
+        return {"data_total": 1000, "data_remaining": remaining[0]}
+
+    progress = JobProgress(
+        _get_stats, None, "Migrating", use_events=True, min_interval=0.02, event_max_interval=0.16
+    )
+    progress.start()
+    utils.wait_for(lambda: len(fetches) >= 6)
+    gaps = [b - a for a, b in zip(fetches, fetches[1:])]
+    assert all(gap >= 0.15 for gap in gaps[3:5])
+
+    count = len(fetches)
+    progress.job_event(completed=False)
+    utils.wait_for(lambda: len(fetches) >= count + 2)
+    assert fetches[count + 1] - fetches[count] < 0.1
+    progress.stop()
+    progress.join(5)
+
+
+def testJobProgressConnectionEvents():
+    # Migration runs on a temporary vmmDomain that the connection doesn't
+    # track, events reach its reporter through the registry by UUID
+    from virtManager.connection import vmmConnection
+
+    class _FakeBackend:
+        def name(self):
+            return "test-migrate"
+
+        def UUIDString(self):
+            return "00000000-1111-2222-3333-444444444444"
+
+    backend = _FakeBackend()
+    conn = types.SimpleNamespace(job_progress=JobProgressRegistry())
+    dom = _FakeDomain()
+    meter = _FakeMeter()
+    dom.progress = JobProgress(dom.job_stats, meter, "Migrating", use_events=True)
+    conn.job_progress.register(backend.UUIDString(), dom.progress)
+    dom.progress.start()
+
+    def _event(eventstr):
+        # pylint: disable=protected-access
+        vmmConnection._domain_job_event(conn, None, backend, 1, eventstr)
+
+    with dom.lock:
+        dom.stats = {"data_total": 1000, "data_remaining": 250}
+    _event("VIR_DOMAIN_EVENT_ID_MIGRATION_ITERATION")
+    utils.wait_for(lambda: meter.updates == [750])
+
+    # Unregistering some other reporter leaves this one in place
+    other = JobProgress(dom.job_stats, None, "Migrating", use_events=True)
+    conn.job_progress.unregister(backend.UUIDString(), other)
+    _event("VIR_DOMAIN_EVENT_ID_JOB_COMPLETED")
+    dom.progress.join(5)
+    assert not dom.progress._thread.is_alive()  # pylint: disable=protected-access
+    conn.job_progress.unregister(backend.UUIDString(), dom.progress)
+
+
+def testJobProgressIterationCallback():
+    dom = _FakeDomain()
+    iterations = []
+
+    def _iteration_cb(iteration):
+        iterations.append(iteration)
+        return iteration >= 2
+
+    # Without a meter, stats are only watched for the callback
+    dom.progress = JobProgress(
+        dom.job_stats, None, "Migrating", use_events=True, iteration_cb=_iteration_cb
+    )
+    dom.progress.start()
+
+    dom.iterate(1, 600, 0)
+    utils.wait_for(lambda: iterations == [1])
+    dom.iterate(1, 500, 0)
+    dom.iterate(2, 300, 0)
+    utils.wait_for(lambda: iterations == [1, 2])
+
+    # The callback returned True, so it isn't called again
+    dom.iterate(3, 100, 0)
+    utils.wait_for(lambda: dom.progress.fetch_count >= 4)
+    dom.complete()
+    dom.progress.join(5)
+    assert iterations == [1, 2]
@@ -0,0 +1,194 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import socket
+
+import pytest
+
+from virtManager.lib import metricsexporter
+
+
+class _FakeStatsList:
+    def __init__(self, records):
+        self._records = records
+
+    def get_record(self, name):
+        return self._records.get(name, 0)
+
+
+class _FakeVM:
+    def __init__(self, name, active, records):
+        self.name = name
+        self.active = active
+        self.statslist = _FakeStatsList(records)
+
+    def get_name(self):
+        return self.name
+
+    def get_uuid(self):
+        return "00000000-1111-2222-3333-%012d" % len(self.name)
+
+    def is_active(self):
+        return self.active
+
+
+class _FakeStatsManager:
+    def get_vm_statslist(self, vm):
+        return vm.statslist
+
+
+class _FakeConn:
+    def __init__(self, uri, active, vms, hoststats):
+        self.uri = uri
+        self.active = active
+        self.vms = vms
+        self.hoststats = hoststats
+        self.statsmanager = _FakeStatsManager()
+        self.tick_histogram = metricsexporter.TickHistogram(buckets=[0.1, 1])
+
+    def get_uri(self):
+        return self.uri
+
+    def is_active(self):
+        return self.active
+
+    def list_vms(self):
+        return self.vms
+
+    def get_stats_record(self, name):
+        return self.hoststats.get(name, 0)
+
+
+def _make_conns():
+    vm1 = _FakeVM("vm1", True, {"cpuHostPercent": 12.5, "diskRdKiB": 2, "cpuTimeAbs": 3e9})
+    vm2 = _FakeVM('odd"name', False, {})
+    conn = _FakeConn("test:///default", True, [vm1, vm2], {"memoryPercent": 40})
+    conn.tick_histogram.observe(0.05)
+    conn.tick_histogram.observe(0.5)
+    conn.tick_histogram.observe(5)
+    closed = _FakeConn("qemu:///system", False, [], {})
+    return [conn, closed]
+
+
+def test_metrics_format():
+    out = metricsexporter.format_metrics(_make_conns())
+    lines = out.splitlines()
+
+    assert "# TYPE virt_manager_domain_cpu_host_percent gauge" in lines
+    assert "# TYPE virt_manager_domain_cpu_time_seconds_total counter" in lines
+    assert 'virt_manager_connection_up{uri="test:///default"} 1.0' in lines
+    assert 'virt_manager_connection_up{uri="qemu:///system"} 0.0' in lines
+    assert 'virt_manager_host_memory_used_percent{uri="test:///default"} 40.0' in lines
+
+    vm1labels = 'uri="test:///default",domain="vm1",uuid="00000000-1111-2222-3333-000000000003"'
+    assert "virt_manager_domain_cpu_host_percent{%s} 12.5" % vm1labels in lines
+    assert "virt_manager_domain_cpu_time_seconds_total{%s} 3.0" % vm1labels in lines
+    assert "virt_manager_domain_disk_read_bytes_total{%s} 2048.0" % vm1labels in lines
+    assert 'domain="odd\\"name"' in out
+
+    tickname = "virt_manager_connection_tick_duration_seconds"
+    assert '%s_bucket{uri="test:///default",le="0.1"} 1.0' % tickname in lines
+    assert '%s_bucket{uri="test:///default",le="1.0"} 2.0' % tickname in lines
+    assert '%s_bucket{uri="test:///default",le="+Inf"} 3.0' % tickname in lines
+    assert '%s_sum{uri="test:///default"} 5.55' % tickname in lines
+    assert '%s_count{uri="qemu:///system"} 0.0' % tickname in lines
+    # Closed connections only report up and tick data
+    assert 'host_cpu_percent{uri="qemu:///system"}' not in out
+
+
+def test_metrics_listen_address():
+    parse = metricsexporter.parse_listen_address
+    assert parse("9177") == ("tcp", ("127.0.0.1", 9177))
+    assert parse("localhost:9177") == ("tcp", ("localhost", 9177))
+    assert parse("[::1]:9177") == ("tcp", ("::1", 9177))
+    assert parse("unix:/tmp/foo.sock") == ("unix", "/tmp/foo.sock")
+    with pytest.raises(ValueError, match="only be exported on localhost"):
+        parse("0.0.0.0:9177")
+
+
+def test_metrics_server(tmp_path):
+    path = str(tmp_path / "metrics.sock")
+    conns = _make_conns()
+    calls = []
+
+    def _get_conns():
+        calls.append(1)
+        return conns
+
+    exporter = metricsexporter.MetricsExporter("unix:" + path, _get_conns)
+    exporter.start()
+
+    def _get(urlpath):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(path)
+        sock.sendall(b"GET %s HTTP/1.0\r\n\r\n" % urlpath)
+        data = b""
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+        sock.close()
+        return data.decode("utf-8")
+
+    try:
+        out = _get(b"/metrics")
+        assert out.startswith("HTTP/1.0 200")
+        assert metricsexporter.CONTENT_TYPE in out
+        assert "virt_manager_connection_up" in out
+        assert _get(b"/idontexist").startswith("HTTP/1.0 404")
+
+        # Requests serve the last snapshot, only refresh() reads the
+        # connections
+        conns[1].active = True
+        assert 'connection_up{uri="qemu:///system"} 0.0' in _get(b"/metrics")
+        assert len(calls) == 1
+        exporter.refresh()
+        assert 'connection_up{uri="qemu:///system"} 1.0' in _get(b"/metrics")
+        assert len(calls) == 2
+    finally:
+        exporter.stop()
+    assert not (tmp_path / "metrics.sock").exists()
+
+
+def test_metrics_server_socket_path(tmp_path):
+    # A regular file at the socket path is never deleted
+    path = tmp_path / "metrics.sock"
+    path.write_text("precious")
+    exporter = metricsexporter.MetricsExporter("unix:%s" % path, _make_conns)
+    with pytest.raises(ValueError, match="is not a socket"):
+        exporter.start()
+    assert path.read_text() == "precious"
+
+    # A stale socket is replaced, and stop() leaves alone a socket
+    # that isn't the one it created
+    path.unlink()
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(str(path))
+    stale.close()
+    exporter.start()
+    exporter2 = metricsexporter.MetricsExporter("unix:%s" % path, _make_conns)
+    exporter2.start()
+    exporter.stop()
+    assert path.exists()
+    exporter2.stop()
+    assert not path.exists()
+
+
+def test_metrics_server_ipv6():
+    if not socket.has_ipv6:  # pragma: no cover
+        pytest.skip("No IPv6 support")
+    exporter = metricsexporter.MetricsExporter("[::1]:0", _make_conns)
+    try:
+        exporter.start()
+    except OSError as e:  # pragma: no cover
+        pytest.skip("Can't bind to ::1: %s" % e)
+
+    try:
+        port = exporter.get_server_address()[1]
+        sock = socket.create_connection(("::1", port))
+        sock.sendall(b"GET /metrics HTTP/1.0\r\n\r\n")
+        assert sock.recv(65536).startswith(b"HTTP/1.0 200")
+        sock.close()
+    finally:
+        exporter.stop()
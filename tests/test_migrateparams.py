@@ -0,0 +1,123 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import libvirt
+import pytest
+
+from virtManager.lib.migrateparams import MigrateTuning, build_migrate_args
+
+
+class _FakeSupport:
+    """
+    Stand-in for SupportCache, with every migration check passing
+    unless listed in unsupported
+    """
+
+    def __init__(self, unsupported=None):
+        self._unsupported = unsupported or []
+
+    def __getattr__(self, name):
+        return lambda: name not in self._unsupported
+
+
+_BASE_FLAGS = (
+    libvirt.VIR_MIGRATE_LIVE
+    | libvirt.VIR_MIGRATE_PERSIST_DEST
+    | libvirt.VIR_MIGRATE_UNDEFINE_SOURCE
+)
+
+
+def testMigrateArgsBasic():
+    flags, params = build_migrate_args(_FakeSupport(), dest_uri="tcp:example.com:49152")
+    assert flags == _BASE_FLAGS
+    assert params == {libvirt.VIR_MIGRATE_PARAM_URI: "tcp:example.com:49152"}
+
+    flags, params = build_migrate_args(
+        _FakeSupport(),
+        dest_uri="qemu+ssh://example.com/system",
+        tunnel=True,
+        unsafe=True,
+        temporary=True,
+        xml="<domain/>",
+        bandwidth=100,
+    )
+    assert flags == (
+        libvirt.VIR_MIGRATE_LIVE
+        | libvirt.VIR_MIGRATE_PEER2PEER
+        | libvirt.VIR_MIGRATE_TUNNELLED
+        | libvirt.VIR_MIGRATE_UNSAFE
+    )
+    assert params == {
+        libvirt.VIR_MIGRATE_PARAM_DEST_XML: "<domain/>",
+        libvirt.VIR_MIGRATE_PARAM_BANDWIDTH: 100,
+    }
+
+    # Default tuning doesn't change anything
+    assert build_migrate_args(_FakeSupport(), tuning=MigrateTuning()) == (_BASE_FLAGS, {})
+
+
+def testMigrateArgsTuning():
+    tuning = MigrateTuning(
+        parallel_connections=4,
+        compression="zstd",
+        compression_level=3,
+        auto_converge=True,
+        postcopy=True,
+    )
+    flags, params = build_migrate_args(_FakeSupport(), tuning=tuning)
+    assert flags == (
+        _BASE_FLAGS
+        | libvirt.VIR_MIGRATE_PARALLEL
+        | libvirt.VIR_MIGRATE_COMPRESSED
+        | libvirt.VIR_MIGRATE_AUTO_CONVERGE
+        | libvirt.VIR_MIGRATE_POSTCOPY
+    )
+    assert params == {
+        "parallel.connections": 4,
+        "compression": "zstd",
+        "compression.zstd.level": 3,
+    }
+
+    # mt takes a level, xbzrle doesn't
+    tuning = MigrateTuning(compression="mt", compression_level=5)
+    flags, params = build_migrate_args(_FakeSupport(), tuning=tuning)
+    assert flags == _BASE_FLAGS | libvirt.VIR_MIGRATE_COMPRESSED
+    assert params == {"compression": "mt", "compression.mt.level": 5}
+
+    tuning = MigrateTuning(compression="xbzrle", compression_level=5)
+    flags, params = build_migrate_args(_FakeSupport(), tuning=tuning)
+    assert params == {"compression": "xbzrle"}
+
+
+def testMigrateArgsGating():
+    def _check_err(msg, tuning, unsupported=None):
+        with pytest.raises(ValueError, match=msg):
+            build_migrate_args(_FakeSupport(unsupported), tuning=tuning)
+
+    _check_err(
+        "Parallel migration",
+        MigrateTuning(parallel_connections=2),
+        ["domain_migrate_parallel"],
+    )
+    _check_err(
+        "compression is not supported",
+        MigrateTuning(compression="mt"),
+        ["domain_migrate_compression"],
+    )
+    _check_err(
+        "'zlib' is not supported",
+        MigrateTuning(parallel_connections=2, compression="zlib"),
+        ["domain_migrate_multifd_compression"],
+    )
+    _check_err("requires parallel", MigrateTuning(compression="zlib"))
+    _check_err("Unknown migration compression", MigrateTuning(compression="lzo"))
+    _check_err(
+        "auto-converge",
+        MigrateTuning(auto_converge=True),
+        ["domain_migrate_auto_converge"],
+    )
+    _check_err(
+        "Post-copy",
+        MigrateTuning(postcopy=True),
+        ["domain_migrate_postcopy"],
+    )
@@ -0,0 +1,212 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import threading
+import time
+
+from virtManager.lib.migratequeue import MigrationQueue, MigrationResult
+
+from tests import utils
+
+
+class _StubMigrate:
+    """
+    Stand-in for the migrate callable. Each migration reports half
+    progress, then blocks until the test releases it
+    """
+
+    def __init__(self, fail=None):
+        self.fail = fail or []
+        self.started = []
+        self.aborted = []
+        self.running = 0
+        self.max_running = 0
+        self.release = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, key, meter):
+        with self.lock:
+            self.started.append(key)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            event = self.release.setdefault(key, threading.Event())
+
+        meter.start("Migrating", 1000)
+        meter.update(500)
+        event.wait(5)
+
+        with self.lock:
+            self.running -= 1
+        if key in self.fail or key in self.aborted:
+            raise RuntimeError("migration of %s failed" % key)
+        meter.update(1000)
+
+    def abort(self, key):
+        self.aborted.append(key)
+        self.release_key(key)
+
+    def release_key(self, key):
+        with self.lock:
+            event = self.release.setdefault(key, threading.Event())
+        event.set()
+
+
+def _run_in_thread(queue):
+    ret = {}
+
+    def _run():
+        ret["results"] = queue.run()
+
+    thread = threading.Thread(target=_run)
+    thread.start()
+    return thread, ret
+
+
+def testMigrationQueueConcurrency():
+    stub = _StubMigrate(fail=["vm2"])
+    keys = ["vm%d" % idx for idx in range(5)]
+    queue = MigrationQueue(keys, stub, concurrency=2)
+    thread, ret = _run_in_thread(queue)
+
+    # Only two migrations are in flight, started in order
+    utils.wait_for(lambda: len(stub.started) == 2)
+    time.sleep(0.1)
+    assert stub.started == ["vm0", "vm1"]
+
+    # Releasing one lets the next pending migration start, and a
+    # failure doesn't stop the rest of the batch
+    for key in keys:
+        stub.release_key(key)
+    thread.join(5)
+
+    assert stub.started == keys
+    assert stub.max_running == 2
+    results = ret["results"]
+    assert [r.key for r in results] == keys
+    assert [r.status for r in results] == [
+        MigrationResult.DONE,
+        MigrationResult.DONE,
+        MigrationResult.FAILED,
+        MigrationResult.DONE,
+        MigrationResult.DONE,
+    ]
+    assert results[2].error == "migration of vm2 failed"
+    assert "RuntimeError" in results[2].details
+    assert queue.get_progress() == (1, 5, 1)
+
+
+def testMigrationQueueProgress():
+    stub = _StubMigrate()
+    updates = []
+    queue = MigrationQueue(
+        ["big", "small"],
+        stub,
+        concurrency=1,
+        weights={"big": 3000, "small": 1000},
+        progress_cb=lambda q: updates.append(q.get_progress()),
+    )
+    thread, dummy = _run_in_thread(queue)
+
+    # Progress is weighted by the passed sizes
+    utils.wait_for(lambda: stub.started == ["big"])
+    utils.wait_for(lambda: queue.get_progress()[0] == 0.375)
+    stub.release_key("big")
+    utils.wait_for(lambda: stub.started == ["big", "small"])
+    utils.wait_for(lambda: queue.get_progress()[0] == 0.875)
+    assert queue.get_progress()[1:] == (1, 0)
+    stub.release_key("small")
+    thread.join(5)
+
+    assert updates[-1] == (1, 2, 0)
+    fractions = [update[0] for update in updates]
+    assert fractions == sorted(fractions)
+
+
+def testMigrationQueueCancel():
+    stub = _StubMigrate()
+    keys = ["vm1", "vm2", "vm3"]
+    queue = MigrationQueue(keys, stub, concurrency=1, abort_cb=stub.abort)
+    thread, ret = _run_in_thread(queue)
+
+    # Cancel aborts the running migration and drops the pending ones
+    utils.wait_for(lambda: stub.started == ["vm1"])
+    queue.cancel()
+    thread.join(5)
+
+    assert stub.aborted == ["vm1"]
+    assert stub.started == ["vm1"]
+    assert [r.status for r in ret["results"]] == [MigrationResult.CANCELED] * 3
+
+
+def testMigrationQueueCancelBeforeStart():
+    # Canceling after a key was taken off the pending list, but before
+    # its migration was called, doesn't start it
+    stub = _StubMigrate()
+    queue = MigrationQueue(["vm1", "vm2"], stub, abort_cb=stub.abort)
+
+    def _progress_cb(q):
+        if q.get_results()[0].status == MigrationResult.RUNNING and not stub.aborted:
+            q.cancel()
+
+    queue.progress_cb = _progress_cb
+    results = queue.run()
+    assert stub.started == []
+    assert [r.status for r in results] == [MigrationResult.CANCELED] * 2
+
+
+def testMigrationQueueCancelReabort():
+    # If the abort came before the migration job started, it's retried
+    # once the job reports progress
+    aborts = []
+    jobs = {}
+
+    def _abort(key):
+        aborts.append(key)
+        if key not in jobs:
+            raise RuntimeError("no job active")
+        jobs[key].set()
+
+    def _migrate(key, meter):
+        queue.cancel()
+        jobs[key] = threading.Event()
+        meter.start("Migrating", 1000)
+        meter.update(100)
+        assert jobs[key].wait(5)
+        raise RuntimeError("migration job aborted")
+
+    queue = MigrationQueue(["vm1"], _migrate, abort_cb=_abort)
+    results = queue.run()
+    assert aborts == ["vm1", "vm1"]
+    assert results[0].status == MigrationResult.CANCELED
+
+
+def testMigrationQueueCancelRetryAbort(monkeypatch):
+    # A job that never reports progress is still aborted, by retrying
+    # abort_cb until it succeeds
+    monkeypatch.setattr(MigrationQueue, "_abort_retry_interval", 0.01)
+    aborts = []
+    jobs = {}
+
+    def _abort(key):
+        aborts.append(key)
+        if key not in jobs:
+            raise RuntimeError("no job active")
+        jobs[key].set()
+
+    def _migrate(key, meter):
+        ignore = meter
+        queue.cancel()
+        jobs[key] = threading.Event()
+        assert jobs[key].wait(5)
+        raise RuntimeError("migration job aborted")
+
+    queue = MigrationQueue(["vm1"], _migrate, abort_cb=_abort)
+    results = queue.run()
+    assert len(aborts) >= 2
+    assert set(aborts) == {"vm1"}
+    assert results[0].status == MigrationResult.CANCELED
+
+    # Retrying stops once the migration is finished
+    count = len(aborts)
+    time.sleep(0.1)
+    assert len(aborts) == count
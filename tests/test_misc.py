@@ -241,3 +241,41 @@ def test_misc_meter():
     # BaseMeter coverage
     meter = _progresspriv.BaseMeter()
     _test_meter_values(meter)
+
+
+def test_misc_lazy_imports():
+    """
+    Test the PEP 562 lazy attribute handling in virtinst/__init__.py
+    and the deferred VirtCLIParser class init
+    """
+    # pylint: disable=protected-access
+    for name in virtinst._LAZY_ATTRS:
+        assert getattr(virtinst, name)
+    assert virtinst.DeviceDisk is virtinst.devices.DeviceDisk
+    assert virtinst.DomainCpu is virtinst.domain.DomainCpu
+    assert "DeviceDisk" in dir(virtinst)
+    assert virtinst.progress.make_meter
+    with pytest.raises(AttributeError):
+        assert virtinst.DeviceIDontExist
+    with pytest.raises(AttributeError):
+        assert virtinst.idontexist
+
+    from virtinst import cli
+
+    initorder = []
+
+    class _ParserLazy(cli.VirtCLIParser):
+        cli_arg_name = "lazy"
+
+        @classmethod
+        def _virtcli_class_init(cls):
+            initorder.append(cls.cli_arg_name)
+
+    class _ParserLazyChild(_ParserLazy):
+        cli_arg_name = "lazychild"
+
+    assert initorder == []
+    _ParserLazyChild("")
+    _ParserLazyChild("")
+    _ParserLazy("")
+    assert initorder == ["lazy", "lazychild"]
@@ -215,3 +215,43 @@ def testNodeDevFail():
     # pass to a guest.
     with pytest.raises(ValueError):
         _testNode2DeviceCompare(conn, nodename, devfile)
+
+
+def testHostdevKeys():
+    conn = utils.URIs.open_testdriver_cached()
+
+    def _hostdev(xml):
+        return DeviceHostdev(conn, parsexml=xml)
+
+    pcidev = _nodeDevFromName(conn, "pci_8086_10fb")
+    pcikey = NodeDevice.get_hostdev_key(
+        _hostdev(
+            "<hostdev mode='subsystem' type='pci'><source><address domain='0x0000' "
+            "bus='0x81' slot='0x00' function='0x1'/></source></hostdev>"
+        )
+    )
+    assert pcikey in pcidev.get_hostdev_lookup_keys()
+    assert ("pci",) in pcidev.get_hostdev_lookup_keys()
+
+    # USB hostdevs without a bus/device address still key on vendor/product
+    usbdev = _nodeDevFromName(conn, "usb_device_781_5151_2004453082054CA1BEEE")
+    usbkey = NodeDevice.get_hostdev_key(
+        _hostdev(
+            "<hostdev mode='subsystem' type='usb'><source>"
+            "<vendor id='0x0781'/><product id='0x5151'/></source></hostdev>"
+        )
+    )
+    assert usbkey == ("usb", 0x781, 0x5151)
+    assert usbkey in usbdev.get_hostdev_lookup_keys()
+
+    mdevkey = NodeDevice.get_hostdev_key(
+        _hostdev(
+            "<hostdev mode='subsystem' type='mdev' model='vfio-ccw'><source>"
+            "<address uuid='8E37EE90-2B51-45E3-9B25-BF8283C03110'/></source></hostdev>"
+        )
+    )
+    mdev = _nodeDevFromName(conn, "mdev_8e37ee90_2b51_45e3_9b25_bf8283c03110")
+    assert mdevkey in mdev.get_hostdev_lookup_keys()
+
+    assert NodeDevice.get_hostdev_key(_hostdev("<hostdev mode='capabilities' type='net'/>")) is None
+    assert _nodeDevFromName(conn, "net_00_1c_25_10_b1_e4").get_hostdev_lookup_keys() == []
@@ -0,0 +1,98 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+from virtManager.lib.pollscheduler import PollScheduler
+
+
+def _run_ticks(sched, keys, ticks, idle=True):
+    """
+    Simulate ticks, return a dict of key -> number of samples taken
+    """
+    counts = dict.fromkeys(keys, 0)
+    for dummy in range(ticks):
+        sched.start_tick()
+        for key in keys:
+            if sched.is_due(key):
+                counts[key] += 1
+                sched.sampled(key, idle)
+    return counts
+
+
+def test_pollscheduler_backoff():
+    sched = PollScheduler(max_backoff=8, busy_max_backoff=2)
+
+    # Idle offscreen VMs back off 2, 4, 8, 8, ...
+    sched.start_tick()
+    assert sched.is_due("vm1")
+    sched.sampled("vm1", True)
+    assert sched.get_factor("vm1") == 2
+    assert not sched.is_due("vm1")
+    sched.start_tick()
+    assert not sched.is_due("vm1")
+    sched.start_tick()
+    assert sched.is_due("vm1")
+
+    counts = _run_ticks(PollScheduler(max_backoff=8), ["a", "b"], 100)
+    assert counts["a"] == counts["b"]
+    assert 12 <= counts["a"] <= 16
+
+    # Busy VMs are capped lower
+    counts = _run_ticks(PollScheduler(max_backoff=8, busy_max_backoff=2), ["a"], 100, idle=False)
+    assert 49 <= counts["a"] <= 51
+
+    # Activity after a long idle stretch drops to the busy cap
+    sched = PollScheduler(max_backoff=8, busy_max_backoff=2)
+    _run_ticks(sched, ["a"], 50)
+    assert sched.get_factor("a") == 8
+    sched.start_tick()
+    sched.sampled("a", False)
+    assert sched.get_factor("a") == 2
+
+
+def test_pollscheduler_visibility():
+    sched = PollScheduler(max_backoff=16)
+    keys = ["shown", "watched", "hidden"]
+    _run_ticks(sched, keys, 20)
+    assert sched.get_factor("hidden") == 16
+
+    # Visible rows and watched VMs are sampled on every tick. The
+    # manager reports visibility after every tick
+    sched.watch("watched")
+    counts = dict.fromkeys(keys, 0)
+    for dummy in range(20):
+        sched.start_tick()
+        for key in keys:
+            if sched.is_due(key):
+                counts[key] += 1
+                sched.sampled(key, True)
+        sched.set_visible(["shown"])
+    assert counts["shown"] >= 19
+    assert counts["watched"] == 20
+    assert counts["hidden"] <= 2
+
+    # Visibility expires when no longer reported
+    _run_ticks(sched, ["shown"], 3)
+    assert sched.get_factor("shown") > 1
+
+    # Watch is refcounted
+    sched.watch("watched")
+    sched.unwatch("watched")
+    assert sched.get_factor("watched") == 1
+    sched.unwatch("watched")
+    _run_ticks(sched, ["watched"], 10)
+    assert sched.get_factor("watched") > 1
+
+
+def test_pollscheduler_reset():
+    sched = PollScheduler(max_backoff=16)
+    _run_ticks(sched, ["vm1"], 40)
+    sched.start_tick()
+    assert not sched.is_due("vm1")
+
+    # Lifecycle event snaps back to full rate
+    sched.reset("vm1")
+    assert sched.is_due("vm1")
+    assert sched.get_factor("vm1") == 1
+
+    sched.forget("vm1")
+    assert sched.get_factor("vm1") == 1
@@ -0,0 +1,140 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+from virtManager.details import sshtunnels
+
+from tests import utils
+
+# pylint: disable=protected-access
+
+
+# Stand-in for 'ssh' that logs each invocation. If nothing is listening on
+# the ControlPath, it plays the master: it pretends the handshake takes
+# a while, then leaves a background process serving the socket.
+_FAKE_SSH = """#!%(python)s
+import os
+import socket
+import sys
+import time
+
+path = [a.split("=", 1)[1] for a in sys.argv if a.startswith("ControlPath=")][0]
+sock = socket.socket(socket.AF_UNIX)
+try:
+    sock.connect(path)
+    mode = "mux"
+except OSError:
+    mode = "master"
+sock.close()
+
+if mode == "master":
+    time.sleep(%(handshake)s)
+    if os.fork() == 0:
+        os.setsid()
+        for fd in range(3):
+            os.close(fd)
+        srv = socket.socket(socket.AF_UNIX)
+        srv.bind(path)
+        srv.listen()
+        srv.settimeout(5)
+        try:
+            while True:
+                srv.accept()[0].close()
+        except OSError:
+            pass
+        os._exit(0)
+
+with open(os.environ["FAKE_SSH_LOG"], "a") as f:
+    f.write("%%s %%f %%s\\n" %% (mode, time.time(), " ".join(sys.argv[1:])))
+"""
+
+
+class _FakeGInfo:
+    connuser = "fakeuser"
+    gsocket = None
+    gaddr = "127.0.0.1"
+    gport = "5900"
+
+    def __init__(self, host):
+        self._host = host
+
+    def need_tunnel(self):
+        return True
+
+    def get_tunnel_host(self):
+        return self._host, "2222"
+
+
+@pytest.fixture
+def fake_ssh(monkeypatch):
+    # Not tmp_path: sockaddr_un paths need to be short
+    tmpdir = tempfile.mkdtemp(prefix="vmm-ssh-")
+    script = os.path.join(tmpdir, "ssh")
+    with open(script, "w") as f:
+        f.write(_FAKE_SSH % {"python": os.path.realpath(sys.executable), "handshake": 0.5})
+    os.chmod(script, 0o755)
+
+    logpath = os.path.join(tmpdir, "log")
+    monkeypatch.setenv("PATH", tmpdir + os.pathsep + os.environ["PATH"])
+    monkeypatch.setenv("FAKE_SSH_LOG", logpath)
+    monkeypatch.setattr(sshtunnels._ControlMaster, "_dir", tmpdir)
+    monkeypatch.setattr(sshtunnels._ControlMaster, "_masters", {})
+
+    def _read_log():
+        if not os.path.exists(logpath):
+            return []
+        with open(logpath) as f:
+            return [line.split(" ", 2) for line in f.read().splitlines()]
+
+    yield _read_log
+
+    for name in os.listdir(tmpdir):
+        os.unlink(os.path.join(tmpdir, name))
+    os.rmdir(tmpdir)
+
+
+def testControlMasterCommand(fake_ssh):
+    ignore = fake_ssh
+    master = sshtunnels._ControlMaster.get("fakeuser", "example.com", "2222")
+    assert sshtunnels._ControlMaster.get("fakeuser", "example.com", "2222") is master
+    assert sshtunnels._ControlMaster.get("otheruser", "example.com", "2222") is not master
+
+    argv = sshtunnels._make_ssh_command(_FakeGInfo("example.com"), master)
+    assert argv[:8] == ["ssh", "ssh"] + master.get_ssh_args()
+    assert "ControlPath=%s" % master.path in argv
+    assert argv[argv.index("-p") + 1] == "2222"
+    assert argv[argv.index("-l") + 1] == "fakeuser"
+    assert not master.is_ready()
+
+
+def testControlMasterSharing(fake_ssh):
+    ginfo = _FakeGInfo("example.com")
+    first = sshtunnels.SSHTunnels(ginfo)
+    first.open_new()
+
+    # The first tunnel does the handshake behind the scheduler lock,
+    # until the viewer reports it connected
+    utils.wait_for(lambda: len(fake_ssh()) == 1, iterate_mainloop=True)
+    assert fake_ssh()[0][0] == "master"
+    assert first._locked
+    first.unlock()
+
+    # Later tunnels to the same host go over the master without
+    # taking the lock
+    utils.wait_for(first._master.is_ready, iterate_mainloop=True)
+    others = [sshtunnels.SSHTunnels(ginfo) for dummy in range(4)]
+    for tunnels in others:
+        tunnels.open_new()
+    utils.wait_for(lambda: len(fake_ssh()) == 5, iterate_mainloop=True)
+
+    entries = fake_ssh()[1:]
+    assert [entry[0] for entry in entries] == ["mux"] * 4
+    assert not any(tunnels._locked for tunnels in others)
+
+    for tunnels in [first] + others:
+        tunnels.close_all()
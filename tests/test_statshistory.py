@@ -0,0 +1,96 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import os
+
+from virtManager.lib import statshistory
+
+
+def _append(history, slotid, timestamp, cpu):
+    history.append(slotid, timestamp, {"cpuHostPercent": cpu, "netRxRate": cpu * 2})
+
+
+def test_statshistory_ring(tmp_path):
+    path = str(tmp_path / "stats-history")
+    history = statshistory.StatsHistoryFile(path, 3, 3)
+    assert history.read("vm1") == []
+
+    for idx in range(5):
+        _append(history, "vm1", 100 + idx, idx)
+    _append(history, "vm2", 200, 50)
+
+    records = history.read("vm1")
+    assert [r["timestamp"] for r in records] == [104, 103, 102]
+    assert [r["cpuHostPercent"] for r in records] == [4, 3, 2]
+    assert [r["netRxRate"] for r in records] == [8, 6, 4]
+    assert records[0]["memoryPercent"] == 0
+    assert [r["timestamp"] for r in history.read("vm1", since=103)] == [104, 103]
+
+    # File size is fixed up front
+    size = os.path.getsize(path)
+    _append(history, "vm1", 105, 5)
+    assert os.path.getsize(path) == size
+    history.close()
+    _append(history, "vm1", 106, 6)
+    assert history.read("vm1") == []
+
+    # Data survives reopening
+    history = statshistory.StatsHistoryFile(path, 3, 3)
+    assert sorted(history.list_slots()) == ["vm1", "vm2"]
+    assert history.read("vm1")[0]["timestamp"] == 105
+    assert history.read("vm2")[0]["cpuHostPercent"] == 50
+
+    # The host has a reserved slot, it doesn't recycle a VM
+    _append(history, statshistory.HOST_SLOT, 300, 1)
+    assert sorted(history.list_slots()) == ["host", "vm1", "vm2"]
+
+    # All VM slots full, the least recently updated VM is recycled, and
+    # the host history is never evicted
+    _append(history, "vm3", 301, 3)
+    assert sorted(history.list_slots()) == ["host", "vm2", "vm3"]
+    assert history.read("vm1") == []
+    _append(history, "vm4", 302, 4)
+    assert sorted(history.list_slots()) == ["host", "vm3", "vm4"]
+    assert history.read(statshistory.HOST_SLOT)[0]["cpuHostPercent"] == 1
+    history.close()
+
+    # Changing the layout starts a fresh file
+    history = statshistory.StatsHistoryFile(path, 4, 3)
+    assert history.list_slots() == []
+    assert os.path.getsize(path) > size
+    history.close()
+
+
+def test_statshistory_more_vms_than_slots(tmp_path):
+    # Two VM slots, four VMs sampled every tick. Slots aren't recycled
+    # while their VM is still being sampled, the extra VMs just aren't
+    # persisted
+    path = str(tmp_path / "stats-history")
+    history = statshistory.StatsHistoryFile(path, 3, 5, min_idle=10)
+    vms = ["vm1", "vm2", "vm3", "vm4"]
+    for tick in range(5):
+        _append(history, statshistory.HOST_SLOT, 100 + tick, 1)
+        for vm in vms:
+            _append(history, vm, 100 + tick, tick)
+
+    assert sorted(history.list_slots()) == ["host", "vm1", "vm2"]
+    assert len(history.read("vm1")) == 5
+    assert len(history.read("vm2")) == 5
+    assert history.read("vm3") == []
+    assert len(history.read(statshistory.HOST_SLOT)) == 5
+
+    # Once a VM stops reporting for min_idle, its slot is handed over
+    _append(history, "vm2", 110, 1)
+    _append(history, "vm3", 115, 1)
+    assert sorted(history.list_slots()) == ["host", "vm2", "vm3"]
+    assert history.read("vm1") == []
+    _append(history, "vm4", 115, 1)
+    assert history.read("vm4") == []
+    history.close()
+
+
+def test_statshistory_filter():
+    now = statshistory.time.time()
+    records = [{"timestamp": now - offset} for offset in (1, 10, 100, 1000)]
+    ret = statshistory.filter_history(records, now - 5, 500)
+    assert [r["timestamp"] for r in ret] == [now - 10, now - 100]
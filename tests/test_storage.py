@@ -5,6 +5,8 @@
 
 import os
 
+import pytest
+
 from virtinst import StoragePool, StorageVolume
 from virtinst import log
 
@@ -226,3 +228,41 @@ def testEnumerateLogical():
     conn = utils.URIs.open_testdefault_cached()
     lst = StoragePool.pool_list_from_sources(conn, StoragePool.TYPE_LOGICAL)
     assert lst == ["testvg1", "testvg2"]
+
+
+def testUploadSparse(tmp_path, monkeypatch):
+    from virtinst.install import volumeupload
+
+    # Data, hole, data, trailing hole
+    mib = 1024 * 1024
+    path = str(tmp_path / "sparse.img")
+    with open(path, "wb") as f:
+        f.write(b"a" * mib)
+        f.seek(3 * mib)
+        f.write(b"b" * mib)
+        f.truncate(6 * mib)
+    if not volumeupload._is_sparse(path):
+        pytest.skip("tmp_path doesn't support sparse files")  # pragma: no cover
+
+    streams = []
+    origclass = volumeupload._MockStream
+
+    def _make_stream():
+        streams.append(origclass())
+        return streams[-1]
+
+    monkeypatch.setattr(volumeupload, "_MockStream", _make_stream)
+
+    conn = utils.URIs.openconn(utils.URIs.test_full)
+    assert conn.support.conn_sparse_stream()
+    newpaths, tmpvols = volumeupload.upload_paths(
+        conn, "/var/lib/libvirt/boot", None, [path], block_size=mib // 2
+    )
+    assert len(newpaths) == 1
+    assert len(tmpvols) == 1
+    assert streams[0].extents == [
+        ("data", mib),
+        ("hole", 2 * mib),
+        ("data", mib),
+        ("hole", 2 * mib),
+    ]
@@ -3,6 +3,7 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import json
 import os
 import unittest.mock
 
@@ -138,3 +139,43 @@ def test_misc():
         _test("empty")
     assert "installable distribution" in str(e.value)
     assert "mistyped" in str(e.value)
+
+
+def test_detect_cache(tmp_path):
+    # pylint: disable=protected-access
+    from virtinst.install import urldetect
+
+    def _get_cache():
+        files = list(tmp_path.iterdir())
+        assert len(files) == 1
+        return files[0], json.loads(files[0].read_text())
+
+    with unittest.mock.patch.object(urldetect, "_get_detect_cache_dir", return_value=str(tmp_path)):
+        _test("fedora/30", "fedora30")
+        path, data = _get_cache()
+        assert data["distro"] == "_FedoraDistro"
+        assert data["checkfile"] == ".treeinfo"
+        assert "current/images/MANIFEST" in data["files"]
+
+        # Cache hit, result should be identical
+        _test("fedora/30", "fedora30")
+
+        # Checksum mismatch is ignored and the entry is refreshed
+        data["checksum"] = "bogus"
+        data["distro"] = "_DebianDistro"
+        path.write_text(json.dumps(data))
+        _test("fedora/30", "fedora30")
+        path, data = _get_cache()
+        assert data["distro"] == "_FedoraDistro"
+
+        # Trees without treeinfo validate against the matched probe file
+        path.unlink()
+        _test("debian/daily-images/amd64", distro="debiantesting")
+        path, data = _get_cache()
+        assert data["distro"] == "_DebianDistro"
+        assert data["checkfile"] == "daily/MANIFEST"
+        _test("debian/daily-images/amd64", distro="debiantesting")
+
+        # Corrupt cache files are ignored
+        path.write_text("{")
+        _test("debian/daily-images/amd64", distro="debiantesting")
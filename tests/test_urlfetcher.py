@@ -0,0 +1,149 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import ftplib
+
+import requests
+
+from virtinst import progress
+from virtinst.install import urlfetcher
+
+from tests import urlfetcher_mock
+
+
+def _make_ftp_fetcher(monkeypatch, tmp_path):
+    # pylint: disable=protected-access
+    calls = {"nlst": [], "size": []}
+    orignlst = urlfetcher_mock._MockFTPSession.nlst
+    origsize = urlfetcher_mock._MockFTPSession.size
+
+    def _nlst(self, path):
+        calls["nlst"].append(path)
+        return orignlst(self, path)
+
+    def _size(self, path):
+        calls["size"].append(path)
+        return origsize(self, path)
+
+    monkeypatch.setattr(ftplib, "FTP", urlfetcher_mock._MockFTPSession)
+    monkeypatch.setattr(urlfetcher_mock._MockFTPSession, "nlst", _nlst)
+    monkeypatch.setattr(urlfetcher_mock._MockFTPSession, "size", _size)
+    meter = progress.make_meter(quiet=True)
+    fetcher = urlfetcher.fetcherForURI("ftp://example.com", str(tmp_path), meter)
+    return fetcher, calls
+
+
+def test_ftp_listing_cache(monkeypatch, tmp_path):
+    fetcher, calls = _make_ftp_fetcher(monkeypatch, tmp_path)
+
+    for dummy in range(3):
+        assert fetcher.hasFile("images/pxeboot/vmlinuz")
+        assert fetcher.hasFile("images/pxeboot/initrd.img")
+        assert not fetcher.hasFile("images/pxeboot/missing.img")
+        assert fetcher.hasFile("images/boot.iso")
+
+    # Parallel checks of the same directory share the listing too
+    found = fetcher.hasFiles(["images/xen/vmlinuz", "images/xen/initrd.img", "images/xen/foo"])
+    assert found == {
+        "images/xen/vmlinuz": True,
+        "images/xen/initrd.img": True,
+        "images/xen/foo": False,
+    }
+
+    assert sorted(calls["nlst"]) == ["/images", "/images/pxeboot", "/images/xen"]
+    # Everything was answered from the listings
+    assert not calls["size"]
+
+
+def test_ftp_listing_dotfiles(monkeypatch, tmp_path):
+    fetcher, calls = _make_ftp_fetcher(monkeypatch, tmp_path)
+
+    # The mock hides dotfiles from NLST like many real servers, so
+    # a dotfile missing from the listing is checked directly
+    assert fetcher.hasFile(".treeinfo")
+    assert calls["nlst"] == ["/"]
+    assert calls["size"] == ["/.treeinfo"]
+
+    # A regular name missing from the listing is trusted
+    assert not fetcher.hasFile("treeinfo")
+    assert calls["nlst"] == ["/"]
+    assert calls["size"] == ["/.treeinfo"]
+
+
+class _RecordMeter:
+    def __init__(self):
+        self.calls = []
+
+    def start(self, text, size):
+        self.calls.append(("start", text, size))
+
+    def update(self, new_total):
+        self.calls.append(("update", new_total))
+
+    def end(self):
+        self.calls.append(("end",))
+
+
+def _make_http_fetcher(monkeypatch, tmp_path, meter):
+    calls = []
+    origget = urlfetcher_mock._MockRequestsSession.get
+
+    def _get(self, url, *args, **kwargs):
+        calls.append((url, (kwargs.get("headers") or {}).get("Range")))
+        return origget(self, url, *args, **kwargs)
+
+    monkeypatch.setattr(requests, "Session", urlfetcher_mock._MockRequestsSession)
+    monkeypatch.setattr(urlfetcher_mock._MockRequestsSession, "get", _get)
+    # Every mock file is tiny, make them all use range requests
+    monkeypatch.setattr(urlfetcher._HTTPURLFetcher, "_range_min_size", 1)
+    fetcher = urlfetcher.fetcherForURI("https://example.com", str(tmp_path), meter)
+    return fetcher, calls
+
+
+def test_http_ranges(monkeypatch, tmp_path):
+    # pylint: disable=protected-access
+    meter = _RecordMeter()
+    fetcher, calls = _make_http_fetcher(monkeypatch, tmp_path, meter)
+    with open(urlfetcher_mock.__file__, "rb") as f:
+        expected = f.read()
+    size = len(expected)
+
+    filenames = fetcher.acquireFiles(["vmlinuz", "initrd.img"])
+    for fn in filenames:
+        with open(fn, "rb") as f:
+            assert f.read() == expected
+
+    # One plain GET per file, then _range_parts range requests
+    assert len(calls) == 2 * (1 + fetcher._range_parts)
+    ranges = sorted(
+        [int(i) for i in r[len("bytes=") :].split("-")]
+        for url, r in calls
+        if url.endswith("/vmlinuz") and r
+    )
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == size - 1
+    for (dummy, end), (start, dummy) in zip(ranges, ranges[1:]):
+        assert start == end + 1
+
+    # Both downloads are reported as one combined progress
+    assert meter.calls[0] == ("start", "Retrieving 'vmlinuz', 'initrd.img'", size * 2)
+    assert meter.calls[-2] == ("update", size * 2)
+    assert meter.calls[-1] == ("end",)
+    assert [c[0] for c in meter.calls].count("start") == 1
+
+
+def test_http_ranges_fallback(monkeypatch, tmp_path):
+    meter = _RecordMeter()
+    fetcher, calls = _make_http_fetcher(monkeypatch, tmp_path, meter)
+    with open(urlfetcher_mock.__file__, "rb") as f:
+        expected = f.read()
+
+    # Servers that ignore the Range header, or send short ranges, are
+    # retried with a single plain request
+    for filename in ["testsuitenorange", "testsuiteshortrange"]:
+        calls.clear()
+        fn = fetcher.acquireFile(filename)
+        with open(fn, "rb") as f:
+            assert f.read() == expected
+        assert calls[-1] == ("https://example.com/" + filename, None)
+        assert len(calls) > 2
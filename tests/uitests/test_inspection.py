@@ -61,3 +61,27 @@ def testInspectionMock(app):
     lib.utils.check(lambda: "Not Connected" in c.text)
     app.manager_conn_connect("test testdriver.xml")
     lib.utils.check(lambda: "Not Connected" not in c.text)
+
+
+def testInspectionDelayedPool(app):
+    if not HAS_LIBGUESTFS:
+        pytest.skip("libguestfs python not installed")
+
+    # Slow down every fake inspection, so the VM we open a details
+    # window for has to jump ahead of the queued ones to finish quickly
+    app.open(enable_libguestfs=True, extra_opts=["--test-options=inspection-delay=1"])
+
+    details = app.manager_open_details("test-clone")
+    details.find("OS information", "table cell").click()
+    tab = details.find("os-tab")
+
+    tab.find("Application", "toggle").click_expander()
+    apps = tab.find("inspection-apps")
+    apps.check_onscreen()
+    apps.click_expander()
+    lib.utils.check(lambda: "test_app1_summary" in apps.fmt_nodes(), timeout=10)
+
+    # Refresh goes to the front of the queue too
+    nodestr1 = apps.fmt_nodes()
+    tab.find("Refresh", "push button").click()
+    lib.utils.check(lambda: apps.fmt_nodes() != nodestr1, timeout=10)
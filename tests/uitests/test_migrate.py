@@ -77,6 +77,13 @@ def testMigrateMock(app):
     mig = _open_migrate(app, "test-many-devices")
     mig.find("address-text").set_text("TESTSUITE-FAKE")
 
+    # Set tuning options, they are validated even for the mock migration
+    mig.find("Advanced", "toggle button").click_expander()
+    mig.find("Parallel connections:", "spin button").set_text("4")
+    mig.combo_select("Compression:", "Multithreaded")
+    mig.find("Level:", "spin button").set_text("3")
+    mig.find("Auto-converge:", "check box").click()
+
     mig.find("Migrate", "push button").click()
     progwin = app.find_window("Migrating VM")
     # Attempt cancel which will fail, then find the error message
@@ -143,3 +150,32 @@ def testMigrateXMLEditor(app):
     lib.utils.test_xmleditor_interactions(app, win, finish)
     win.find("Cancel", "push button").click()
     lib.utils.check(lambda: not win.visible)
+
+
+def testMigrateBatch(app):
+    """
+    Migrate several VMs at once through the mock migration
+    """
+    app.manager_createconn("test:///default")
+
+    mig = _open_migrate(app, "test-many-devices")
+    mig.find("address-text").set_text("TESTSUITE-FAKE")
+    mig.find("Advanced", "toggle button").click_expander()
+    mig.find("Bandwidth limit:", "spin button").set_text("100")
+    mig.find("Migrate other guests", "toggle button").click_expander()
+
+    batchlist = mig.find("migrate-batch-list")
+
+    def pred(node):
+        return node.roleName == "table cell"
+
+    # Cells are checkbox, name for each row
+    cells = batchlist.findChildren(pred, isLambda=True)
+    names = [cell.name for cell in cells[1::2]]
+    for vmname in ["test-alternate-devs", "test-arm-kernel"]:
+        cells[names.index(vmname) * 2].click()
+
+    mig.find("Migrate", "push button").click()
+    progwin = app.find_window("Migrating 3 VMs")
+    lib.utils.check(lambda: not progwin.showing, timeout=10)
+    lib.utils.check(lambda: not mig.showing)
@@ -4,8 +4,6 @@
 
 import ftplib
 import os
-import urllib
-from urllib.request import Request
 
 import requests
 
@@ -13,6 +11,7 @@ from virtinst import log
 
 _URLPREFIX = "https://virtinst-testsuite.example/"
 _MOCK_TOPDIR = os.path.dirname(__file__) + "/data/urldetect/"
+_MOCK_FTP_TREE = os.path.dirname(__file__) + "/data/fakemedia/fakerhel6tree/"
 
 
 def make_mock_input_url(distro):
@@ -40,25 +39,44 @@ def _map_mock_url_to_file(url):
 
 
 class _MockRequestsResponse:
-    def __init__(self, url):
+    def __init__(self, url, headers=None):
         log.debug("mocking requests session for url=%s", url)
         fn = _map_mock_url_to_file(url)
-        self._content = open(fn).read()
-        self.headers = {"content-length": len(self._content)}
+        self.url = url
+        self.status_code = 200
+        self._content = open(fn, "rb").read()
+        self.headers = {"content-length": len(self._content), "accept-ranges": "bytes"}
+
+        # 'testsuitenorange' ignores range requests, and
+        # 'testsuiteshortrange' sends one byte less than requested
+        byterange = (headers or {}).get("Range")
+        if byterange and "testsuitenorange" not in url:
+            start, end = [int(i) for i in byterange.split("=", 1)[1].split("-")]
+            if "testsuiteshortrange" in url:
+                end -= 1
+            self.status_code = 206
+            self._content = self._content[start : end + 1]
+            self.headers["content-length"] = len(self._content)
 
     def raise_for_status(self):
         pass
 
+    def close(self):
+        pass
+
     def iter_content(self, *args, **kwargs):
         dummy = args
         dummy = kwargs
-        return [self._content.encode("utf-8")]
+        return [self._content]
 
 
 class _MockRequestsSession:
     def close(self):
         pass
 
+    def mount(self, *args, **kwargs):
+        pass
+
     def head(self, url, *args, **kwargs):
         dummy = args
         dummy = kwargs
@@ -66,10 +84,9 @@ class _MockRequestsSession:
 
     def get(self, url, *args, **kwargs):
         dummy = args
-        dummy = kwargs
         if "testsuitefail" in url:
             raise RuntimeError("testsuitefail seen, raising mock error")
-        return _MockRequestsResponse(url)
+        return _MockRequestsResponse(url, headers=kwargs.get("headers"))
 
 
 class _MockFTPSession:
@@ -89,14 +106,36 @@ class _MockFTPSession:
         path = _map_mock_url_to_file(url)
         return os.path.getsize(path)
 
+    def nlst(self, path):
+        # List the fake RHEL6 tree. Like many real servers, leave out
+        # dotfiles, so the fetcher has to check those directly
+        dirpath = os.path.join(_MOCK_FTP_TREE, path.lstrip("/"))
+        if not os.path.isdir(dirpath):
+            raise ftplib.error_perm("550 %s: No such directory" % path)
+        names = sorted(n for n in os.listdir(dirpath) if not n.startswith("."))
+        return [os.path.join(path, n) for n in names]
+
+    def transfercmd(self, cmd):
+        return _MockFTPSocket(cmd.split(" ", 1)[1])
+
+    def voidresp(self):
+        pass
+
+
+class _MockFTPSocket:
+    def __init__(self, url):
+        self._path = _map_mock_url_to_file(url)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
 
-def _MockUrllibRequest(url):
-    url = _map_mock_url_to_file(url)
-    url = "file://" + url
-    return Request(url)
+    def makefile(self, mode):
+        return open(self._path, mode)
 
 
 def setup_mock():
     requests.Session = _MockRequestsSession
     ftplib.FTP = _MockFTPSession
-    urllib.request.Request = _MockUrllibRequest
@@ -5,6 +5,7 @@
 
 import os
 import sys
+import time
 
 import libvirt
 import pytest
@@ -285,3 +286,26 @@ def run_without_testsuite_hacks(cb):
                 os.environ["VIRTINST_TEST_SUITE"] = origval
 
     return wrapper_cb
+
+
+def wait_for(func, timeout=5, iterate_mainloop=False):
+    """
+    Poll func until it returns True, failing the test after timeout
+    seconds. With iterate_mainloop, pending GLib main loop events are
+    dispatched between checks, for code reporting back through idle
+    callbacks.
+    """
+    context = None
+    if iterate_mainloop:
+        from gi.repository import GLib
+
+        context = GLib.MainContext.default()
+
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        while context and context.pending():
+            context.iteration(False)
+        if func():
+            return
+        time.sleep(0.01)
+    raise AssertionError("Timed out waiting for %s" % func)
@@ -796,7 +796,6 @@ class vmmAddHardware(vmmGObjectUI):
         model.clear()
 
         devs = self.conn.filter_nodedevs(devtype)
-        netdevs = self.conn.filter_nodedevs("net")
         for dev in devs:
             if dev.xmlobj.is_usb_linux_root_hub():
                 continue
@@ -805,16 +804,15 @@ class vmmAddHardware(vmmGObjectUI):
             prettyname = dev.pretty_name()
 
             if devtype == "pci":
-                for subdev in netdevs:
-                    if dev.xmlobj.name == subdev.xmlobj.parent:
-                        prettyname += " (%s)" % subdev.pretty_name()
+                for subdev in self.conn.get_nodedev_children(dev.xmlobj.name, "net"):
+                    prettyname += " (%s)" % subdev.pretty_name()
 
             # parent device names are appended with mdev names in
             # libvirt 7.8.0
             if devtype == "mdev" and len(prettyname) <= 41:
-                for parentdev in self.conn.list_nodedevs():
-                    if dev.xmlobj.parent == parentdev.xmlobj.name:
-                        prettyname = "%s %s" % (parentdev.pretty_name(), prettyname)
+                parentdev = self.conn.get_nodedev_parent(dev)
+                if parentdev:
+                    prettyname = "%s %s" % (parentdev.pretty_name(), prettyname)
 
             tooltip = None
             sensitive = dev.is_active()
@@ -827,6 +825,10 @@ class vmmAddHardware(vmmGObjectUI):
                     )
                     % prettyname
                 )
+            else:
+                users = self.conn.get_hostdev_users(dev.xmlobj)
+                if users:
+                    tooltip = _("In use by guests: %s") % ", ".join(vm.get_name() for vm in users)
             model.append([dev.xmlobj, prettyname, sensitive, tooltip])
 
         if len(model) == 0:
@@ -1329,15 +1331,11 @@ class vmmAddHardware(vmmGObjectUI):
     ###########################
 
     def _validate_hostdev_collision(self, dev):
-        names = []
         nodedev = getattr(dev, "vmm_nodedev", None)
         if not nodedev:
             return  # pragma: no cover
 
-        for vm in self.conn.list_vms():
-            for hostdev in vm.xmlobj.devices.hostdev:
-                if nodedev.compare_to_hostdev(hostdev):
-                    names.append(vm.get_name())
+        names = [vm.get_name() for vm in self.conn.get_hostdev_users(nodedev)]
         if names:
             res = self.err.yes_no(
                 _("The device is already in use by other guests %s") % (names),
@@ -23,6 +23,7 @@ class _vmmMeter(virtinst.progress.Meter):
         self._pbar_pulse = pbar_pulse
         self._pbar_fraction = pbar_fraction
         self._pbar_done = pbar_done
+        self._details = None
 
     #################
     # Internal APIs #
@@ -36,6 +37,8 @@ class _vmmMeter(virtinst.progress.Meter):
             rtime = virtinst.progress.Meter.format_time(self._meter.re.remaining_time(), True)
             frac = self._meter.re.fraction_read()
             out = "%3i%% %5sB %s ETA" % (frac * 100, fread, rtime)
+            if self._details:
+                out += " (%s)" % self._details
             self._pbar_fraction(frac, out, self._text)
 
     #############################################
@@ -45,6 +48,13 @@ class _vmmMeter(virtinst.progress.Meter):
     def is_started(self):
         return bool(self._meter.start_time)
 
+    def set_details(self, details):
+        """
+        Extra text shown after the progress numbers, written out
+        with the next update
+        """
+        self._details = details
+
     ###################
     # Meter overrides #
     ###################
@@ -185,6 +185,9 @@ class vmmConfig:
         from gi.repository import Gdk
 
         screen = Gdk.Screen.get_default()
+        if not screen:  # pragma: no cover
+            # No display, ex. headless benchmarks
+            return
 
         css_provider = Gtk.CssProvider()
         css_provider.load_from_data(CSSDATA.encode("utf-8"))
@@ -404,6 +407,9 @@ class vmmConfig:
     def set_libguestfs_inspect_vms(self, val):
         self.conf.set("/enable-libguestfs-vm-inspection", val)
 
+    def get_libguestfs_inspection_workers(self):
+        return min(max(self.conf.get("/libguestfs-inspection-workers"), 1), 16)
+
     # Stats history and interval length
     def get_stats_history_length(self):
         return 120
@@ -420,6 +426,44 @@ class vmmConfig:
     def on_stats_update_interval_changed(self, cb):
         return self.conf.notify_add("/stats/update-interval", cb)
 
+    # Persistent on disk stats history
+    def get_stats_history_persist(self):
+        return self.conf.get("/stats/history-persist")
+
+    def set_stats_history_persist(self, val):
+        self.conf.set("/stats/history-persist", val)
+
+    def get_stats_history_retention(self):
+        # Stored in minutes, returned in seconds
+        return max(self.conf.get("/stats/history-retention"), 1) * 60
+
+    def set_stats_history_retention(self, minutes):
+        self.conf.set("/stats/history-retention", minutes)
+
+    def get_stats_history_max_vms(self):
+        return 256
+
+    # Adaptive per VM stats polling
+    def get_stats_adaptive_polling(self):
+        return self.conf.get("/stats/adaptive-polling")
+
+    def set_stats_adaptive_polling(self, val):
+        self.conf.set("/stats/adaptive-polling", val)
+
+    def get_stats_poll_max_backoff(self):
+        # Max number of update intervals between samples of offscreen VMs
+        return 16
+
+    # Prometheus style metrics export
+    def get_stats_metrics_listen(self):
+        return self.conf.get("/stats/metrics-listen")
+
+    def set_stats_metrics_listen(self, val):
+        self.conf.set("/stats/metrics-listen", val)
+
+    def on_stats_metrics_listen_changed(self, cb):
+        return self.conf.notify_add("/stats/metrics-listen", cb)
+
     # Disable/Enable different stats polling
     def get_stats_enable_cpu_poll(self):
         return self.conf.get("/stats/enable-cpu-poll")
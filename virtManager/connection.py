@@ -23,6 +23,9 @@ from .object.domain import vmmDomain
 from .object.network import vmmNetwork
 from .object.nodedev import vmmNodeDevice
 from .object.storagepool import vmmStoragePool
+from .lib.jobprogress import JobProgressRegistry
+from .lib.metricsexporter import TickHistogram
+from .lib.pollscheduler import PollScheduler
 from .lib.statsmanager import vmmStatsManager
 
 
@@ -138,6 +141,147 @@ class _ObjectList(vmmGObject):
             return self._objects[:]
 
 
+class _NodeDeviceIndex:
+    """
+    Capability type and parent->children indexes over the connection's
+    nodedev objects, so device pickers don't need to rescan the full
+    nodedev list for every device they display.
+    """
+
+    def __init__(self, nodedevs):
+        self._by_name = {}
+        self._keys = {}
+        self._by_type = {}
+        self._children = {}
+        self._unindexed = {}
+
+        for dev in nodedevs:
+            self.add(dev)
+
+    def _index(self, dev):
+        try:
+            xmlobj = dev.get_xmlobj()
+        except libvirt.libvirtError as e:  # pragma: no cover
+            # Libvirt nodedev XML fetching can be busted
+            # https://bugzilla.redhat.com/show_bug.cgi?id=1225771
+            if e.get_error_code() != libvirt.VIR_ERR_NO_NODE_DEVICE:
+                log.debug("Error fetching nodedev XML", exc_info=True)
+            return False
+
+        name = dev.get_name()
+        self._keys[name] = (xmlobj.device_type, xmlobj.parent)
+        self._by_type.setdefault(xmlobj.device_type, {})[name] = dev
+        if xmlobj.parent:
+            self._children.setdefault(xmlobj.parent, {})[name] = dev
+        return True
+
+    def _retry_unindexed(self):
+        for name, dev in list(self._unindexed.items()):
+            if self._index(dev):  # pragma: no cover
+                self._unindexed.pop(name)
+
+    def add(self, dev):
+        name = dev.get_name()
+        self._by_name[name] = dev
+        if not self._index(dev):
+            self._unindexed[name] = dev  # pragma: no cover
+
+    def remove(self, dev):
+        name = dev.get_name()
+        if self._by_name.get(name) is not dev:
+            return  # pragma: no cover
+        self._by_name.pop(name)
+        self._unindexed.pop(name, None)
+        if name not in self._keys:
+            return  # pragma: no cover
+
+        devtype, parent = self._keys.pop(name)
+        for mapping, key in [(self._by_type, devtype), (self._children, parent)]:
+            devs = mapping.get(key, {})
+            devs.pop(name, None)
+            if not devs:
+                mapping.pop(key, None)
+
+    def lookup(self, name):
+        return self._by_name.get(name)
+
+    def filter(self, devtype):
+        self._retry_unindexed()
+        if not devtype:
+            return [dev for name, dev in self._by_name.items() if name in self._keys]
+        return list(self._by_type.get(devtype, {}).values())
+
+    def children(self, name, devtype):
+        self._retry_unindexed()
+        devs = self._children.get(name, {})
+        return [
+            dev
+            for childname, dev in devs.items()
+            if not devtype or self._keys[childname][0] == devtype
+        ]
+
+
+class _HostdevIndex:
+    """
+    Reverse index from host device address to the VMs that have a
+    <hostdev> for it. VMs are marked dirty when their XML may have
+    changed, and reindexed on the next lookup.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._vm_keys = {}
+        self._dirty = {}
+
+    def _unindex(self, vm):
+        for key in self._vm_keys.pop(vm, []):
+            bucket = self._buckets[key]
+            bucket.pop(vm, None)
+            if not bucket:
+                self._buckets.pop(key)
+
+    def _index(self, vm):
+        try:
+            hostdevs = vm.xmlobj.devices.hostdev
+        except Exception as e:  # pragma: no cover
+            log.debug("Error fetching hostdevs for %s: %s", vm, e)
+            return
+
+        keys = set()
+        for hostdev in hostdevs:
+            key = virtinst.NodeDevice.get_hostdev_key(hostdev)
+            if key is None:
+                continue
+            self._buckets.setdefault(key, {}).setdefault(vm, []).append(hostdev)
+            keys.add(key)
+        self._vm_keys[vm] = keys
+
+    def mark_dirty(self, vm):
+        self._dirty[vm] = True
+
+    def remove_vm(self, vm):
+        self._dirty.pop(vm, None)
+        self._unindex(vm)
+
+    def lookup(self, nodedev):
+        """
+        Return the VMs with a hostdev matching the passed NodeDevice
+        """
+        for vm in self._dirty:
+            self._unindex(vm)
+            self._index(vm)
+        self._dirty = {}
+
+        vms = []
+        for key in nodedev.get_hostdev_lookup_keys():
+            for vm, hostdevs in self._buckets.get(key, {}).items():
+                if vm in vms:
+                    continue  # pragma: no cover
+                if any(nodedev.compare_to_hostdev(hostdev) for hostdev in hostdevs):
+                    vms.append(vm)
+        return vms
+
+
 class vmmConnection(vmmGObject):
     __gsignals__ = {
         "vm-added": (vmmGObject.RUN_FIRST, None, [object]),
@@ -170,6 +314,7 @@ class vmmConnection(vmmGObject):
         self._init_object_event = None
 
         self.using_domain_events = False
+        self.using_job_events = False
         self._domain_cb_ids = []
         self.using_network_events = False
         self._network_cb_ids = []
@@ -181,7 +326,12 @@ class vmmConnection(vmmGObject):
         self._xml_flags = {}
 
         self._objects = _ObjectList()
+        self._nodedev_index = None
+        self._hostdev_index = None
         self.statsmanager = vmmStatsManager()
+        self.tick_histogram = TickHistogram()
+        self.job_progress = JobProgressRegistry()
+        self._pollscheduler = PollScheduler(self.config.get_stats_poll_max_backoff())
 
         self._stats = []
         self._hostinfo = None
@@ -522,23 +672,52 @@ class vmmConnection(vmmGObject):
     # nodedev helper functions #
     ############################
 
+    def _track_vm_hostdevs(self, vm):
+        self._hostdev_index.mark_dirty(vm)
+        vm.connect("state-changed", self._vm_hostdevs_changed_cb)
+
+    def _vm_hostdevs_changed_cb(self, vm):
+        if self._hostdev_index is not None:
+            self._hostdev_index.mark_dirty(vm)
+
+    def get_hostdev_users(self, nodedev):
+        """
+        Return the vmmDomains that have a hostdev matching the passed
+        virtinst NodeDevice
+        """
+        if self._hostdev_index is None:
+            self._hostdev_index = _HostdevIndex()
+            for vm in self.list_vms():
+                self._track_vm_hostdevs(vm)
+        elif not self.using_domain_events:
+            # Without events XML can change without a state-changed
+            # signal, so every VM needs rechecking
+            for vm in self.list_vms():  # pragma: no cover
+                self._hostdev_index.mark_dirty(vm)
+        return self._hostdev_index.lookup(nodedev)
+
+    def _get_nodedev_index(self):
+        if self._nodedev_index is None:
+            self._nodedev_index = _NodeDeviceIndex(self.list_nodedevs())
+        return self._nodedev_index
+
     def filter_nodedevs(self, devtype):
-        retdevs = []
-        for dev in self.list_nodedevs():
-            try:
-                xmlobj = dev.get_xmlobj()
-            except libvirt.libvirtError as e:  # pragma: no cover
-                # Libvirt nodedev XML fetching can be busted
-                # https://bugzilla.redhat.com/show_bug.cgi?id=1225771
-                if e.get_error_code() != libvirt.VIR_ERR_NO_NODE_DEVICE:
-                    log.debug("Error fetching nodedev XML", exc_info=True)
-                continue
+        return self._get_nodedev_index().filter(devtype)
 
-            if devtype and xmlobj.device_type != devtype:
-                continue
+    def get_nodedev_children(self, name, devtype=None):
+        """
+        Return the nodedevs whose parent is the nodedev named `name`,
+        optionally limited to capability type `devtype`
+        """
+        return self._get_nodedev_index().children(name, devtype)
 
-            retdevs.append(dev)
-        return retdevs
+    def get_nodedev_parent(self, dev):
+        """
+        Return the vmmNodeDevice parent of `dev`, if we are tracking it
+        """
+        if not dev.xmlobj.parent:
+            return None
+        return self._get_nodedev_index().lookup(dev.xmlobj.parent)
 
     ###################################
     # Libvirt object creation methods #
@@ -618,6 +797,18 @@ class vmmConnection(vmmGObject):
         if obj:
             self.idle_add(obj.recache_from_event_loop)
 
+    def _domain_job_event(self, conn, domain, *args):
+        # Wake up any job progress reporting for the domain. Called
+        # directly from the event loop, JobProgress is thread safe
+        ignore = conn
+        args = list(args)
+        eventstr = args.pop(-1)
+
+        log.debug("domain job event: domain=%s event=%s", domain.name(), eventstr)
+        self.job_progress.job_event(
+            domain.UUIDString(), completed=eventstr == "VIR_DOMAIN_EVENT_ID_JOB_COMPLETED"
+        )
+
     def _domain_lifecycle_event(self, conn, domain, state, reason, userdata):
         ignore = conn
         ignore = userdata
@@ -632,6 +823,7 @@ class vmmConnection(vmmGObject):
         obj = self.get_vm_by_name(name)
 
         if obj:
+            self._pollscheduler.reset(obj.get_uuid())
             self.idle_add(obj.recache_from_event_loop)
         else:
             self.schedule_priority_tick(pollvm=True, force=True)
@@ -759,7 +951,7 @@ class vmmConnection(vmmGObject):
 
         def _add_domain_xml_event(eventname, eventval, cb=None):
             if not self.using_domain_events:
-                return
+                return False
             if not cb:
                 cb = self._domain_xml_misc_event
             try:
@@ -773,8 +965,10 @@ class vmmConnection(vmmGObject):
                     and self.config.CLITestOptions.fake_agent_event
                 ):
                     testmock.schedule_fake_agent_event(self, cb)
+                return True
             except Exception as e:  # pragma: no cover
                 log.debug("Error registering %s event: %s", eventname, e)
+                return False
 
         _add_domain_xml_event("VIR_DOMAIN_EVENT_ID_BALLOON_CHANGE", 13)
         _add_domain_xml_event("VIR_DOMAIN_EVENT_ID_TRAY_CHANGE", 10)
@@ -784,6 +978,14 @@ class vmmConnection(vmmGObject):
             "VIR_DOMAIN_EVENT_ID_AGENT_LIFECYCLE", 18, self._domain_agent_lifecycle_event
         )
         _add_domain_xml_event("VIR_DOMAIN_EVENT_ID_METADATA_CHANGE", 23)
+        # Added in libvirt 1.3.2 and 2.0.0, used for job progress reporting
+        have_iteration = _add_domain_xml_event(
+            "VIR_DOMAIN_EVENT_ID_MIGRATION_ITERATION", 20, self._domain_job_event
+        )
+        have_completed = _add_domain_xml_event(
+            "VIR_DOMAIN_EVENT_ID_JOB_COMPLETED", 21, self._domain_job_event
+        )
+        self.using_job_events = have_iteration and have_completed
 
         try:
             _check_events_disabled()
@@ -877,6 +1079,7 @@ class vmmConnection(vmmGObject):
             self._node_device_cb_ids = []
 
         self._stats = []
+        self.statsmanager.close_history()
 
         if self._init_object_event:
             self._init_object_event.clear()  # pragma: no cover
@@ -890,6 +1093,8 @@ class vmmConnection(vmmGObject):
                 log.debug("Failed to cleanup %s: %s", obj, e)
         self._objects.cleanup()
         self._objects = _ObjectList()
+        self._nodedev_index = None
+        self._hostdev_index = None
 
         closeret = self._backend.close()
         if closeret == 1:
@@ -982,6 +1187,7 @@ class vmmConnection(vmmGObject):
             log.debug("Connection doesn't seem to support nodedev APIs.")
 
         self._add_conn_events()
+        self.statsmanager.open_history(self)
 
         try:
             self._backend.setKeepAlive(20, 1)
@@ -1072,6 +1278,12 @@ class vmmConnection(vmmGObject):
                 continue
 
             log.debug("%s=%s removed", class_name, name)
+            if obj.is_nodedev() and self._nodedev_index is not None:
+                self._nodedev_index.remove(obj)
+            if obj.is_domain() and self._hostdev_index is not None:
+                self._hostdev_index.remove_vm(obj)
+            if obj.reports_stats():
+                self._pollscheduler.forget(obj.get_uuid())
             self._remove_object_signal(obj)
             obj.cleanup()
 
@@ -1096,6 +1308,11 @@ class vmmConnection(vmmGObject):
                 obj.cleanup()
                 return
 
+            if obj.is_nodedev() and self._nodedev_index is not None:
+                self._nodedev_index.add(obj)
+            if obj.is_domain() and self._hostdev_index is not None:
+                self._track_vm_hostdevs(obj)
+
             if not obj.is_nodedev():
                 # Skip nodedev logging since it's noisy and not interesting
                 log.debug("%s=%s status=%s added", class_name, obj.get_name(), obj.run_status())
@@ -1232,20 +1449,30 @@ class vmmConnection(vmmGObject):
             pollnodedev = False
 
         self._hostinfo = self._backend.getInfo()
-        if stats_update:
-            self.statsmanager.cache_all_stats(self)
 
         gone_objects, preexisting_objects = self._poll(
             initial_poll, pollvm, pollnet, pollpool, pollnodedev
         )
         self.idle_add(self._gone_object_signals, gone_objects)
 
+        statsvms = set()
+        if stats_update:
+            allvms = [o for o in preexisting_objects if o.reports_stats()]
+            duevms = self._get_vms_due_for_stats(allvms)
+            statsvms = set(duevms)
+            if len(duevms) == len(allvms):
+                duevms = None
+            self.statsmanager.cache_all_stats(self, duevms)
+
         # Only tick() pre-existing objects, since new objects will be
         # initialized asynchronously and tick() would be redundant
         for obj in preexisting_objects:
             try:
+                objstats = stats_update
                 if obj.reports_stats() and stats_update:
-                    pass
+                    objstats = obj in statsvms
+                    if not objstats and not pollvm:
+                        continue
                 elif obj.is_domain() and not pollvm:
                     continue
                 elif obj.is_network() and not pollnet:
@@ -1261,7 +1488,9 @@ class vmmConnection(vmmGObject):
                     e.err = [libvirt.VIR_ERR_SYSTEM_ERROR]
                     raise e
 
-                obj.tick(stats_update=stats_update)
+                obj.tick(stats_update=objstats)
+                if objstats and obj.reports_stats():
+                    self._pollscheduler.sampled(obj.get_uuid(), obj.stats_are_idle())
             except Exception as e:
                 log.exception("Tick for %s failed", obj)
                 if isinstance(e, libvirt.libvirtError) and (
@@ -1279,6 +1508,25 @@ class vmmConnection(vmmGObject):
             self._recalculate_stats([o for o in preexisting_objects if o.reports_stats()])
             self.idle_emit("resources-sampled")
 
+    def _using_adaptive_polling(self):
+        """
+        Adaptive polling only kicks in when domain events are available,
+        otherwise the stats tick is also how we notice VM state changes.
+        """
+        return self.using_domain_events and self.config.get_stats_adaptive_polling()
+
+    def _get_vms_due_for_stats(self, vms):
+        """
+        Return the subset of vms that should have stats sampled this tick.
+        """
+        # Count ticks even with adaptive polling off, visibility reported
+        # by the manager expires after a tick and is_vm_visible is used
+        # by inspection too
+        self._pollscheduler.start_tick()
+        if not self._using_adaptive_polling():
+            return vms
+        return [vm for vm in vms if self._pollscheduler.is_due(vm.get_uuid())]
+
     def _recalculate_stats(self, vms):
         if not self._backend.is_open():
             return  # pragma: no cover
@@ -1291,6 +1539,7 @@ class vmmConnection(vmmGObject):
 
         mem = 0
         cpuTime = 0
+        cpuHostPercent = 0
         rdRate = 0
         wrRate = 0
         rxRate = 0
@@ -1303,6 +1552,7 @@ class vmmConnection(vmmGObject):
                 continue
 
             cpuTime += vm.cpu_time()
+            cpuHostPercent += vm.host_cpu_time_percentage()
             mem += vm.stats_memory()
             rdRate += vm.disk_read_rate()
             wrRate += vm.disk_write_rate()
@@ -1315,7 +1565,13 @@ class vmmConnection(vmmGObject):
         pcentHostCpu = 0
         pcentMem = mem * 100.0 / self.host_memory_size()
 
-        if len(self._stats) > 0:
+        if len(self._stats) > 0 and self._using_adaptive_polling():
+            # Sum the per VM host percentages rather than dividing the
+            # summed cpuTime by our own interval. With adaptive polling
+            # VMs are sampled over different intervals, and their
+            # percentage is already averaged over their own one.
+            pcentHostCpu = cpuHostPercent
+        elif len(self._stats) > 0:
             prevTimestamp = self._stats[0]["timestamp"]
             host_cpus = self.host_active_processor_count()
 
@@ -1341,6 +1597,7 @@ class vmmConnection(vmmGObject):
         }
 
         self._stats.insert(0, newStats)
+        self.statsmanager.record_host_stats(newStats)
 
     def schedule_priority_tick(self, **kwargs):
         from .engine import vmmEngine
@@ -1348,11 +1605,14 @@ class vmmConnection(vmmGObject):
         vmmEngine.get_instance().schedule_priority_tick(self, kwargs)
 
     def tick_from_engine(self, *args, **kwargs):
+        start = time.monotonic()
         try:
             self._tick(*args, **kwargs)
         except Exception:
             self._schedule_close()
             raise
+        finally:
+            self.tick_histogram.observe(time.monotonic() - start)
 
     ########################
     # Stats getter methods #
@@ -1363,15 +1623,47 @@ class vmmConnection(vmmGObject):
             return 0
         return self._stats[0][record_name]
 
+    def get_stats_record(self, record_name):
+        return self._get_record_helper(record_name)
+
+    def set_stats_visible_vms(self, vms):
+        """
+        Called by the manager with the VMs in currently visible rows,
+        for adaptive stats polling
+        """
+        self._pollscheduler.set_visible([vm.get_uuid() for vm in vms])
+
+    def is_vm_visible(self, vm):
+        """
+        Whether vm is in a visible manager row or an open details window
+        """
+        return self._pollscheduler.is_visible(vm.get_uuid())
+
+    def watch_vm_stats(self, vm):
+        """
+        Sample stats for vm at the full rate until unwatch_vm_stats
+        """
+        self._pollscheduler.watch(vm.get_uuid())
+
+    def unwatch_vm_stats(self, vm):
+        self._pollscheduler.unwatch(vm.get_uuid())
+
     def _vector_helper(self, record_name, limit, ceil=100.0):
         vector = []
         statslen = self.config.get_stats_history_length() + 1
         if limit is not None:
             statslen = min(statslen, limit)  # pragma: no cover
 
+        history = []
+        if len(self._stats) < statslen:
+            before = self._stats and self._stats[-1]["timestamp"] or time.time()
+            history = self.statsmanager.get_host_history(before)
+
         for i in range(statslen):
             if i < len(self._stats):
                 vector.append(self._stats[i][record_name] / ceil)
+            elif i - len(self._stats) < len(history):
+                vector.append(history[i - len(self._stats)][record_name] / ceil)
             else:
                 vector.append(0)
 
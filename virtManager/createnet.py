@@ -156,9 +156,7 @@ class vmmCreateNetwork(vmmGObjectUI):
             if not pcidev.xmlobj.is_pci_sriov():
                 continue
             devdesc = pcidev.pretty_name()
-            for netdev in self.conn.filter_nodedevs("net"):
-                if pcidev.xmlobj.name != netdev.xmlobj.parent:
-                    continue
+            for netdev in self.conn.get_nodedev_children(pcidev.xmlobj.name, "net"):
                 ifname = netdev.xmlobj.interface
                 devprettyname = "%s (%s)" % (ifname, devdesc)
                 devprettynames.append(devprettyname)
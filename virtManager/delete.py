@@ -4,6 +4,7 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import concurrent.futures
 import os
 import stat
 import traceback
@@ -28,6 +29,9 @@ STORAGE_ROW_ICON = 5
 STORAGE_ROW_ICON_SIZE = 6
 STORAGE_ROW_TOOLTIP = 7
 
+# Max number of storage paths deleted concurrently
+MAX_PARALLEL_DELETES = 4
+
 
 class _vmmDeleteBase(vmmGObjectUI):
     """
@@ -221,16 +225,43 @@ class _vmmDeleteBase(vmmGObjectUI):
         asyncjob.set_error(error, details)
 
     def _async_delete_paths(self, paths, conn, meter):
-        storage_errors = []
-        for path in paths:
-            try:
-                log.debug("Deleting path: %s", path)
-                meter.start(_("Deleting path '%s'") % path, None)
-                self._async_delete_path(conn, path, meter)
-            except Exception as e:
-                storage_errors.append((str(e), "".join(traceback.format_exc())))
-            meter.end()
-        return storage_errors
+        """
+        Delete the passed paths, up to MAX_PARALLEL_DELETES at a time,
+        since deleting a big thick or wiped volume can take minutes.
+        Returns (error, details) for each failed path, in path order.
+        """
+        if not paths:
+            return []
+
+        def _progress_text(done):
+            if len(paths) == 1:
+                return _("Deleting path '%s'") % paths[0]
+            return ngettext(
+                "Deleting storage: %(done)d of %(total)d path finished",
+                "Deleting storage: %(done)d of %(total)d paths finished",
+                len(paths),
+            ) % {"done": done, "total": len(paths)}
+
+        def _delete(path):
+            log.debug("Deleting path: %s", path)
+            self._async_delete_path(conn, path, meter)
+
+        errors = {}
+        meter.start(_progress_text(0), None)
+        workers = min(MAX_PARALLEL_DELETES, len(paths))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = dict((executor.submit(_delete, path), path) for path in paths)
+            for done, future in enumerate(concurrent.futures.as_completed(futures)):
+                path = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    log.debug("Error deleting path=%s: %s", path, e)
+                    errors[path] = (str(e), "".join(traceback.format_exc()))
+                meter.start(_progress_text(done + 1), None)
+        meter.end()
+
+        return [errors[path] for path in paths if path in errors]
 
     def _async_delete_path(self, conn, path, ignore):
         try:
@@ -380,6 +380,8 @@ class vmmDetails(vmmGObjectUI):
         self._xmleditor.connect("xml-reset", self._xmleditor_xml_reset_cb)
 
         self._oldhwkey = None
+        self._hw_rows = {}
+        self._hw_type_counts = {}
         self._popupmenu = None
         self._popupmenuitems = None
         self._os_list = None
@@ -461,6 +463,7 @@ class vmmDetails(vmmGObjectUI):
 
     def _cleanup(self):
         self._oldhwkey = None
+        self._hw_rows = {}
 
         if self.addhw:
             self.addhw.cleanup()
@@ -853,9 +856,12 @@ class vmmDetails(vmmGObjectUI):
         return uiutil.get_list_selected_row(self.widget("hw-list"))
 
     def _get_hw_row_for_device(self, dev):
-        for row in self.widget("hw-list").get_model():
-            if row[HW_LIST_COL_DEVICE] is dev:
-                return row
+        treeiter = self._hw_rows.get(dev.get_xml_id())
+        if treeiter is None:
+            return None
+        row = self.widget("hw-list").get_model()[treeiter]
+        if row[HW_LIST_COL_DEVICE] is dev:
+            return row
 
     def _get_hw_row_label_for_device(self, dev):
         row = self._get_hw_row_for_device(dev)
@@ -2354,8 +2360,15 @@ class vmmDetails(vmmGObjectUI):
         hw_list_model = self.widget("hw-list").get_model()
         hw_list_model.clear()
 
-        def add_hw_list_option(*args, **kwargs):
-            hw_list_model.append(self._make_hw_list_entry(*args, **kwargs))
+        # Device XML id -> row iter, and number of rows of each
+        # HW_LIST_TYPE, maintained by _repopulate_hw_list. ListStore
+        # iters stay valid as long as their row exists
+        self._hw_rows = {}
+        self._hw_type_counts = {}
+
+        def add_hw_list_option(title, hwtype, icon_name):
+            hw_list_model.append(self._make_hw_list_entry(title, hwtype, icon_name))
+            self._hw_type_counts[hwtype] = self._hw_type_counts.get(hwtype, 0) + 1
 
         add_hw_list_option(_("Overview"), HW_LIST_TYPE_GENERAL, "computer")
         add_hw_list_option(_("OS information"), HW_LIST_TYPE_OS, "computer")
@@ -2375,16 +2388,7 @@ class vmmDetails(vmmGObjectUI):
         hw_list = self.widget("hw-list")
         hw_list_model = hw_list.get_model()
 
-        currentDevices = []
-
-        def dev_cmp(origdev, newdev):
-            if not origdev:
-                return False
-
-            if origdev == newdev:
-                return True
-
-            return origdev.get_xml_id() == newdev.get_xml_id()
+        currentDevices = set()
 
         def update_hwlist(hwtype, dev, disk_bus_index=None):
             """
@@ -2393,25 +2397,31 @@ class vmmDetails(vmmGObjectUI):
             """
             label = _label_for_device(dev, disk_bus_index)
             icon = _icon_for_device(dev)
+            xmlid = dev.get_xml_id()
 
-            currentDevices.append(dev)
+            currentDevices.add(xmlid)
 
-            insertAt = 0
-            for row in hw_list_model:
-                rowdev = row[HW_LIST_COL_DEVICE]
-                if dev_cmp(rowdev, dev):
-                    # Update existing HW info
+            treeiter = self._hw_rows.get(xmlid)
+            if treeiter is not None:
+                # Update existing HW info
+                row = hw_list_model[treeiter]
+                if row[HW_LIST_COL_DEVICE] is not dev:
                     row[HW_LIST_COL_DEVICE] = dev
+                if row[HW_LIST_COL_LABEL] != label:
                     row[HW_LIST_COL_LABEL] = label
+                if row[HW_LIST_COL_ICON_NAME] != icon:
                     row[HW_LIST_COL_ICON_NAME] = icon
-                    return
+                return
 
-                if row[HW_LIST_COL_TYPE] <= hwtype:
-                    insertAt += 1
+            # Add the new HW row after every row of the same or earlier type
+            insertAt = 0
+            for rowtype, count in self._hw_type_counts.items():
+                if rowtype <= hwtype:
+                    insertAt += count
 
-            # Add the new HW row
             hw_entry = self._make_hw_list_entry(label, hwtype, icon, dev)
-            hw_list_model.insert(insertAt, hw_entry)
+            self._hw_rows[xmlid] = hw_list_model.insert(insertAt, hw_entry)
+            self._hw_type_counts[hwtype] = self._hw_type_counts.get(hwtype, 0) + 1
 
         consoles = self.vm.xmlobj.devices.console
         serials = self.vm.xmlobj.devices.serial
@@ -2471,17 +2481,14 @@ class vmmDetails(vmmGObjectUI):
         for dev in self.vm.xmlobj.devices.vsock:
             update_hwlist(HW_LIST_TYPE_VSOCK, dev)
 
-        devs = list(range(len(hw_list_model)))
-        devs.reverse()
-        for i in devs:
-            _iter = hw_list_model.iter_nth_child(None, i)
-            olddev = hw_list_model[i][HW_LIST_COL_DEVICE]
-
+        for xmlid in list(self._hw_rows):
             # Existing device, don't remove it
-            if not olddev or olddev in currentDevices:
+            if xmlid in currentDevices:
                 continue
 
-            hw_list_model.remove(_iter)
+            treeiter = self._hw_rows.pop(xmlid)
+            self._hw_type_counts[hw_list_model[treeiter][HW_LIST_COL_TYPE]] -= 1
+            hw_list_model.remove(treeiter)
 
     ################
     # UI listeners #
@@ -3,11 +3,15 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import atexit
 import functools
+import hashlib
 import os
 import queue
+import shutil
 import socket
 import signal
+import tempfile
 import threading
 import ipaddress
 
@@ -167,6 +171,68 @@ class _TunnelScheduler:
 _tunnel_scheduler = _TunnelScheduler()
 
 
+class _ControlMaster:
+    """
+    A shared ssh ControlMaster socket for every tunnel to the same
+    user@host:port. The first tunnel's ssh process sets up the master,
+    which stays around for CONTROL_PERSIST seconds after its last channel
+    closes. While it is up, new tunnels multiplex over it, skipping the
+    SSH handshake and any auth prompts.
+    """
+
+    CONTROL_PERSIST = 60
+
+    _masters = {}
+    _lock = threading.Lock()
+    _dir = None
+
+    @classmethod
+    def _get_dir(cls):
+        if not cls._dir:
+            cls._dir = tempfile.mkdtemp(
+                prefix="virt-manager-ssh-", dir=os.environ.get("XDG_RUNTIME_DIR")
+            )
+            atexit.register(shutil.rmtree, cls._dir, True)
+        return cls._dir
+
+    @classmethod
+    def get(cls, user, host, port):
+        key = "%s@%s:%s" % (user or "", host, port or "")
+        with cls._lock:
+            if key not in cls._masters:
+                cls._masters[key] = cls(key)
+            return cls._masters[key]
+
+    def __init__(self, key):
+        # sockaddr_un paths are limited to ~100 chars, so keep it short
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(self._get_dir(), name)
+
+    def is_ready(self):
+        """
+        Whether a master is listening on our socket. A socket file left
+        behind by a killed master doesn't count
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+            return True
+        except OSError:
+            return False
+        finally:
+            sock.close()
+
+    def get_ssh_args(self):
+        return [
+            "-o",
+            "ControlMaster=auto",
+            "-o",
+            "ControlPath=%s" % self.path,
+            "-o",
+            "ControlPersist=%d" % self.CONTROL_PERSIST,
+        ]
+
+
 class _Tunnel:
     def __init__(self):
         self._pid = None
@@ -231,7 +297,7 @@ class _Tunnel:
         self._pid = pid
 
 
-def _make_ssh_command(ginfo):
+def _make_ssh_command(ginfo, master=None):
     if not ginfo.need_tunnel():
         return None
 
@@ -239,6 +305,8 @@ def _make_ssh_command(ginfo):
 
     # Build SSH cmd
     argv = ["ssh", "ssh"]
+    if master:
+        argv += master.get_ssh_args()
     if port:
         argv += ["-p", str(port)]
 
@@ -284,7 +352,11 @@ def _make_ssh_command(ginfo):
 class SSHTunnels:
     def __init__(self, ginfo):
         self._tunnels = []
-        self._sshcommand = _make_ssh_command(ginfo)
+        self._master = None
+        if ginfo.need_tunnel():
+            host, port = ginfo.get_tunnel_host()
+            self._master = _ControlMaster.get(ginfo.connuser, host, port)
+        self._sshcommand = _make_ssh_command(ginfo, self._master)
         self._locked = False
 
     def open_new(self):
@@ -298,7 +370,12 @@ class SSHTunnels:
         # level socket object for the SSH side, since it simplifies things
         # in that area.
         viewerfd, sshfd = socket.socketpair()
-        _tunnel_scheduler.schedule(self._lock, t.open, self._sshcommand, sshfd)
+        if self._master and self._master.is_ready():
+            # No handshake or auth prompts when multiplexing over an
+            # existing master, so there's nothing to serialize
+            t.open(self._sshcommand, sshfd)
+        else:
+            _tunnel_scheduler.schedule(self._lock, t.open, self._sshcommand, sshfd)
 
         retfd = os.dup(viewerfd.fileno())
         log.debug("Generated tunnel fd=%s for viewer", retfd)
@@ -320,6 +397,10 @@ class SSHTunnels:
 
     def _lock(self):
         _tunnel_scheduler.lock()
+        if self._master and self._master.is_ready():
+            # Another tunnel brought up the master while we waited
+            _tunnel_scheduler.unlock()
+            return
         self._locked = True
 
     def unlock(self, *args, **kwargs):
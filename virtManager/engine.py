@@ -17,6 +17,7 @@ from .baseclass import vmmGObject
 from .createconn import vmmCreateConn
 from .connmanager import vmmConnectionManager
 from .lib.inspection import vmmInspection
+from .lib.metricsexporter import MetricsExporter
 from .systray import vmmSystray
 
 (PRIO_HIGH, PRIO_LOW) = range(1, 3)
@@ -78,13 +79,15 @@ class vmmEngine(vmmGObject):
         self._tick_thread.daemon = True
         self._tick_queue = queue.PriorityQueue(100)
 
+        self._metrics_exporter = None
+
     @property
     def _connobjs(self):
         return vmmConnectionManager.get_instance().conns
 
     def _cleanup(self):
         # self._timer should be automatically cleaned up
-        pass
+        self._stop_metrics_exporter()
 
     #################
     # init handling #
@@ -100,7 +103,11 @@ class vmmEngine(vmmGObject):
         self.add_gsettings_handle(
             self.config.on_stats_update_interval_changed(self._timer_changed_cb)
         )
+        self.add_gsettings_handle(
+            self.config.on_stats_metrics_listen_changed(self._metrics_listen_changed_cb)
+        )
 
+        self._start_metrics_exporter()
         self._schedule_timer()
         self._tick_thread.start()
         self._tick()
@@ -273,6 +280,10 @@ class vmmEngine(vmmGObject):
     def _tick(self):
         for conn in self._connobjs.values():
             self._add_obj_to_tick_queue(conn, False, stats_update=True, pollvm=True)
+        if self._metrics_exporter:
+            # Snapshot what the previous tick sampled, the exporter
+            # thread doesn't access the connections itself
+            self._metrics_exporter.refresh()
         return 1
 
     def _handle_tick_queue(self):
@@ -290,6 +301,36 @@ class vmmEngine(vmmGObject):
             conn = None
             self._tick_queue.task_done()
 
+    #############################
+    # metrics exporter handling #
+    #############################
+
+    def _start_metrics_exporter(self):
+        address = self.config.get_stats_metrics_listen()
+        if not address:
+            return
+
+        def _get_conns():
+            return list(self._connobjs.values())
+
+        try:
+            exporter = MetricsExporter(address, _get_conns)
+            exporter.start()
+            self._metrics_exporter = exporter
+        except Exception as e:  # pragma: no cover
+            log.warning("Failed to start metrics exporter on %s: %s", address, e)
+
+    def _stop_metrics_exporter(self):
+        if self._metrics_exporter:
+            self._metrics_exporter.stop()
+        self._metrics_exporter = None
+
+    def _metrics_listen_changed_cb(self, *args, **kwargs):
+        ignore1 = args
+        ignore2 = kwargs
+        self._stop_metrics_exporter()
+        self._start_metrics_exporter()
+
     #####################################
     # window counting and exit handling #
     #####################################
@@ -73,6 +73,11 @@ class vmmHostStorage(vmmGObjectUI):
         self._name_hint = None
 
         self._active_edits = set()
+        # Bumped on every volume list populate, so stale background
+        # results can be dropped
+        self._vol_populate_id = 0
+        # Volume to select once it shows up in the list
+        self._vol_select_pending = None
         self._addpool = None
         self._addvol = None
         self._volmenu = None
@@ -383,62 +388,119 @@ class vmmHostStorage(vmmGObjectUI):
         uiutil.set_list_selection(pool_list, curpool)
 
     def _populate_vols(self):
-        list_widget = self.widget("vol-list")
+        """
+        Kick off a background refresh of the volume list. Volume details
+        are gathered in a thread and diffed into the existing model,
+        then 'in use by' info is filled in once that is computed.
+        """
+        self._vol_populate_id += 1
         pool = self._current_pool()
-        vols = pool and pool.get_volumes() or []
-        model = list_widget.get_model()
-        list_widget.get_selection().unselect_all()
-        model.clear()
-
-        vadj = self.widget("vol-scroll").get_vadjustment()
-        vscroll_percent = vadj.get_value() // max(vadj.get_upper(), 1)
+        if not pool:
+            self._set_vol_rows([])
+            return
 
-        paths = []
-        for vol in vols:
-            try:
-                paths.append(vol.get_target_path())
-            except Exception:  # pragma: no cover
-                log.debug("Error getting target path for '%s'", vol, exc_info=True)
-                paths.append(None)
-        names_list = DeviceDisk.paths_in_use_by(pool.conn.get_backend(), paths)
+        self._start_thread(
+            self._populate_vols_thread,
+            "Volume list populate %s" % pool.get_name(),
+            args=(pool, self._vol_populate_id),
+        )
 
-        for vol, path, names in zip(vols, paths, names_list):
+    def _populate_vols_thread(self, pool, populate_id):
+        pooltype = pool.get_type()
+        rows = []
+        for vol in pool.get_volumes():
             try:
-                name = vol.get_pretty_name(pool.get_type())
-                cap = str(vol.get_capacity())
-                sizestr = vol.get_pretty_capacity()
-                fmt = vol.get_format() or ""
+                path = vol.get_target_path()
+                row = [None] * VOL_NUM_COLUMNS
+                row[VOL_COLUMN_HANDLE] = vol
+                row[VOL_COLUMN_NAME] = vol.get_pretty_name(pooltype)
+                row[VOL_COLUMN_SIZESTR] = vol.get_pretty_capacity()
+                row[VOL_COLUMN_CAPACITY] = str(vol.get_capacity())
+                row[VOL_COLUMN_FORMAT] = vol.get_format() or ""
             except Exception:  # pragma: no cover
                 log.debug("Error getting volume info for '%s', hiding it", vol, exc_info=True)
                 continue
+            rows.append((row, path))
 
-            namestr = None
-            try:
+        self.idle_add(self._populate_vols_rows_cb, populate_id, [r[0] for r in rows])
+
+        inuse = {}
+        try:
+            paths = [r[1] for r in rows]
+            names_list = DeviceDisk.paths_in_use_by(pool.conn.get_backend(), paths)
+            for (row, path), names in zip(rows, names_list):
                 if path:
-                    namestr = ", ".join(names)
-                    if not namestr:
-                        namestr = None
-            except Exception:  # pragma: no cover
-                log.exception("Failed to determine if storage volume in use.")
+                    inuse[row[VOL_COLUMN_HANDLE]] = ", ".join(names) or None
+        except Exception:  # pragma: no cover
+            log.exception("Failed to determine if storage volume in use.")
+
+        self.idle_add(self._populate_vols_inuse_cb, populate_id, inuse)
 
+    def _populate_vols_rows_cb(self, populate_id, rows):
+        if not self.conn or populate_id != self._vol_populate_id:
+            return
+        self._set_vol_rows(rows)
+
+        if self._vol_select_pending:
+            vol = self._vol_select_pending
+            if any(row[VOL_COLUMN_HANDLE] == vol for row in rows):
+                self._vol_select_pending = None
+                uiutil.set_list_selection(self.widget("vol-list"), vol)
+
+    def _populate_vols_inuse_cb(self, populate_id, inuse):
+        if not self.conn or populate_id != self._vol_populate_id:
+            return
+        for row in self.widget("vol-list").get_model():
+            namestr = inuse.get(row[VOL_COLUMN_HANDLE])
+            if row[VOL_COLUMN_INUSEBY] != namestr:
+                row[VOL_COLUMN_INUSEBY] = namestr
+
+    def _set_vol_rows(self, rows):
+        """
+        Update the volume model to match the passed rows, keyed by the
+        volume handle. Existing rows are updated in place so selection
+        and scroll position survive a refresh. The 'in use by' column
+        keeps its old value until the background check fills it in.
+        """
+        list_widget = self.widget("vol-list")
+        model = list_widget.get_model()
+
+        for row in rows:
             sensitive = True
             if self._vol_sensitive_cb:
-                sensitive = self._vol_sensitive_cb(fmt)
-
-            row = [None] * VOL_NUM_COLUMNS
-            row[VOL_COLUMN_HANDLE] = vol
-            row[VOL_COLUMN_NAME] = name
-            row[VOL_COLUMN_SIZESTR] = sizestr
-            row[VOL_COLUMN_CAPACITY] = cap
-            row[VOL_COLUMN_FORMAT] = fmt
-            row[VOL_COLUMN_INUSEBY] = namestr
+                sensitive = self._vol_sensitive_cb(row[VOL_COLUMN_FORMAT])
             row[VOL_COLUMN_SENSITIVE] = sensitive
-            model.append(row)
 
-        def _reset_vscroll_position():
-            vadj.set_value(vadj.get_upper() * vscroll_percent)
+        newrows = dict((row[VOL_COLUMN_HANDLE], row) for row in rows)
+        oldvols = set(row[VOL_COLUMN_HANDLE] for row in model)
 
-        self.idle_add(_reset_vscroll_position)
+        if not oldvols.intersection(newrows):
+            # Nothing to preserve, like when switching pools. Rebuild
+            # with the model detached, which is much faster for big lists
+            list_widget.set_model(None)
+            try:
+                model.clear()
+                for row in rows:
+                    model.append(row)
+            finally:
+                list_widget.set_model(model)
+            return
+
+        for treerow in list(model):
+            vol = treerow[VOL_COLUMN_HANDLE]
+            if vol not in newrows:
+                model.remove(treerow.iter)
+                continue
+
+            newrow = newrows.pop(vol)
+            for col in range(VOL_NUM_COLUMNS):
+                if col == VOL_COLUMN_INUSEBY:
+                    continue
+                if treerow[col] != newrow[col]:
+                    treerow[col] = newrow[col]
+
+        for row in newrows.values():
+            model.append(row)
 
     ##########################
     # Pool lifecycle actions #
@@ -617,13 +679,17 @@ class vmmHostStorage(vmmGObjectUI):
         self.emit("volume-chosen", self._current_vol())
 
     def _vol_created_cb(self, src, pool, vol):
-        # The vol list will have already been updated, since this
-        # signal arrives only after pool-refreshed. So all we do here is
-        # select the vol we just created.
+        # This signal arrives after pool-refreshed, but the vol list is
+        # populated in the background so the new vol may not be listed
+        # yet. In that case select it once it shows up.
         curpool = self._current_pool()
         if curpool != pool:
             return  # pragma: no cover
-        uiutil.set_list_selection(self.widget("vol-list"), vol)
+        model = self.widget("vol-list").get_model()
+        if any(row[VOL_COLUMN_HANDLE] == vol for row in model):
+            uiutil.set_list_selection(self.widget("vol-list"), vol)
+        else:
+            self._vol_select_pending = vol
 
     def _pool_autostart_changed_cb(self, src):
         self._enable_pool_apply(EDIT_POOL_AUTOSTART)
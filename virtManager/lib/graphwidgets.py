@@ -3,6 +3,9 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import collections
+
+import cairo
 from gi.repository import GObject
 from gi.repository import Gtk
 
@@ -104,6 +107,10 @@ class CellRendererSparkline(Gtk.CellRenderer):
         ),
     }
 
+    # Max number of rendered graphs we keep around. Roughly one per
+    # visible row, so this comfortably covers large VM lists
+    CACHE_SIZE = 1024
+
     def __init__(self):
         Gtk.CellRenderer.__init__(self)
 
@@ -112,19 +119,40 @@ class CellRendererSparkline(Gtk.CellRenderer):
         self.filled = True
         self.reversed = False
         self.rgb = None
+        self._surface_cache = collections.OrderedDict()
+
+    def _cache_key(self, width, height):
+        return (
+            tuple(self.data_array),
+            self.reversed,
+            width,
+            height,
+            self.get_property("xalign"),
+            (BASECOLOR.red, BASECOLOR.green, BASECOLOR.blue),
+        )
 
-    def do_render(self, cr, widget, background_area, cell_area, flags):
-        # cr                : Cairo context
-        # widget            : GtkWidget instance
-        # background_area   : GdkRectangle: entire cell area
-        # cell_area         : GdkRectangle: area normally rendered by cell
-        # flags             : flags that affect rendering
-        # flags = Gtk.CELL_RENDERER_SELECTED, Gtk.CELL_RENDERER_PRELIT,
-        #         Gtk.CELL_RENDERER_INSENSITIVE or Gtk.CELL_RENDERER_SORTED
-        ignore = widget
-        ignore = background_area
-        ignore = flags
-
+    def _lookup_surface(self, cr, width, height):
+        """
+        Return a cached surface with the rendered graph, or render a
+        new one. The renderer is shared by every row in the view, and
+        every expose redraws every visible row, but the data only
+        changes once per stats tick, so this saves most of the work.
+        """
+        key = self._cache_key(width, height)
+        surface = self._surface_cache.get(key)
+        if surface:
+            self._surface_cache.move_to_end(key)
+            return surface
+
+        surface = cr.get_target().create_similar(cairo.CONTENT_COLOR_ALPHA, width, height)
+        self._render_graph(cairo.Context(surface), width, height)
+
+        self._surface_cache[key] = surface
+        while len(self._surface_cache) > self.CACHE_SIZE:
+            self._surface_cache.popitem(last=False)
+        return surface
+
+    def _render_graph(self, cr, width, height):
         # Indent of the gray border around the graph
         BORDER_PADDING = 2
         # Indent of graph from border
@@ -132,14 +160,14 @@ class CellRendererSparkline(Gtk.CellRenderer):
         GRAPH_PAD = BORDER_PADDING + GRAPH_INDENT
 
         # We don't use yalign, since we expand to the entire height
-        ignore = self.get_property("yalign")
         xalign = self.get_property("xalign")
+        cell_x = 0
 
         # Set up graphing bounds
-        graph_x = cell_area.x + GRAPH_PAD
-        graph_y = cell_area.y + GRAPH_PAD
-        graph_width = cell_area.width - (GRAPH_PAD * 2)
-        graph_height = cell_area.height - (GRAPH_PAD * 2)
+        graph_x = GRAPH_PAD
+        graph_y = GRAPH_PAD
+        graph_width = width - (GRAPH_PAD * 2)
+        graph_height = height - (GRAPH_PAD * 2)
 
         pixels_per_point = graph_width // max(1, len(self.data_array) - 1)
 
@@ -151,10 +179,10 @@ class CellRendererSparkline(Gtk.CellRenderer):
         border_width = graph_width + (GRAPH_INDENT * 2)
 
         # Align the widget
-        empty_space = cell_area.width - border_width - (BORDER_PADDING * 2)
+        empty_space = width - border_width - (BORDER_PADDING * 2)
         if empty_space:
             xalign_space = int(empty_space * xalign)
-            cell_area.x += xalign_space
+            cell_x += xalign_space
             graph_x += xalign_space
 
         cr.set_line_width(3)
@@ -164,20 +192,20 @@ class CellRendererSparkline(Gtk.CellRenderer):
         # Draw gray graph border
         cr.set_source_rgb(0.8828125, 0.8671875, 0.8671875)
         cr.rectangle(
-            cell_area.x + BORDER_PADDING,
-            cell_area.y + BORDER_PADDING,
+            cell_x + BORDER_PADDING,
+            BORDER_PADDING,
             border_width,
-            cell_area.height - (BORDER_PADDING * 2),
+            height - (BORDER_PADDING * 2),
         )
         cr.stroke()
 
         # Fill in basecolor box inside graph outline
         cr.set_source_rgb(BASECOLOR.red, BASECOLOR.green, BASECOLOR.blue)
         cr.rectangle(
-            cell_area.x + BORDER_PADDING,
-            cell_area.y + BORDER_PADDING,
+            cell_x + BORDER_PADDING,
+            BORDER_PADDING,
             border_width,
-            cell_area.height - (BORDER_PADDING * 2),
+            height - (BORDER_PADDING * 2),
         )
         cr.fill()
 
@@ -202,20 +230,34 @@ class CellRendererSparkline(Gtk.CellRenderer):
 
             points.append((x, y))
 
-        cell_area.x = graph_x
-        cell_area.y = graph_y
-        cell_area.width = graph_width
-        cell_area.height = graph_height
-
         # Set color to dark blue for the actual sparkline
         cr.set_line_width(2)
         cr.set_source_rgb(0.421875, 0.640625, 0.73046875)
-        draw_line(cr, cell_area.y, cell_area.height, points)
+        draw_line(cr, graph_y, graph_height, points)
 
         # Set color to light blue for the fill
         cr.set_source_rgba(0.71484375, 0.84765625, 0.89453125, 0.5)
 
-        draw_fill(cr, cell_area.x, cell_area.y, cell_area.width, cell_area.height, points)
+        draw_fill(cr, graph_x, graph_y, graph_width, graph_height, points)
+
+    def do_render(self, cr, widget, background_area, cell_area, flags):
+        # cr                : Cairo context
+        # widget            : GtkWidget instance
+        # background_area   : GdkRectangle: entire cell area
+        # cell_area         : GdkRectangle: area normally rendered by cell
+        # flags             : flags that affect rendering
+        # flags = Gtk.CELL_RENDERER_SELECTED, Gtk.CELL_RENDERER_PRELIT,
+        #         Gtk.CELL_RENDERER_INSENSITIVE or Gtk.CELL_RENDERER_SORTED
+        ignore = widget
+        ignore = background_area
+        ignore = flags
+
+        if cell_area.width <= 0 or cell_area.height <= 0:
+            return  # pragma: no cover
+
+        surface = self._lookup_surface(cr, cell_area.width, cell_area.height)
+        cr.set_source_surface(surface, cell_area.x, cell_area.y)
+        cr.paint()
         return
 
     def do_get_size(self, widget, cell_area=None):
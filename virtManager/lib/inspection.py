@@ -3,8 +3,12 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
-import queue
+import base64
+import json
+import os
+import tempfile
 import threading
+import time
 
 from virtinst import log
 
@@ -19,10 +23,13 @@ def _inspection_error(_errstr):
     return data
 
 
-def _make_fake_data(vm):
+def _make_fake_data(vm, delay=0):
     """
-    Return fake vmmInspectionData for use with the test driver
+    Return fake vmmInspectionData for use with the test driver. delay
+    mimics the time a real appliance launch takes
     """
+    if delay:
+        time.sleep(delay)
     if not vm.xmlobj.devices.disk:
         return _inspection_error("Fake test error no disks")
 
@@ -43,8 +50,6 @@ def _make_fake_data(vm):
 
     data.applications = []
     for prefix in ["test_app1_", "test_app2_"]:
-        import time
-
         app = vmmInspectionApplication()
         if "app1" in prefix:
             app.display_name = prefix + "display_name"
@@ -60,6 +65,91 @@ def _make_fake_data(vm):
     return data
 
 
+######################
+# On disk data cache #
+######################
+
+_CACHE_VERSION = 1
+
+
+def _get_disk_key(vm):
+    """
+    Return [path, size, mtime, inode] for every disk image of vm, or
+    None if any of them can't be stat'd. Cached data is only reused
+    if this matches exactly.
+    """
+    ret = []
+    for disk in vm.xmlobj.devices.disk:
+        path = disk.get_source_path()
+        if not path:
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        ret.append([path, st.st_size, st.st_mtime_ns, st.st_ino])
+    return ret
+
+
+def _data_to_dict(data):
+    ret = dict(vars(data))
+    if data.icon:
+        ret["icon"] = base64.b64encode(data.icon).decode("ascii")
+    if data.applications is not None:
+        ret["applications"] = [dict(vars(app)) for app in data.applications]
+    return ret
+
+
+def _data_from_dict(datadict):
+    data = vmmInspectionData()
+    for key, val in datadict.items():
+        if hasattr(data, key):
+            setattr(data, key, val)
+    if data.icon:
+        data.icon = base64.b64decode(data.icon)
+    if data.applications is not None:
+        apps = []
+        for appdict in data.applications:
+            app = vmmInspectionApplication()
+            for key, val in appdict.items():
+                if hasattr(app, key):
+                    setattr(app, key, val)
+            apps.append(app)
+        data.applications = apps
+    return data
+
+
+def _get_cache_path(vm):
+    return os.path.join(vm.get_cache_dir(), "inspection.json")
+
+
+def _load_cached_data(vm, diskkey):
+    path = _get_cache_path(vm)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            content = json.load(f)
+        if content.get("version") != _CACHE_VERSION or content.get("disks") != diskkey:
+            return None
+        return _data_from_dict(content["data"])
+    except FileNotFoundError:
+        return None
+    except Exception as e:  # pragma: no cover
+        log.debug("Error reading inspection cache %s: %s", path, e)
+        return None
+
+
+def _save_cached_data(vm, diskkey, data):
+    path = _get_cache_path(vm)
+    content = {"version": _CACHE_VERSION, "disks": diskkey, "data": _data_to_dict(data)}
+    try:
+        fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".inspection")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(content, f)
+        os.replace(tmppath, path)
+    except Exception as e:  # pragma: no cover
+        log.debug("Error writing inspection cache %s: %s", path, e)
+
+
 def _perform_inspection(conn, vm):  # pragma: no cover
     """
     Perform the actual guestfs interaction and return results in
@@ -218,9 +308,14 @@ class vmmInspection(vmmGObject):
         vmmGObject.__init__(self)
         self._cleanup_on_app_close()
 
-        self._thread = None
+        self._threads = []
+        self._stopping = False
 
-        self._q = queue.Queue()
+        # (uri, vmname) -> True if this was an explicit refresh request.
+        # Guarded by _cond, along with _active
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._active = set()
         self._cached_data = {}
         self._uris = []
 
@@ -239,7 +334,8 @@ class vmmInspection(vmmGObject):
 
     def _cleanup(self):
         self._stop()
-        self._q = queue.Queue()
+        with self._cond:
+            self._pending = {}
         self._cached_data = {}
 
     def _conn_added_cb(self, connmanager, conn):
@@ -262,33 +358,87 @@ class vmmInspection(vmmGObject):
             log.debug("ignore libvirt/guestfs temporary VM %s", name)
             return
 
-        self._q.put((conn.get_uri(), vm.get_name()))
+        self._queue_vm(conn.get_uri(), vm.get_name())
+
+    def _queue_vm(self, uri, vmname, refresh=False):
+        with self._cond:
+            key = (uri, vmname)
+            self._pending[key] = refresh or self._pending.get(key, False)
+            self._cond.notify()
 
     def _start(self):
-        self._thread = threading.Thread(name="inspection thread", target=self._run)
-        self._thread.daemon = True
-        self._thread.start()
+        nworkers = self.config.get_libguestfs_inspection_workers()
+        log.debug("Starting %d libguestfs inspection threads", nworkers)
+        for idx in range(nworkers):
+            thread = threading.Thread(name="inspection thread %d" % idx, target=self._run)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
 
     def _stop(self):
-        if self._thread is None:
+        if not self._threads:
             return
 
-        self._q.put(None)
-        self._thread = None
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._threads = []
+
+    def _get_visible_vms(self):
+        """
+        Return the set of (uri, vmname) the user can currently see
+        """
+        ret = set()
+        for uri, conn in list(vmmConnectionManager.get_instance().conns.items()):
+            ret.update((uri, vm.get_name()) for vm in conn.list_vms() if conn.is_vm_visible(vm))
+        return ret
+
+    def _pick_pending(self):
+        """
+        Pick the next VM to inspect: explicit refresh requests first,
+        then VMs the user can currently see, then everything else in
+        the order it was queued. VMs already being inspected by another
+        thread are skipped. Must be called with _cond held
+        """
+        keys = [key for key in self._pending if key not in self._active]
+        if not keys:
+            return None
+
+        for key in keys:
+            if self._pending[key]:
+                return key
+        visible = self._get_visible_vms()
+        for key in keys:
+            if key in visible:
+                return key
+        return keys[0]
 
     def _run(self):
         # Process everything on the queue.  If the queue is empty when
         # called, block.
         while True:
-            data = self._q.get()
-            if data is None:
-                log.debug("libguestfs queue vm=None, exiting thread")
-                return
-            uri, vmname = data
-            self._process_vm(uri, vmname)
-            self._q.task_done()
+            with self._cond:
+                key = None
+                while not self._stopping:
+                    key = self._pick_pending()
+                    if key:
+                        break
+                    self._cond.wait()
+                if self._stopping:
+                    log.debug("libguestfs inspection stopping, exiting thread")
+                    return
+                refresh = self._pending.pop(key)
+                self._active.add(key)
 
-    def _process_vm(self, uri, vmname):
+            try:
+                uri, vmname = key
+                self._process_vm(uri, vmname, refresh)
+            finally:
+                with self._cond:
+                    self._active.discard(key)
+                    self._cond.notify_all()
+
+    def _process_vm(self, uri, vmname, refresh):
         connmanager = vmmConnectionManager.get_instance()
         conn = connmanager.conns.get(uri)
         if not conn:
@@ -313,6 +463,16 @@ class vmmInspection(vmmGObject):
                 _set_vm_inspection_data(data)
             return
 
+        diskkey = None
+        if not conn.is_remote():
+            diskkey = _get_disk_key(vm)
+        if diskkey is not None and not refresh:
+            data = _load_cached_data(vm, diskkey)
+            if data:
+                log.debug("Found on disk cached data for %s", prettyvm)
+                _set_vm_inspection_data(data)
+                return
+
         try:
             data = self._inspect_vm(conn, vm)
         except Exception as e:  # pragma: no cover
@@ -320,15 +480,17 @@ class vmmInspection(vmmGObject):
             log.exception("%s: exception while processing", prettyvm)
 
         _set_vm_inspection_data(data)
+        if diskkey is not None and data and not data.errorstr:
+            _save_cached_data(vm, diskkey, data)
 
     def _inspect_vm(self, conn, vm):
-        if self._thread is None:
+        if self._stopping:
             return  # pragma: no cover
 
         if conn.is_remote():  # pragma: no cover
             return _inspection_error(_("Cannot inspect VM on remote connection"))
         if conn.is_test():
-            return _make_fake_data(vm)
+            return _make_fake_data(vm, self.config.CLITestOptions.inspection_delay)
 
         return _perform_inspection(conn, vm)  # pragma: no cover
 
@@ -344,4 +506,4 @@ class vmmInspection(vmmGObject):
         # as the data itself will be replaced once the new
         # results are available.
         self._cached_data.pop(vm.get_uuid(), None)
-        self._q.put((vm.conn.get_uri(), vm.get_name()))
+        self._queue_vm(vm.conn.get_uri(), vm.get_name(), refresh=True)
@@ -0,0 +1,222 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import threading
+
+from virtinst import log
+from virtinst.progress import Meter
+
+
+def jobinfo_to_stats(jobinfo):
+    """
+    Convert the list returned by virDomain.jobInfo to the dict format
+    returned by virDomain.jobStats
+    """
+    keys = [
+        "type",
+        "time_elapsed",
+        "time_remaining",
+        "data_total",
+        "data_processed",
+        "data_remaining",
+        "memory_total",
+        "memory_processed",
+        "memory_remaining",
+        "file_total",
+        "file_processed",
+        "file_remaining",
+    ]
+    return {key: val for key, val in zip(keys, jobinfo) if val is not None}
+
+
+class JobProgress:
+    """
+    Reports the progress of a long running domain job, like save or
+    migrate, to a meter from a background thread.
+
+    Without job events we poll get_stats, starting at min_interval and
+    doubling the interval up to max_interval while the stats aren't
+    changing. Any change drops back to min_interval.
+
+    If the connection delivers migration iteration and job completed
+    events, callers pass them to job_event. An iteration event fetches
+    the stats right away and resets the backoff, a completed event ends
+    reporting. Polling continues as a backstop with a longer
+    max_interval, since a single pass over guest memory can take a long
+    time. Stats changes don't reset the backoff in this mode, during a
+    migration data_remaining changes on every poll.
+
+    meter can be None to only watch the job. iteration_cb(iteration)
+    is called when the job reports a new memory iteration, until it
+    returns True.
+    """
+
+    def __init__(
+        self,
+        get_stats,
+        meter,
+        text,
+        use_events=False,
+        min_interval=0.5,
+        max_interval=4,
+        event_max_interval=8,
+        iteration_cb=None,
+    ):
+        self._get_stats = get_stats
+        self._meter = meter
+        self._text = text
+        self._iteration_cb = iteration_cb
+        self.use_events = use_events
+        self.min_interval = min_interval
+        self.max_interval = event_max_interval if use_events else max_interval
+
+        self._parent = threading.current_thread()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._last_key = None
+        self._last_iteration = None
+
+        # Number of get_stats calls, for the test suite
+        self.fetch_count = 0
+
+    def _is_finished(self):
+        return self._stopping or not self._parent.is_alive()
+
+    def _wait(self, timeout):
+        woken = self._wakeup.wait(timeout)
+        self._wakeup.clear()
+        return woken
+
+    def _get_details(self, stats):
+        remaining = stats.get("data_remaining")
+        rate = stats.get("memory_dirty_rate")
+        if remaining is None:
+            return None  # pragma: no cover
+
+        fremaining = Meter.format_number(remaining)
+        if not rate:
+            return _("%(remaining)sB left") % {"remaining": fremaining}
+
+        # Dirty rate is reported in pages per second
+        rate *= stats.get("memory_page_size") or 4096
+        return _("%(remaining)sB left, dirtying %(rate)sB/s") % {
+            "remaining": fremaining,
+            "rate": Meter.format_number(rate),
+        }
+
+    def _check_iteration(self, stats):
+        iteration = stats.get("memory_iteration")
+        if not self._iteration_cb or not iteration or iteration == self._last_iteration:
+            return
+        self._last_iteration = iteration
+
+        try:
+            done = self._iteration_cb(iteration)
+        except Exception:  # pragma: no cover
+            log.exception("Error in job iteration callback")
+            done = True
+        if done:
+            self._iteration_cb = None
+
+    def _report(self, stats):
+        """
+        Pass stats to the meter. Returns True if they changed since
+        the last report.
+        """
+        data_total = int(stats.get("data_total") or 0)
+        data_remaining = int(stats.get("data_remaining") or 0)
+
+        # data_total is 0 if the job hasn't started yet
+        if not data_total:
+            return False
+
+        key = (
+            data_total,
+            data_remaining,
+            stats.get("memory_iteration"),
+            stats.get("memory_dirty_rate"),
+        )
+        self._check_iteration(stats)
+        changed = key != self._last_key
+        self._last_key = key
+
+        if not self._meter:
+            return changed
+        if not self._meter.is_started():
+            self._meter.start(self._text, data_total)
+        self._meter.set_details(self._get_details(stats))
+        self._meter.update(data_total - data_remaining)
+        return changed
+
+    def _run(self):
+        interval = self.min_interval
+        while True:
+            woken = self._wait(interval)
+            if self._is_finished():
+                return
+
+            try:
+                self.fetch_count += 1
+                changed = self._report(self._get_stats())
+            except Exception:  # pragma: no cover
+                log.exception("Error fetching job stats")
+                return
+
+            if woken or (changed and not self.use_events):
+                interval = self.min_interval
+            else:
+                interval = min(interval * 2, self.max_interval)
+
+    ##############
+    # Public API #
+    ##############
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="job progress reporting")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    def job_event(self, completed=False):
+        """
+        Called from the libvirt event loop for migration iteration and
+        job completed events
+        """
+        if completed:
+            self._stopping = True
+        self._wakeup.set()
+
+
+class JobProgressRegistry:
+    """
+    Maps domain UUID to the JobProgress reporting on its current job,
+    so vmmConnection can route job events to it. Migration runs on a
+    temporary vmmDomain rather than the one the connection tracks, so
+    this can't be looked up through the connection's VM list.
+    """
+
+    def __init__(self):
+        self._progress = {}
+        self._lock = threading.Lock()
+
+    def register(self, uuid, progress):
+        with self._lock:
+            self._progress[uuid] = progress
+
+    def unregister(self, uuid, progress):
+        with self._lock:
+            if self._progress.get(uuid) is progress:
+                self._progress.pop(uuid)
+
+    def job_event(self, uuid, completed):
+        with self._lock:
+            progress = self._progress.get(uuid)
+        if progress:
+            progress.job_event(completed=completed)
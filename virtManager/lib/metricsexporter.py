@@ -0,0 +1,330 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import http.server
+import os
+import socket
+import socketserver
+import stat
+import threading
+
+from virtinst import log
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_TICK_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+class TickHistogram:
+    """
+    Cumulative histogram of connection tick durations, in seconds.
+    Updated from the tick thread, read from the exporter thread.
+    """
+
+    def __init__(self, buckets=None):
+        self.buckets = list(buckets or _TICK_BUCKETS)
+        self._counts = [0] * len(self.buckets)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._sum += seconds
+            self._count += 1
+            for idx, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    self._counts[idx] += 1
+
+    def snapshot(self):
+        """
+        Return (list of (le, cumulative count), sum, count)
+        """
+        with self._lock:
+            return list(zip(self.buckets, self._counts)), self._sum, self._count
+
+
+###################
+# Text formatting #
+###################
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    return ",".join('%s="%s"' % (key, _escape(val)) for key, val in labels.items())
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    def __init__(self, name, mtype, helpstr):
+        self.name = name
+        self.mtype = mtype
+        self.helpstr = helpstr
+        self.samples = []
+
+    def add(self, labels, value, suffix=""):
+        self.samples.append((suffix, labels, value))
+
+    def format(self):
+        lines = [
+            "# HELP %s %s" % (self.name, self.helpstr),
+            "# TYPE %s %s" % (self.name, self.mtype),
+        ]
+        for suffix, labels, value in self.samples:
+            lines.append(
+                "%s%s{%s} %s" % (self.name, suffix, _format_labels(labels), _format_value(value))
+            )
+        return "\n".join(lines)
+
+
+# (metric name, type, help, stats record name, scale)
+_DOMAIN_METRICS = [
+    ("domain_cpu_host_percent", "gauge", "Domain CPU usage of the host", "cpuHostPercent", 1),
+    ("domain_cpu_guest_percent", "gauge", "Domain CPU usage of its vCPUs", "cpuGuestPercent", 1),
+    ("domain_cpu_time_seconds_total", "counter", "Domain CPU time", "cpuTimeAbs", 1e-9),
+    ("domain_memory_used_bytes", "gauge", "Domain memory in use", "curmem", 1024),
+    ("domain_memory_used_percent", "gauge", "Domain memory in use", "currMemPercent", 1),
+    ("domain_disk_read_bytes_total", "counter", "Domain disk bytes read", "diskRdKiB", 1024),
+    ("domain_disk_write_bytes_total", "counter", "Domain disk bytes written", "diskWrKiB", 1024),
+    ("domain_net_rx_bytes_total", "counter", "Domain network bytes received", "netRxKiB", 1024),
+    ("domain_net_tx_bytes_total", "counter", "Domain network bytes sent", "netTxKiB", 1024),
+    ("domain_disk_read_bytes_per_second", "gauge", "Domain disk read rate", "diskRdRate", 1024),
+    ("domain_disk_write_bytes_per_second", "gauge", "Domain disk write rate", "diskWrRate", 1024),
+    ("domain_net_rx_bytes_per_second", "gauge", "Domain network receive rate", "netRxRate", 1024),
+    ("domain_net_tx_bytes_per_second", "gauge", "Domain network send rate", "netTxRate", 1024),
+]
+
+_HOST_METRICS = [
+    ("host_cpu_percent", "gauge", "Host CPU usage by all domains", "cpuHostPercent", 1),
+    ("host_memory_used_bytes", "gauge", "Host memory used by all domains", "memory", 1024),
+    ("host_memory_used_percent", "gauge", "Host memory used by all domains", "memoryPercent", 1),
+    ("host_disk_read_bytes_per_second", "gauge", "Host disk read rate", "diskRdRate", 1024),
+    ("host_disk_write_bytes_per_second", "gauge", "Host disk write rate", "diskWrRate", 1024),
+    ("host_net_rx_bytes_per_second", "gauge", "Host network receive rate", "netRxRate", 1024),
+    ("host_net_tx_bytes_per_second", "gauge", "Host network send rate", "netTxRate", 1024),
+]
+
+
+def _make_metrics(table):
+    return [
+        (_Metric("virt_manager_" + name, mtype, helpstr), record, scale)
+        for name, mtype, helpstr, record, scale in table
+    ]
+
+
+def format_metrics(conns):
+    """
+    Render the latest stats for every connection in Prometheus text
+    exposition format.
+
+    :param conns: list of objects with the vmmConnection stats API. Only
+        already sampled values are used, this never calls into libvirt,
+        but it must run from the main loop like other users of that API.
+    """
+    up = _Metric("virt_manager_connection_up", "gauge", "Whether the connection is open")
+    active = _Metric("virt_manager_domain_active", "gauge", "Whether the domain is running")
+    domain_metrics = _make_metrics(_DOMAIN_METRICS)
+    host_metrics = _make_metrics(_HOST_METRICS)
+    tick = _Metric(
+        "virt_manager_connection_tick_duration_seconds",
+        "histogram",
+        "Time spent polling the connection per tick",
+    )
+
+    for conn in conns:
+        uri = conn.get_uri()
+        connlabels = {"uri": uri}
+        is_active = conn.is_active()
+        up.add(connlabels, int(is_active))
+
+        buckets, total, count = conn.tick_histogram.snapshot()
+        for bound, bucketcount in buckets:
+            tick.add(dict(connlabels, le=_format_value(bound)), bucketcount, "_bucket")
+        tick.add(dict(connlabels, le="+Inf"), count, "_bucket")
+        tick.add(connlabels, total, "_sum")
+        tick.add(connlabels, count, "_count")
+
+        if not is_active:
+            continue
+
+        for metric, record, scale in host_metrics:
+            metric.add(connlabels, conn.get_stats_record(record) * scale)
+
+        for vm in conn.list_vms():
+            labels = {"uri": uri, "domain": vm.get_name(), "uuid": vm.get_uuid()}
+            active.add(labels, int(vm.is_active()))
+            statslist = conn.statsmanager.get_vm_statslist(vm)
+            for metric, record, scale in domain_metrics:
+                metric.add(labels, (statslist.get_record(record) or 0) * scale)
+
+    allmetrics = [up, active, tick]
+    allmetrics += [m[0] for m in host_metrics]
+    allmetrics += [m[0] for m in domain_metrics]
+    return "\n".join(m.format() for m in allmetrics) + "\n"
+
+
+##########
+# Server #
+##########
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ["/", "/metrics"]:
+            self.send_error(404)
+            return
+
+        try:
+            body = self.server.get_metrics_cb().encode("utf-8")
+        except Exception:  # pragma: no cover
+            log.debug("Error formatting metrics", exc_info=True)
+            self.send_error(500)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket clients don't have a (host, port) address
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "unix"  # pragma: no cover
+
+    def log_message(self, fmt, *args):
+        # pylint: disable=arguments-differ
+        log.debug("metrics exporter: %s", fmt % args)
+
+
+class _TCPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class _TCP6Server(_TCPServer):
+    address_family = socket.AF_INET6
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def parse_listen_address(address):
+    """
+    Parse the listen setting. Accepted formats are
+    'unix:/path/to/socket', 'PORT', or 'HOST:PORT'. Only loopback
+    addresses are accepted for TCP, this is not meant to be exposed.
+
+    :returns: ("unix", path) or ("tcp", (host, port))
+    """
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:") :]
+
+    host = "127.0.0.1"
+    port = address
+    if ":" in address:
+        host, port = address.rsplit(":", 1)
+        host = host.strip("[]")
+    if host not in ["127.0.0.1", "::1", "localhost"]:
+        raise ValueError(_("Metrics can only be exported on localhost, not '%s'") % host)
+    return "tcp", (host, int(port))
+
+
+def _socket_id(path):
+    """
+    Return (st_dev, st_ino) if path is a unix socket, None if it
+    doesn't exist. Raise ValueError if it's anything else
+    """
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return None
+    if not stat.S_ISSOCK(st.st_mode):
+        raise ValueError(_("Metrics socket path '%s' exists and is not a socket") % path)
+    return st.st_dev, st.st_ino
+
+
+class MetricsExporter:
+    """
+    Serve the output of format_metrics over HTTP from a daemon thread.
+
+    The server thread only hands out the text rendered by the last
+    refresh() call, which the owner calls from the main loop after
+    stats are sampled, so connection and VM objects are never touched
+    from the server thread.
+    """
+
+    def __init__(self, address, get_conns_cb):
+        self._address = address
+        self._get_conns_cb = get_conns_cb
+        self._server = None
+        self._thread = None
+        # Identity of the unix socket we created, so stop() doesn't
+        # remove anything else
+        self._socket_id = None
+        self._text = ""
+        self._lock = threading.Lock()
+
+    def _get_metrics(self):
+        with self._lock:
+            return self._text
+
+    def refresh(self):
+        """
+        Render a new metrics snapshot for the server thread
+        """
+        text = format_metrics(list(self._get_conns_cb()))
+        with self._lock:
+            self._text = text
+
+    def start(self):
+        family, addr = parse_listen_address(self._address)
+        if family == "unix":
+            if _socket_id(addr):
+                # Left behind by an earlier run
+                os.unlink(addr)
+            server = _UnixServer(addr, _RequestHandler)
+            self._socket_id = _socket_id(addr)
+        elif ":" in addr[0]:
+            server = _TCP6Server(addr, _RequestHandler)
+        else:
+            server = _TCPServer(addr, _RequestHandler)
+        self.refresh()
+
+        server.get_metrics_cb = self._get_metrics
+        self._server = server
+        self._thread = threading.Thread(
+            name="Metrics exporter", target=server.serve_forever, args=()
+        )
+        self._thread.daemon = True
+        self._thread.start()
+        log.debug("Exporting metrics on %s", self._address)
+
+    def stop(self):
+        if not self._server:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        family, addr = parse_listen_address(self._address)
+        if family == "unix" and self._socket_id:
+            try:
+                if _socket_id(addr) == self._socket_id:
+                    os.unlink(addr)
+            except ValueError:  # pragma: no cover
+                pass
+        self._socket_id = None
+        self._server = None
+        self._thread = None
+
+    def get_server_address(self):
+        return self._server.server_address
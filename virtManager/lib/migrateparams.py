@@ -0,0 +1,146 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import libvirt
+
+
+def _param(name, default):
+    # Older python bindings may not define the newer param constants
+    return getattr(libvirt, name, default)
+
+
+class MigrateTuning:
+    """
+    Performance options for migrating large or busy guests.
+
+    :param parallel_connections: Number of multifd connections to move
+        memory over, 0 to not use parallel migration
+    :param compression: One of COMPRESSION_METHODS, or None
+    :param compression_level: Level for the mt, zlib and zstd methods,
+        None for the hypervisor default
+    :param auto_converge: Throttle guest vCPUs if memory is dirtied
+        faster than it can be transferred
+    :param postcopy: Allow switching to post-copy. vmmDomain.migrate
+        switches once the first pass over guest memory completes
+    """
+
+    COMPRESSION_METHODS = ["xbzrle", "mt", "zlib", "zstd"]
+    # Only usable with parallel migration
+    MULTIFD_COMPRESSION_METHODS = ["zlib", "zstd"]
+
+    def __init__(
+        self,
+        parallel_connections=0,
+        compression=None,
+        compression_level=None,
+        auto_converge=False,
+        postcopy=False,
+    ):
+        self.parallel_connections = parallel_connections
+        self.compression = compression
+        self.compression_level = compression_level
+        self.auto_converge = auto_converge
+        self.postcopy = postcopy
+
+
+def _build_tuning_args(support, tuning, params):
+    flags = 0
+
+    def _check(supported, msg):
+        if not supported:
+            raise ValueError(msg)
+
+    if tuning.parallel_connections:
+        _check(
+            support.domain_migrate_parallel(),
+            _("Parallel migration is not supported by this connection."),
+        )
+        flags |= libvirt.VIR_MIGRATE_PARALLEL
+        key = _param("VIR_MIGRATE_PARAM_PARALLEL_CONNECTIONS", "parallel.connections")
+        params[key] = int(tuning.parallel_connections)
+
+    method = tuning.compression
+    if method:
+        if method not in MigrateTuning.COMPRESSION_METHODS:
+            raise ValueError(_("Unknown migration compression method '%s'.") % method)
+        _check(
+            support.domain_migrate_compression(),
+            _("Migration compression is not supported by this connection."),
+        )
+        if method in MigrateTuning.MULTIFD_COMPRESSION_METHODS:
+            _check(
+                tuning.parallel_connections,
+                _("Compression method '%s' requires parallel migration.") % method,
+            )
+            _check(
+                support.domain_migrate_multifd_compression(),
+                _("Compression method '%s' is not supported by this connection.") % method,
+            )
+
+        flags |= libvirt.VIR_MIGRATE_COMPRESSED
+        params[_param("VIR_MIGRATE_PARAM_COMPRESSION", "compression")] = method
+
+        level = tuning.compression_level
+        if level is not None and method != "xbzrle":
+            paramname = "VIR_MIGRATE_PARAM_COMPRESSION_%s_LEVEL" % method.upper()
+            params[_param(paramname, "compression.%s.level" % method)] = int(level)
+
+    if tuning.auto_converge:
+        _check(
+            support.domain_migrate_auto_converge(),
+            _("Migration auto-converge is not supported by this connection."),
+        )
+        flags |= libvirt.VIR_MIGRATE_AUTO_CONVERGE
+
+    if tuning.postcopy:
+        _check(
+            support.domain_migrate_postcopy(),
+            _("Post-copy migration is not supported by this connection."),
+        )
+        flags |= libvirt.VIR_MIGRATE_POSTCOPY
+
+    return flags
+
+
+def build_migrate_args(
+    support,
+    dest_uri=None,
+    tunnel=False,
+    unsafe=False,
+    temporary=False,
+    xml=None,
+    bandwidth=None,
+    tuning=None,
+):
+    """
+    Build the flags and params for virDomain.migrate3/migrateToURI3.
+    Requested tuning options are checked against the passed SupportCache,
+    raising ValueError if the connection can't do them.
+
+    :returns: (flags, params) tuple
+    """
+    flags = libvirt.VIR_MIGRATE_LIVE
+    params = {}
+
+    if not temporary:
+        flags |= libvirt.VIR_MIGRATE_PERSIST_DEST
+        flags |= libvirt.VIR_MIGRATE_UNDEFINE_SOURCE
+
+    if tunnel:
+        flags |= libvirt.VIR_MIGRATE_PEER2PEER
+        flags |= libvirt.VIR_MIGRATE_TUNNELLED
+
+    if unsafe:
+        flags |= libvirt.VIR_MIGRATE_UNSAFE
+
+    if dest_uri and not tunnel:
+        params[libvirt.VIR_MIGRATE_PARAM_URI] = dest_uri
+    if xml:
+        params[libvirt.VIR_MIGRATE_PARAM_DEST_XML] = xml
+    if bandwidth:
+        params[libvirt.VIR_MIGRATE_PARAM_BANDWIDTH] = int(bandwidth)
+
+    if tuning:
+        flags |= _build_tuning_args(support, tuning, params)
+
+    return flags, params
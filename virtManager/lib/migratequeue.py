@@ -0,0 +1,263 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import threading
+import time
+import traceback
+
+from virtinst import log
+
+
+class MigrationResult:
+    """
+    Outcome of a single migration in a MigrationQueue
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELED = "canceled"
+
+    def __init__(self, key):
+        self.key = key
+        self.status = self.PENDING
+        self.error = None
+        self.details = None
+
+    def is_finished(self):
+        return self.status in [self.DONE, self.FAILED, self.CANCELED]
+
+
+class _ItemMeter:
+    """
+    Meter handed to each migration, it feeds the aggregate progress
+    of the queue instead of a progress bar
+    """
+
+    def __init__(self, queue, key):
+        self._queue = queue
+        self._key = key
+        self._size = None
+
+    def is_started(self):
+        return self._size is not None
+
+    def start(self, text, size):
+        ignore = text
+        self._size = size or None
+
+    def update(self, new_total):
+        if self._size:
+            self._queue.report_progress(self._key, new_total / self._size)
+
+    def set_details(self, details):
+        ignore = details
+
+    def end(self):
+        pass
+
+
+class MigrationQueue:
+    """
+    Runs a batch of migrations with at most concurrency of them in
+    flight at once, in the order the keys were passed.
+
+    migrate_cb(key, meter) performs the migration for a single key,
+    reporting progress to meter like vmmDomain.migrate does. An exception
+    raised from it fails only that key, the rest of the batch carries
+    on. cancel() drops everything still pending, and calls abort_cb(key)
+    for every migration in flight. A migration whose job hadn't started
+    yet when it was aborted is aborted again on its next progress report,
+    and abort_cb is retried every _abort_retry_interval seconds until it
+    succeeds or the migration ends.
+
+    weights maps key to a relative size, like guest memory, used to
+    combine per key progress into get_progress. progress_cb(queue) is
+    called from the worker threads on every state or progress change.
+    """
+
+    # Seconds between abort_cb retries after a failed abort
+    _abort_retry_interval = 0.5
+
+    def __init__(
+        self, keys, migrate_cb, concurrency=1, weights=None, abort_cb=None, progress_cb=None
+    ):
+        self._keys = list(keys)
+        self._migrate_cb = migrate_cb
+        self._abort_cb = abort_cb
+        self.progress_cb = progress_cb
+        self.concurrency = max(int(concurrency), 1)
+
+        weights = weights or {}
+        self._weights = {key: max(weights.get(key) or 1, 1) for key in self._keys}
+        self._results = {key: MigrationResult(key) for key in self._keys}
+        self._fractions = dict.fromkeys(self._keys, 0)
+        self._pending = list(self._keys)
+        self._canceled = False
+        # Keys abort_cb succeeded for
+        self._aborted = set()
+        self._lock = threading.Lock()
+
+    def _notify(self):
+        if self.progress_cb:
+            self.progress_cb(self)
+
+    def _pop_pending(self):
+        with self._lock:
+            if self._canceled or not self._pending:
+                return None
+            key = self._pending.pop(0)
+            self._results[key].status = MigrationResult.RUNNING
+            return key
+
+    def _abort(self, key, retry=False):
+        """
+        Call abort_cb for key, recording it in _aborted if it succeeded
+        """
+        if not self._abort_cb:
+            return False
+        try:
+            self._abort_cb(key)
+        except Exception as e:
+            if not retry:
+                log.exception("Error aborting migration of %s", key)
+            else:
+                log.debug("Retrying abort of migration %s failed: %s", key, e)
+            return False
+        with self._lock:
+            self._aborted.add(key)
+        return True
+
+    def _needs_abort(self, key):
+        with self._lock:
+            return (
+                self._canceled
+                and key not in self._aborted
+                and self._results[key].status == MigrationResult.RUNNING
+            )
+
+    def _retry_abort(self, key):
+        """
+        The abort most likely came before the migration job started.
+        Keep retrying until it succeeds or the migration ends, in case
+        the job never reports progress
+        """
+        while True:
+            time.sleep(self._abort_retry_interval)
+            if not self._needs_abort(key):
+                return
+            if self._abort(key, retry=True):
+                return
+
+    def _migrate_one(self, key):
+        result = self._results[key]
+        with self._lock:
+            canceled = self._canceled
+            if canceled:
+                result.status = MigrationResult.CANCELED
+                self._fractions[key] = 1
+        if canceled:
+            # Canceled after the key was popped, don't start it at all
+            self._notify()
+            return
+
+        try:
+            self._migrate_cb(key, _ItemMeter(self, key))
+            status = MigrationResult.DONE
+        except Exception as e:
+            log.debug("Migration of %s failed", key, exc_info=True)
+            result.error = str(e)
+            result.details = "".join(traceback.format_exc())
+            status = MigrationResult.FAILED
+
+        with self._lock:
+            if status == MigrationResult.FAILED and self._canceled:
+                status = MigrationResult.CANCELED
+            result.status = status
+            self._fractions[key] = 1
+        self._notify()
+
+    def _worker(self):
+        while True:
+            key = self._pop_pending()
+            if key is None:
+                return
+            self._notify()
+            self._migrate_one(key)
+
+    ##############
+    # Public API #
+    ##############
+
+    def run(self):
+        """
+        Migrate everything, blocking until the whole batch is finished.
+        Returns the list of MigrationResult, in key order
+        """
+        nthreads = min(self.concurrency, len(self._keys))
+        threads = [
+            threading.Thread(target=self._worker, name="migration queue %d" % idx)
+            for idx in range(nthreads)
+        ]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.get_results()
+
+    def report_progress(self, key, fraction):
+        with self._lock:
+            if self._results[key].status != MigrationResult.RUNNING:
+                return
+            self._fractions[key] = min(max(fraction, 0), 1)
+
+        if self._needs_abort(key):
+            # cancel() came before the job was started, so the abort
+            # failed. The job reports progress now, abort it again
+            log.debug("Retrying abort of migration %s", key)
+            self._abort(key, retry=True)
+        self._notify()
+
+    def cancel(self):
+        with self._lock:
+            self._canceled = True
+            for key in self._pending:
+                self._results[key].status = MigrationResult.CANCELED
+                self._fractions[key] = 1
+            self._pending = []
+            running = [
+                key
+                for key, result in self._results.items()
+                if result.status == MigrationResult.RUNNING
+            ]
+
+        for key in running:
+            if not self._abort(key) and self._abort_cb:
+                thread = threading.Thread(
+                    target=self._retry_abort, args=(key,), name="migration abort %s" % key
+                )
+                thread.daemon = True
+                thread.start()
+        self._notify()
+
+    def get_results(self):
+        with self._lock:
+            return [self._results[key] for key in self._keys]
+
+    def get_progress(self):
+        """
+        Return (fraction, finished count, failed count) for the batch
+        """
+        with self._lock:
+            total = sum(self._weights.values())
+            done = sum(self._weights[key] * self._fractions[key] for key in self._keys)
+            results = list(self._results.values())
+
+        finished = len([r for r in results if r.is_finished()])
+        failed = len([r for r in results if r.status == MigrationResult.FAILED])
+        return done / total, finished, failed
+
+    def get_total_weight(self):
+        return sum(self._weights.values())
@@ -0,0 +1,139 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import threading
+
+
+class _PollState:
+    def __init__(self):
+        self.factor = 1
+        self.next_tick = 0
+        self.visible_tick = None
+
+
+class PollScheduler:
+    """
+    Decides which VMs get their stats sampled on a given connection tick.
+
+    VMs shown in an open details window, or in a visible manager row,
+    are sampled on every tick. Everything else backs off exponentially:
+    each sample doubles the number of ticks until the next one, up to
+    max_backoff for idle VMs, and busy_max_backoff for VMs that showed
+    activity in their last sample. Lifecycle events reset a VM to the
+    full rate.
+
+    Keys are opaque, vmmConnection uses the domain UUID. Ticks are
+    counted by start_tick, so intervals follow the stats update interval.
+    The UI thread updates visibility while the tick thread schedules,
+    so state changes are serialized with a lock.
+    """
+
+    def __init__(self, max_backoff=16, busy_max_backoff=4):
+        self.max_backoff = max(max_backoff, 1)
+        self.busy_max_backoff = max(min(busy_max_backoff, self.max_backoff), 1)
+
+        self._tick = 0
+        self._states = {}
+        self._watched = {}
+        self._lock = threading.Lock()
+
+    def _get_state(self, key):
+        if key not in self._states:
+            self._states[key] = _PollState()
+        return self._states[key]
+
+    def _is_visible(self, key):
+        if self._watched.get(key):
+            return True
+        state = self._states.get(key)
+        # Rows reported visible on the previous tick still count, the
+        # manager refreshes visibility after each sample
+        return bool(
+            state and state.visible_tick is not None and self._tick - state.visible_tick <= 1
+        )
+
+    ###########################
+    # UI side visibility APIs #
+    ###########################
+
+    def watch(self, key):
+        """
+        Sample key at full rate until a matching unwatch, used for
+        open details windows
+        """
+        with self._lock:
+            self._watched[key] = self._watched.get(key, 0) + 1
+            self._get_state(key).next_tick = 0
+
+    def unwatch(self, key):
+        with self._lock:
+            count = self._watched.get(key, 0) - 1
+            if count <= 0:
+                self._watched.pop(key, None)
+            else:
+                self._watched[key] = count
+
+    def set_visible(self, keys):
+        """
+        Report the full list of keys currently visible in the manager
+        """
+        with self._lock:
+            for key in keys:
+                state = self._get_state(key)
+                if state.visible_tick is None or self._tick - state.visible_tick > 1:
+                    # Newly visible, sample on the next tick
+                    state.next_tick = 0
+                state.visible_tick = self._tick
+
+    def is_visible(self, key):
+        with self._lock:
+            return self._is_visible(key)
+
+    def reset(self, key):
+        """
+        Go back to the full rate for key, ex. on a lifecycle event
+        """
+        with self._lock:
+            state = self._get_state(key)
+            state.factor = 1
+            state.next_tick = 0
+
+    def forget(self, key):
+        with self._lock:
+            self._states.pop(key, None)
+            self._watched.pop(key, None)
+
+    ##############################
+    # Tick thread scheduling API #
+    ##############################
+
+    def start_tick(self):
+        with self._lock:
+            self._tick += 1
+
+    def is_due(self, key):
+        with self._lock:
+            if self._is_visible(key):
+                return True
+            return self._tick >= self._get_state(key).next_tick
+
+    def sampled(self, key, idle):
+        """
+        Record that key was sampled on this tick
+
+        :param idle: Whether the sample showed the VM doing nothing
+        """
+        with self._lock:
+            state = self._get_state(key)
+            if self._is_visible(key):
+                state.factor = 1
+            else:
+                cap = idle and self.max_backoff or self.busy_max_backoff
+                state.factor = min(state.factor * 2, cap)
+            state.next_tick = self._tick + state.factor
+
+    def get_factor(self, key):
+        with self._lock:
+            if self._is_visible(key):
+                return 1
+            return self._get_state(key).factor
@@ -0,0 +1,266 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import mmap
+import os
+import struct
+import threading
+import time
+
+from virtinst import log
+
+
+# Every persisted metric gets its own column in each slot. VM records
+# use currMemPercent, host records use memoryPercent, that mirrors the
+# naming used by the in memory stats records.
+COLUMNS = [
+    "cpuHostPercent",
+    "cpuGuestPercent",
+    "currMemPercent",
+    "memoryPercent",
+    "diskRdRate",
+    "diskWrRate",
+    "netRxRate",
+    "netTxRate",
+]
+
+# Slot ID used for the host wide connection stats. It always gets
+# slot index 0, so it can't be recycled by VMs
+HOST_SLOT = "host"
+_HOST_IDX = 0
+
+_MAGIC = b"VMMSTAT2"
+# magic, nslots, nsamples, ncolumns
+_HEADER = struct.Struct("<8sIII")
+# uuid, head index, sample count, last update timestamp
+_SLOT_HEADER = struct.Struct("<36sIId")
+_VALUE = struct.Struct("<d")
+
+
+class StatsHistoryFile:
+    """
+    Fixed size ring buffer of stats samples, stored in a memory mapped
+    file. The file is split into slots, one per VM UUID plus one for
+    the host. Each slot holds a ring of nsamples entries for the
+    timestamp and every entry in COLUMNS, stored column by column.
+
+    The file size only depends on nslots and nsamples, so disk usage is
+    bounded up front. The first slot is reserved for the host. When all
+    the VM slots are in use, the least recently updated one is recycled,
+    but only if it hasn't been written for min_idle seconds. Otherwise
+    the new VM isn't persisted: with more running VMs than slots,
+    recycling on every tick would leave no VM with any history.
+
+    Writes happen from the connection tick thread, reads from the UI
+    thread, so everything is serialized with a lock.
+    """
+
+    def __init__(self, path, nslots, nsamples, min_idle=0):
+        self._path = path
+        self._min_idle = min_idle
+        self._nslots = max(nslots, 2)
+        self._nsamples = max(nsamples, 1)
+        self._lock = threading.Lock()
+        self._slot_size = _SLOT_HEADER.size + (
+            _VALUE.size * (len(COLUMNS) + 1) * self._nsamples
+        )
+        self._file_size = _HEADER.size + (self._slot_size * self._nslots)
+
+        self._fd = None
+        self._map = None
+        self._slots = {}
+        # slot index -> last update timestamp, so recycling doesn't
+        # need to read every slot header
+        self._lastupdate = {}
+        # Slot IDs we had no free slot for, to only log that once
+        self._unslotted = set()
+        self._open()
+
+    def _open(self):
+        fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            wantheader = _HEADER.pack(_MAGIC, self._nslots, self._nsamples, len(COLUMNS))
+            header = os.pread(fd, _HEADER.size, 0)
+            if header != wantheader or os.fstat(fd).st_size != self._file_size:
+                # Different layout or first use, start from scratch
+                log.debug("Initializing stats history file %s", self._path)
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, self._file_size)
+                os.pwrite(fd, wantheader, 0)
+
+            self._map = mmap.mmap(fd, self._file_size)
+            self._fd = fd
+        except Exception:
+            os.close(fd)
+            raise
+
+        for idx in range(self._nslots):
+            slotid, dummy, dummy, lastupdate = self._read_slot_header(idx)
+            if slotid:
+                self._slots[slotid] = idx
+                self._lastupdate[idx] = lastupdate
+
+    def close(self):
+        with self._lock:
+            if not self._map:
+                return
+            self._map.flush()
+            self._map.close()
+            os.close(self._fd)
+            self._map = None
+            self._fd = None
+
+    ###################
+    # Private helpers #
+    ###################
+
+    def _slot_offset(self, idx):
+        return _HEADER.size + (idx * self._slot_size)
+
+    def _column_offset(self, idx, column, sample):
+        # Column 0 is the timestamp
+        return (
+            self._slot_offset(idx)
+            + _SLOT_HEADER.size
+            + (_VALUE.size * ((column * self._nsamples) + sample))
+        )
+
+    def _read_slot_header(self, idx):
+        rawid, head, count, lastupdate = _SLOT_HEADER.unpack_from(
+            self._map, self._slot_offset(idx)
+        )
+        slotid = rawid.rstrip(b"\0").decode("ascii", "replace")
+        return slotid, head, count, lastupdate
+
+    def _write_slot_header(self, idx, slotid, head, count, lastupdate):
+        _SLOT_HEADER.pack_into(
+            self._map,
+            self._slot_offset(idx),
+            slotid.encode("ascii"),
+            head,
+            count,
+            lastupdate,
+        )
+
+    def _allocate_slot(self, slotid, timestamp):
+        """
+        Return the slot index for the new slotid, or None if every
+        slot is in use
+        """
+        if slotid == HOST_SLOT:
+            idx = _HOST_IDX
+        else:
+            vmslots = range(_HOST_IDX + 1, self._nslots)
+            free = [idx for idx in vmslots if idx not in self._lastupdate]
+            if free:
+                idx = free[0]
+            else:
+                # Recycle the slot that has gone the longest without data
+                idx = min(vmslots, key=lambda i: self._lastupdate[i])
+                if timestamp - self._lastupdate[idx] <= self._min_idle:
+                    if slotid not in self._unslotted:
+                        self._unslotted.add(slotid)
+                        log.debug("stats history: no free slot for %s", slotid)
+                    return None
+                oldid = self._read_slot_header(idx)[0]
+                log.debug("stats history: recycling slot for %s", oldid)
+                self._slots.pop(oldid, None)
+                self._unslotted.discard(slotid)
+
+        self._write_slot_header(idx, slotid, 0, 0, 0)
+        self._slots[slotid] = idx
+        self._lastupdate[idx] = 0
+        return idx
+
+    ##############
+    # Public API #
+    ##############
+
+    def append(self, slotid, timestamp, values):
+        """
+        Record a sample for slotid
+
+        :param values: dict of COLUMNS name -> value. Missing entries are
+            stored as 0
+        """
+        with self._lock:
+            if not self._map:
+                return
+            idx = self._slots.get(slotid)
+            if idx is None:
+                idx = self._allocate_slot(slotid, timestamp)
+            if idx is None:
+                return
+
+            dummy, head, count, dummy = self._read_slot_header(idx)
+            _VALUE.pack_into(self._map, self._column_offset(idx, 0, head), timestamp)
+            for colidx, name in enumerate(COLUMNS):
+                _VALUE.pack_into(
+                    self._map,
+                    self._column_offset(idx, colidx + 1, head),
+                    float(values.get(name) or 0),
+                )
+
+            head = (head + 1) % self._nsamples
+            count = min(count + 1, self._nsamples)
+            self._write_slot_header(idx, slotid, head, count, timestamp)
+            self._lastupdate[idx] = timestamp
+
+    def read(self, slotid, since=None):
+        """
+        Return the samples for slotid, newest first, as a list of dicts
+        with a 'timestamp' key plus every name in COLUMNS.
+
+        :param since: Skip samples with a timestamp older than this
+        """
+        with self._lock:
+            if not self._map:
+                return []
+            idx = self._slots.get(slotid)
+            if idx is None:
+                return []
+
+            dummy, head, count, dummy = self._read_slot_header(idx)
+            ret = []
+            for offset in range(1, count + 1):
+                sample = (head - offset) % self._nsamples
+                timestamp = _VALUE.unpack_from(self._map, self._column_offset(idx, 0, sample))[0]
+                if since is not None and timestamp < since:
+                    break
+
+                record = {"timestamp": timestamp}
+                for colidx, name in enumerate(COLUMNS):
+                    record[name] = _VALUE.unpack_from(
+                        self._map, self._column_offset(idx, colidx + 1, sample)
+                    )[0]
+                ret.append(record)
+            return ret
+
+    def list_slots(self):
+        with self._lock:
+            return list(self._slots)
+
+
+def open_history_file(path, retention, interval, nslots):
+    """
+    Open the history file at path sized to keep retention seconds of
+    samples taken every interval seconds. Errors are logged and None
+    is returned, persistent stats are a nice to have.
+    """
+    nsamples = int(retention // max(interval, 1)) + 1
+    try:
+        # A slot is only handed to another VM once all its samples
+        # are past retention
+        return StatsHistoryFile(path, nslots, nsamples, min_idle=retention)
+    except Exception as e:  # pragma: no cover
+        log.debug("Failed to open stats history file %s: %s", path, e)
+        return None
+
+
+def filter_history(history, before, retention):
+    """
+    Return the entries from history (newest first) which are older than
+    the timestamp before, and not older than retention seconds from now
+    """
+    oldest = time.time() - retention
+    return [r for r in history if oldest <= r["timestamp"] < before]
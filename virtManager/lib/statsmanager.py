@@ -3,6 +3,7 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import os
 import re
 import time
 
@@ -11,6 +12,7 @@ import libvirt
 from virtinst import log
 
 from ..baseclass import vmmGObject
+from . import statshistory
 
 
 class _VMStatsRecord:
@@ -56,10 +58,16 @@ class _VMStatsList(vmmGObject):
     Tracks a list of VMStatsRecords for a single VM
     """
 
-    def __init__(self):
+    def __init__(self, history=None, uuid=None):
         vmmGObject.__init__(self)
         self._stats = []
 
+        # Optional on disk StatsHistoryFile. Only read when the live
+        # stats don't fill the requested vector
+        self._history = history
+        self._uuid = uuid
+        self._history_records = None
+
         self.diskRdMaxRate = 10.0
         self.diskWrMaxRate = 10.0
         self.netRxMaxRate = 10.0
@@ -99,6 +107,28 @@ class _VMStatsList(vmmGObject):
 
         self._stats.insert(0, newstats)
 
+        if self._history:
+            self._history.append(
+                self._uuid,
+                newstats.timestamp,
+                {name: getattr(newstats, name, 0) for name in statshistory.COLUMNS},
+            )
+
+    def _get_history_records(self):
+        """
+        Return persisted samples that predate our in memory stats,
+        newest first. The file is only read once per VM.
+        """
+        if not self._history:
+            return []
+        if self._history_records is None:
+            self._history_records = self._history.read(self._uuid)
+
+        before = self._stats and self._stats[-1].timestamp or time.time()
+        return statshistory.filter_history(
+            self._history_records, before, self.config.get_stats_history_retention()
+        )
+
     def get_record(self, record_name):
         if not self._stats:
             return 0
@@ -110,9 +140,15 @@ class _VMStatsList(vmmGObject):
         if limit is not None:
             statslen = min(statslen, limit)
 
+        history = []
+        if len(self._stats) < statslen:
+            history = self._get_history_records()
+
         for i in range(statslen):
             if i < len(self._stats):
                 vector.append(getattr(self._stats[i], record_name) / ceil)
+            elif i - len(self._stats) < len(history):
+                vector.append(history[i - len(self._stats)][record_name] / ceil)
             else:
                 vector.append(0)
         return vector
@@ -137,7 +173,11 @@ class vmmStatsManager(vmmGObject):
         self._disk_stats_lxc_supported = True
         self._mem_stats_supported = True
 
+        self._history = None
+        self._host_history_records = None
+
     def _cleanup(self):
+        self.close_history()
         for statslist in self._vm_stats.values():
             statslist.cleanup()
         self._latest_all_stats = None
@@ -391,7 +431,7 @@ class vmmStatsManager(vmmGObject):
     # alltats handling #
     ####################
 
-    def _get_all_stats(self, conn):
+    def _get_all_stats(self, conn, vms):
         # test conn supports allstats as of 2021, but for test coverage
         # purposes lets still use the old stats code for the test driver
         if not self._all_stats_supported or conn.is_test():
@@ -414,7 +454,15 @@ class vmmStatsManager(vmmGObject):
         ret = {}
         try:
             timestamp = time.time()
-            rawallstats = conn.get_backend().getAllDomainStats(statflags, 0)
+            if vms is None:
+                rawallstats = conn.get_backend().getAllDomainStats(statflags, 0)
+            elif vms:
+                # Adaptive polling only wants a subset of VMs this tick
+                rawallstats = conn.get_backend().domainListGetStats(
+                    [vm.get_backend() for vm in vms], statflags, 0
+                )
+            else:
+                rawallstats = []
 
             # Reformat the output to be a bit more friendly
             for dom, domallstats in rawallstats:
@@ -428,6 +476,55 @@ class vmmStatsManager(vmmGObject):
                 log.debug("Error call getAllDomainStats(): %s", err)
         return ret
 
+    ##########################
+    # On disk stats history #
+    ##########################
+
+    def open_history(self, conn):
+        """
+        Open the persistent stats history file for conn, if the user
+        enabled it
+        """
+        if self._history or not self.config.get_stats_history_persist():
+            return
+        path = os.path.join(conn.get_cache_dir(), "stats-history")
+        self._history = statshistory.open_history_file(
+            path,
+            self.config.get_stats_history_retention(),
+            self.config.get_stats_update_interval(),
+            self.config.get_stats_history_max_vms() + 1,
+        )
+
+    def close_history(self):
+        if not self._history:
+            return
+
+        self._history.close()
+        self._history = None
+        self._host_history_records = None
+
+        # Drop the stats lists referencing the closed file
+        for statslist in self._vm_stats.values():
+            statslist.cleanup()
+        self._vm_stats = {}
+
+    def record_host_stats(self, stats):
+        if self._history:
+            self._history.append(statshistory.HOST_SLOT, stats["timestamp"], stats)
+
+    def get_host_history(self, before):
+        """
+        Return persisted host stats older than the before timestamp,
+        newest first
+        """
+        if not self._history:
+            return []
+        if self._host_history_records is None:
+            self._host_history_records = self._history.read(statshistory.HOST_SLOT)
+        return statshistory.filter_history(
+            self._host_history_records, before, self.config.get_stats_history_retention()
+        )
+
     ##############
     # Public API #
     ##############
@@ -457,10 +554,13 @@ class vmmStatsManager(vmmGObject):
         )
         self.get_vm_statslist(vm).append_stats(newstats)
 
-    def cache_all_stats(self, conn):
-        self._latest_all_stats = self._get_all_stats(conn)
+    def cache_all_stats(self, conn, vms=None):
+        """
+        Fetch bulk stats for the passed list of vms, or all VMs if None
+        """
+        self._latest_all_stats = self._get_all_stats(conn, vms)
 
     def get_vm_statslist(self, vm):
         if vm.get_name() not in self._vm_stats:
-            self._vm_stats[vm.get_name()] = _VMStatsList()
+            self._vm_stats[vm.get_name()] = _VMStatsList(self._history, vm.get_uuid())
         return self._vm_stats[vm.get_name()]
@@ -9,13 +9,18 @@
 import os
 
 
-def fake_job_info():
+def fake_job_stats():
     import random
 
     total = 1024 * 1024 * 1024
     fakepcent = random.choice(range(1, 100))
     remaining = (total / 100) * fakepcent
-    return [None, None, None, total, None, remaining]
+    return {
+        "data_total": total,
+        "data_remaining": remaining,
+        "memory_dirty_rate": random.choice(range(0, 10000)),
+        "memory_page_size": 4096,
+    }
 
 
 def fake_interface_addresses(iface, source):
@@ -178,6 +183,8 @@ class CLITestOptionsClass:
 
     * enable-libguestfs: Force enable the libguestfs gsetting
     * disable-libguestfs: Force disable the libguestfs gsetting
+    * inspection-delay=SECONDS: Sleep for SECONDS in each fake
+        libguestfs inspection, to test the inspection worker pool
 
     * test-managed-save: Triggers a couple conditions for testing
         managed save issues
@@ -236,6 +243,7 @@ class CLITestOptionsClass:
         self.break_setfacl = _get("break-setfacl")
         self.disable_libguestfs = _get("disable-libguestfs")
         self.enable_libguestfs = _get("enable-libguestfs")
+        self.inspection_delay = float(_get_value("inspection-delay") or 0)
         self.test_managed_save = _get("test-managed-save")
         self.test_vm_run_fail = _get("test-vm-run-fail")
         self.test_update_device_fail = _get("test-update-device-fail")
@@ -278,6 +286,7 @@ class CLITestOptionsClass:
 
             virtinst.diskbackend.SETFACL = "getfacl"
             # pylint: disable=protected-access
+            virtinst.diskbackend._set_acl_xattr = fake_search
             virtinst.diskbackend._fix_perms_chmod = fake_search
 
         if self.disable_name_validation:
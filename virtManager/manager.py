@@ -314,6 +314,7 @@ class vmmManager(vmmGObjectUI):
 
         model = Gtk.TreeStore(*rowtypes)
         vmlist.set_model(model)
+        vmlist.get_vadjustment().connect("value-changed", self._vm_list_scrolled_cb)
         vmlist.set_tooltip_column(ROW_HINT)
         vmlist.set_headers_visible(True)
         vmlist.set_level_indentation(-(_style_get_prop(vmlist, "expander-size") + 3))
@@ -744,6 +745,30 @@ class vmmManager(vmmGObjectUI):
         self.max_net_rate = max(self.max_net_rate, conn.network_traffic_max_rate())
 
         self.model.row_changed(row.path, row.iter)
+        self._report_visible_vms(conn)
+
+    def _report_visible_vms(self, conn):
+        """
+        Tell conn which of its VMs are in visible rows, so adaptive
+        stats polling can sample them at the full rate
+        """
+        vmlist = self.widget("vm-list")
+        row = self.get_row(conn)
+        visrange = self.is_visible() and vmlist.get_visible_range() or None
+
+        vms = []
+        if row and visrange and vmlist.row_expanded(row.path):
+            start, end = visrange
+            for child in row.iterchildren():
+                if start.compare(child.path) <= 0 and child.path.compare(end) <= 0:
+                    vms.append(child[ROW_HANDLE])
+        conn.set_stats_visible_vms(vms)
+
+    def _vm_list_scrolled_cb(self, src):
+        ignore = src
+        for row in self.model:
+            if row[ROW_IS_CONN] and row[ROW_IS_CONN_CONNECTED]:
+                self._report_visible_vms(row[ROW_HANDLE])
 
     def change_run_text(self, can_restore):
         if can_restore:
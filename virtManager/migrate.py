@@ -4,6 +4,7 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import threading
 import traceback
 
 from gi.repository import Gtk
@@ -13,6 +14,8 @@ from virtinst import log
 from virtinst import xmlutil
 
 from .lib import uiutil
+from .lib.migrateparams import MigrateTuning
+from .lib.migratequeue import MigrationQueue, MigrationResult
 from .asyncjob import vmmAsyncJob
 from .baseclass import vmmGObjectUI
 from .connmanager import vmmConnectionManager
@@ -23,6 +26,8 @@ from .xmleditor import vmmXMLEditor
 NUM_COLS = 3
 (COL_LABEL, COL_URI, COL_CAN_MIGRATE) = range(NUM_COLS)
 
+(BATCH_COL_SELECTED, BATCH_COL_NAME, BATCH_COL_LABEL) = range(3)
+
 
 class vmmMigrateDialog(vmmGObjectUI):
     @classmethod
@@ -52,6 +57,7 @@ class vmmMigrateDialog(vmmGObjectUI):
                 "on_migrate_set_address_toggled": self._set_address_toggled,
                 "on_migrate_set_port_toggled": self._set_port_toggled,
                 "on_migrate_mode_changed": self._mode_changed,
+                "on_migrate_compression_changed": self._compression_changed,
             }
         )
         self.bind_escape_key_close()
@@ -143,6 +149,38 @@ class vmmMigrateDialog(vmmGObjectUI):
 
         self.widget("migrate-dest").emit("changed")
 
+        # Compression combo
+        combo = self.widget("migrate-compression")
+        # label, method, sensitive
+        model = Gtk.ListStore(str, str, bool)
+        model.append([_("None"), None, True])
+        model.append([_("XBZRLE"), "xbzrle", True])
+        model.append([_("Multithreaded"), "mt", True])
+        model.append([_("zlib"), "zlib", True])
+        model.append([_("zstd"), "zstd", True])
+        combo.set_model(model)
+        text = uiutil.init_combo_text_column(combo, 0)
+        combo.add_attribute(text, "sensitive", 2)
+
+        # Batch list: selected, vm name, label
+        batchlist = self.widget("migrate-batch-list")
+        model = Gtk.ListStore(bool, str, str)
+        model.set_sort_column_id(BATCH_COL_LABEL, Gtk.SortType.ASCENDING)
+        batchlist.set_model(model)
+        chkcol = Gtk.TreeViewColumn()
+        batchlist.append_column(chkcol)
+        chkbox = Gtk.CellRendererToggle()
+        chkbox.connect("toggled", self._batch_item_toggled)
+        chkcol.pack_start(chkbox, False)
+        chkcol.add_attribute(chkbox, "active", BATCH_COL_SELECTED)
+        namecol = Gtk.TreeViewColumn()
+        namecol.set_expand(True)
+        batchlist.append_column(namecol)
+        text = Gtk.CellRendererText()
+        text.set_property("ellipsize", Pango.EllipsizeMode.END)
+        namecol.pack_start(text, True)
+        namecol.add_attribute(text, "text", BATCH_COL_LABEL)
+
         self.widget("migrate-mode").set_tooltip_text(
             self.widget("migrate-mode-label").get_tooltip_text()
         )
@@ -152,6 +190,16 @@ class vmmMigrateDialog(vmmGObjectUI):
         self.widget("migrate-temporary").set_tooltip_text(
             self.widget("migrate-temporary-label").get_tooltip_text()
         )
+        self.widget("migrate-bandwidth").set_tooltip_text(
+            self.widget("migrate-bandwidth-label").get_tooltip_text()
+        )
+        self.widget("migrate-concurrency").set_tooltip_text(
+            self.widget("migrate-concurrency-label").get_tooltip_text()
+        )
+        for name in ["parallel", "compression", "auto-converge", "postcopy"]:
+            self.widget("migrate-%s" % name).set_tooltip_text(
+                self.widget("migrate-%s-label" % name).get_tooltip_text()
+            )
 
     def _reset_state(self):
         self._xmleditor.reset_state()
@@ -180,6 +228,9 @@ class vmmMigrateDialog(vmmGObjectUI):
         self.widget("migrate-mode").set_active(0)
         self.widget("migrate-unsafe").set_active(False)
         self.widget("migrate-temporary").set_active(False)
+        self.widget("migrate-bandwidth").set_value(0)
+        self.widget("migrate-concurrency").set_value(2)
+        self._reset_tuning_state()
 
         if self.conn.is_xen():
             # Default xen port is 8002
@@ -189,6 +240,7 @@ class vmmMigrateDialog(vmmGObjectUI):
             self.widget("migrate-port").set_value(49152)
 
         self._populate_destconn()
+        self._populate_batch_list()
 
     #############
     # Listeners #
@@ -261,6 +313,21 @@ class vmmMigrateDialog(vmmGObjectUI):
         self.widget("migrate-port").set_visible(enable)
         self.widget("migrate-port-label").set_visible(not enable)
 
+    def _batch_item_toggled(self, src, path):
+        ignore = src
+        model = self.widget("migrate-batch-list").get_model()
+        row = model[path]
+        row[BATCH_COL_SELECTED] = not row[BATCH_COL_SELECTED]
+
+    def _compression_changed(self, src):
+        method = uiutil.get_list_selection(src, column=1)
+        uses_level = method in ["mt", "zlib", "zstd"]
+        self.widget("migrate-compression-level").set_sensitive(uses_level)
+        self.widget("migrate-compression-level-label").set_sensitive(uses_level)
+        # zstd goes up to 20, the others to 9
+        upper = 20 if method == "zstd" else 9
+        self.widget("migrate-compression-level").get_adjustment().set_upper(upper)
+
     def _is_tunnel_selected(self):
         return uiutil.get_list_selection(self.widget("migrate-mode"), column=1)
 
@@ -315,17 +382,85 @@ class vmmMigrateDialog(vmmGObjectUI):
                 combo.set_active(idx)
                 break
 
+    ##################
+    # tuning helpers #
+    ##################
+
+    def _reset_tuning_state(self):
+        support = self.conn.support
+        unsupported = _("Not supported by this connection.")
+
+        def _gate(name, supported):
+            widget = self.widget("migrate-%s" % name)
+            label = self.widget("migrate-%s-label" % name)
+            widget.set_sensitive(supported)
+            label.set_sensitive(supported)
+            tooltip = label.get_tooltip_text()
+            if not supported:
+                tooltip = unsupported
+            widget.set_tooltip_text(tooltip)
+
+        _gate("parallel", support.domain_migrate_parallel())
+        _gate("compression", support.domain_migrate_compression())
+        _gate("auto-converge", support.domain_migrate_auto_converge())
+        _gate("postcopy", self.vm.supports_migrate_postcopy())
+
+        multifd = bool(support.domain_migrate_multifd_compression())
+        for row in self.widget("migrate-compression").get_model():
+            if row[1] in MigrateTuning.MULTIFD_COMPRESSION_METHODS:
+                row[2] = multifd
+
+        self.widget("migrate-parallel").set_value(0)
+        self.widget("migrate-compression").set_active(0)
+        self.widget("migrate-compression-level").set_value(1)
+        self.widget("migrate-auto-converge").set_active(False)
+        self.widget("migrate-postcopy").set_active(False)
+
+    def _get_tuning(self):
+        compression = uiutil.get_list_selection(self.widget("migrate-compression"), column=1)
+        compression_level = None
+        if self.widget("migrate-compression-level").get_sensitive():
+            compression_level = int(self.widget("migrate-compression-level").get_value())
+
+        return MigrateTuning(
+            parallel_connections=int(self.widget("migrate-parallel").get_value()),
+            compression=compression,
+            compression_level=compression_level,
+            auto_converge=self.widget("migrate-auto-converge").get_active(),
+            postcopy=self.widget("migrate-postcopy").get_active(),
+        )
+
+    ######################
+    # batch list helpers #
+    ######################
+
+    def _populate_batch_list(self):
+        model = self.widget("migrate-batch-list").get_model()
+        model.clear()
+
+        for vm in self.conn.list_vms():
+            if vm == self.vm or not vm.is_active():
+                continue
+            model.append([False, vm.get_name(), vm.get_name_or_title()])
+
+        self.widget("migrate-batch-expander").set_expanded(False)
+        self.widget("migrate-batch-expander").set_visible(bool(len(model)))
+
+    def _get_batch_vmnames(self):
+        model = self.widget("migrate-batch-list").get_model()
+        return [row[BATCH_COL_NAME] for row in model if row[BATCH_COL_SELECTED]]
+
     ####################
     # migrate handling #
     ####################
 
-    def _build_regular_migrate_uri(self):
+    def _build_regular_migrate_uri(self, allow_port=True):
         address = None
         if self.widget("migrate-address").get_visible():
             address = self.widget("migrate-address").get_text()
 
         port = None
-        if self.widget("migrate-port").get_visible():
+        if self.widget("migrate-port").get_visible() and allow_port:
             port = int(self.widget("migrate-port").get_value())
 
         if not address:
@@ -350,6 +485,44 @@ class vmmMigrateDialog(vmmGObjectUI):
             self.conn.schedule_priority_tick(pollvm=True)
             self.close()
 
+    def _finish_batch_cb(self, error, details, destconn, srcconn, queue):
+        # The dialog VM may have been migrated away already, so self.conn
+        # can't be used here
+        self.reset_finish_cursor()
+        destconn.schedule_priority_tick(pollvm=True)
+        srcconn.schedule_priority_tick(pollvm=True)
+
+        if error:  # pragma: no cover
+            error = _("Unable to migrate guests: %s") % error
+            self.err.show_err(error, details=details)
+            return
+
+        results = queue.get_results()
+        report = []
+        for result in results:
+            if result.status == MigrationResult.DONE:
+                outcome = _("Migrated")
+            elif result.status == MigrationResult.FAILED:
+                outcome = _("Failed: %s") % result.error
+            else:
+                outcome = _("Canceled")
+            report.append("%s: %s" % (result.key, outcome))
+        log.debug("Batch migration results:\n%s", "\n".join(report))
+
+        failed = [r for r in results if r.status != MigrationResult.DONE]
+        if not failed:
+            self.close()
+            return
+
+        report += [r.details for r in failed if r.details]
+        error = _("Unable to migrate %(failed)d of %(total)d guests") % {
+            "failed": len(failed),
+            "total": len(results),
+        }
+        self.err.show_err(error, details="\n\n".join(report))
+        if self.vm:
+            self._populate_batch_list()
+
     def _finish(self):
         try:
             xml = None
@@ -364,11 +537,16 @@ class vmmMigrateDialog(vmmGObjectUI):
             tunnel = self._is_tunnel_selected()
             unsafe = self.widget("migrate-unsafe").get_active()
             temporary = self.widget("migrate-temporary").get_active()
+            bandwidth = int(self.widget("migrate-bandwidth").get_value()) or None
+            concurrency = int(self.widget("migrate-concurrency").get_value())
+            tuning = self._get_tuning()
+            batchnames = self._get_batch_vmnames()
 
             if tunnel:
                 uri = self.widget("migrate-tunnel-uri").get_text()
             else:
-                uri = self._build_regular_migrate_uri()
+                # Concurrent migrations can't all listen on the same port
+                uri = self._build_regular_migrate_uri(allow_port=not batchnames)
         except Exception as e:  # pragma: no cover
             details = "".join(traceback.format_exc())
             self.err.show_err((_("Uncaught error validating input: %s") % str(e)), details=details)
@@ -376,16 +554,26 @@ class vmmMigrateDialog(vmmGObjectUI):
 
         self.set_finish_cursor()
 
+        if uri:
+            destlabel += " " + uri
+
+        if batchnames:
+            self._start_batch(
+                [self.vm.get_name()] + batchnames,
+                destconn,
+                destlabel,
+                concurrency,
+                [uri, tunnel, unsafe, temporary, xml, bandwidth, tuning],
+            )
+            return
+
         cancel_cb = None
         if self.vm.supports_domain_job_info():
             cancel_cb = (self._cancel_migration, self.vm)
 
-        if uri:
-            destlabel += " " + uri
-
         progWin = vmmAsyncJob(
             self._async_migrate,
-            [self.vm, destconn, uri, tunnel, unsafe, temporary, xml],
+            [self.vm, destconn, uri, tunnel, unsafe, temporary, xml, bandwidth, tuning],
             self._finish_cb,
             [destconn],
             _("Migrating VM '%s'") % self.vm.get_name(),
@@ -398,6 +586,62 @@ class vmmMigrateDialog(vmmGObjectUI):
         )
         progWin.run()
 
+    def _start_batch(self, vmnames, destconn, destlabel, concurrency, migrate_args):
+        srcconn = self.conn
+        mainname = self.vm.get_name()
+        weights = {}
+        for vmname in vmnames:
+            vm = srcconn.get_vm_by_name(vmname)
+            weights[vmname] = vm and vm.xmlobj.memory or None
+
+        def _migrate_cb(vmname, meter):
+            (uri, tunnel, unsafe, temporary, xml, bandwidth, tuning) = migrate_args
+            if vmname != mainname:
+                xml = None
+            self._migrate_vm(
+                srcconn,
+                vmname,
+                destconn,
+                uri,
+                tunnel,
+                unsafe,
+                temporary,
+                xml,
+                bandwidth,
+                tuning,
+                meter,
+            )
+
+        def _abort_cb(vmname):
+            vm = srcconn.get_vm_by_name(vmname)
+            if vm:
+                vm.abort_job()
+
+        queue = MigrationQueue(
+            vmnames, _migrate_cb, concurrency=concurrency, weights=weights, abort_cb=_abort_cb
+        )
+        log.debug(
+            "Starting batch migration of %s to %s, concurrency=%s",
+            vmnames,
+            destconn.get_uri(),
+            concurrency,
+        )
+
+        progWin = vmmAsyncJob(
+            self._async_migrate_batch,
+            [queue],
+            self._finish_batch_cb,
+            [destconn, srcconn, queue],
+            ngettext("Migrating %d VM", "Migrating %d VMs", len(vmnames)) % len(vmnames),
+            (
+                _("Migrating %(count)d VMs to %(host)s. This may take a while.")
+                % {"count": len(vmnames), "host": destlabel}
+            ),
+            self.topwin,
+            cancel_cb=(self._cancel_batch, queue),
+        )
+        progWin.run()
+
     def _cancel_migration(self, asyncjob, vm):
         log.debug("Cancelling migrate job")
         try:
@@ -409,22 +653,90 @@ class vmmMigrateDialog(vmmGObjectUI):
 
         asyncjob.job_canceled = True  # pragma: no cover
 
-    def _async_migrate(
-        self, asyncjob, origvm, origdconn, migrate_uri, tunnel, unsafe, temporary, xml
+    def _cancel_batch(self, asyncjob, queue):
+        log.debug("Cancelling batch migration")
+        queue.cancel()
+        asyncjob.job_canceled = True
+
+    def _migrate_vm(
+        self,
+        srcconn,
+        vmname,
+        dstconn,
+        migrate_uri,
+        tunnel,
+        unsafe,
+        temporary,
+        xml,
+        bandwidth,
+        tuning,
+        meter,
     ):
-        meter = asyncjob.get_meter()
-
-        srcconn = origvm.conn
-        dstconn = origdconn
-
-        vminst = srcconn.get_backend().lookupByName(origvm.get_name())
+        vminst = srcconn.get_backend().lookupByName(vmname)
         vm = vmmDomain(srcconn, vminst, vminst.UUID())
 
         log.debug(
             "Migrating vm=%s from %s to %s", vm.get_name(), srcconn.get_uri(), dstconn.get_uri()
         )
 
-        vm.migrate(dstconn, migrate_uri, tunnel, unsafe, temporary, xml, meter=meter)
+        vm.migrate(
+            dstconn,
+            migrate_uri,
+            tunnel,
+            unsafe,
+            temporary,
+            xml,
+            meter=meter,
+            bandwidth=bandwidth,
+            tuning=tuning,
+        )
+
+    def _async_migrate(
+        self,
+        asyncjob,
+        origvm,
+        origdconn,
+        migrate_uri,
+        tunnel,
+        unsafe,
+        temporary,
+        xml,
+        bandwidth,
+        tuning,
+    ):
+        meter = asyncjob.get_meter()
+        self._migrate_vm(
+            origvm.conn,
+            origvm.get_name(),
+            origdconn,
+            migrate_uri,
+            tunnel,
+            unsafe,
+            temporary,
+            xml,
+            bandwidth,
+            tuning,
+            meter,
+        )
+
+    def _async_migrate_batch(self, asyncjob, queue):
+        meter = asyncjob.get_meter()
+        total = queue.get_total_weight()
+        lock = threading.Lock()
+
+        def _progress_cb(src):
+            fraction, finished, failed = src.get_progress()
+            with lock:
+                if not meter.is_started():
+                    meter.start(_("Migrating VMs"), total)
+                meter.set_details(
+                    _("%(finished)d of %(count)d finished, %(failed)d failed")
+                    % {"finished": finished, "count": len(src.get_results()), "failed": failed}
+                )
+                meter.update(int(fraction * total))
+
+        queue.progress_cb = _progress_cb
+        queue.run()
 
     ################
     # UI listeners #
@@ -19,7 +19,9 @@ from virtinst import log
 
 from .libvirtobject import vmmLibvirtObject
 from ..baseclass import vmmGObject
+from ..lib.jobprogress import JobProgress, jobinfo_to_stats
 from ..lib.libvirtenummap import LibvirtEnumMap
+from ..lib.migrateparams import build_migrate_args
 from ..lib import testmock
 
 
@@ -27,38 +29,19 @@ class _SENTINEL:
     pass
 
 
-def start_job_progress_thread(vm, meter, progtext):
-    current_thread = threading.current_thread()
+def start_job_progress_thread(vm, meter, progtext, iteration_cb=None):
+    if not vm.supports_domain_job_info():
+        return
 
-    def jobinfo_cb():
-        while True:
-            time.sleep(0.5)
-
-            if not current_thread.is_alive():
-                return
-
-            try:
-                jobinfo = vm.job_info()
-                data_total = int(jobinfo[3])
-                data_remaining = int(jobinfo[5])
-
-                # data_total is 0 if the job hasn't started yet
-                if not data_total:
-                    continue  # pragma: no cover
-
-                if not meter.is_started():
-                    meter.start(progtext, data_total)
-
-                progress = data_total - data_remaining
-                meter.update(progress)
-            except Exception:  # pragma: no cover
-                log.exception("Error calling jobinfo")
-                return
-
-    if vm.supports_domain_job_info():
-        t = threading.Thread(target=jobinfo_cb, name="job progress reporting", args=())
-        t.daemon = True
-        t.start()
+    progress = JobProgress(
+        vm.job_stats,
+        meter,
+        progtext,
+        use_events=vm.conn.using_job_events,
+        iteration_cb=iteration_cb,
+    )
+    vm.set_job_progress(progress)
+    progress.start()
 
 
 class _IPFetcher:
@@ -356,6 +339,7 @@ class vmmDomain(vmmLibvirtObject):
         self._domain_caps = None
         self._status_reason = None
         self._ipfetcher = _IPFetcher()
+        self._job_progress = None
 
         self.managedsave_supported = False
         self._domain_state_supported = False
@@ -463,6 +447,16 @@ class vmmDomain(vmmLibvirtObject):
             return True
         return self.conn.support.domain_job_info(self._backend)
 
+    def supports_migrate_postcopy(self):
+        # The switch to post-copy is triggered from the job progress
+        # thread by the memory iteration counter, which only jobStats
+        # reports
+        if not self.conn.support.domain_migrate_postcopy():
+            return False
+        if self.conn.is_test():
+            return True
+        return bool(self.conn.support.domain_job_stats(self._backend))
+
     def snapshots_supported(self):
         if not self.conn.support.domain_list_snapshots(self._backend):
             return _("Libvirt connection does not support snapshots.")
@@ -1174,12 +1168,26 @@ class vmmDomain(vmmLibvirtObject):
         self._autostart = None
         self.get_autostart()
 
-    def job_info(self):
+    def job_stats(self):
         if self.conn.is_test():
-            return testmock.fake_job_info()
+            return testmock.fake_job_stats()
         # It's tough to hit this via uitests because it depends
         # on the job lasting more than a second
-        return self._backend.jobInfo()  # pragma: no cover
+        if self.conn.support.domain_job_stats(self._backend):  # pragma: no cover
+            return self._backend.jobStats()
+        return jobinfo_to_stats(self._backend.jobInfo())  # pragma: no cover
+
+    def set_job_progress(self, progress):
+        self._stop_job_progress()
+        self._job_progress = progress
+        self.conn.job_progress.register(self.get_uuid(), progress)
+
+    def _stop_job_progress(self):
+        progress = self._job_progress
+        self._job_progress = None
+        if progress:
+            self.conn.job_progress.unregister(self.get_uuid(), progress)
+            progress.stop()
 
     def abort_job(self):
         self._backend.abortJob()
@@ -1487,9 +1495,12 @@ class vmmDomain(vmmLibvirtObject):
         if meter:
             start_job_progress_thread(self, meter, _("Saving domain to disk"))
 
-        if self.config.CLITestOptions.test_managed_save:
-            time.sleep(1.2)
-        self._backend.managedSave(0)
+        try:
+            if self.config.CLITestOptions.test_managed_save:
+                time.sleep(1.2)
+            self._backend.managedSave(0)
+        finally:
+            self._stop_job_progress()
 
     def has_managed_save(self):
         if not self.managedsave_supported:
@@ -1520,59 +1531,79 @@ class vmmDomain(vmmLibvirtObject):
         temporary=False,
         xml=None,
         meter=None,
+        bandwidth=None,
+        tuning=None,
     ):
+        """
+        :param bandwidth: Maximum migration bandwidth in MiB/s
+        :param tuning: Optional MigrateTuning
+        """
         self._cancel_set_time()
         self._install_abort = True
 
-        flags = 0
-        flags |= libvirt.VIR_MIGRATE_LIVE
-
-        if not temporary:
-            flags |= libvirt.VIR_MIGRATE_PERSIST_DEST
-            flags |= libvirt.VIR_MIGRATE_UNDEFINE_SOURCE
-
-        if tunnel:
-            flags |= libvirt.VIR_MIGRATE_PEER2PEER
-            flags |= libvirt.VIR_MIGRATE_TUNNELLED
-
-        if unsafe:
-            flags |= libvirt.VIR_MIGRATE_UNSAFE
+        flags, params = build_migrate_args(
+            self.conn.support,
+            dest_uri=dest_uri,
+            tunnel=tunnel,
+            unsafe=unsafe,
+            temporary=temporary,
+            xml=xml,
+            bandwidth=bandwidth,
+            tuning=tuning,
+        )
+        if tuning and tuning.postcopy and not self.supports_migrate_postcopy():
+            raise ValueError(
+                _("Post-copy migration requires job statistics, not supported by this connection.")
+            )
 
         libvirt_destconn = destconn.get_backend().get_conn_for_api_arg()
         log.debug(
-            "Migrating: conn=%s flags=%s uri=%s tunnel=%s unsafe=%s temporary=%s",
+            "Migrating: conn=%s flags=%s uri=%s tunnel=%s unsafe=%s temporary=%s "
+            "bandwidth=%s tuning=%s",
             destconn,
             flags,
             dest_uri,
             tunnel,
             unsafe,
             temporary,
+            bandwidth,
+            tuning and vars(tuning),
         )
 
-        if meter:
-            start_job_progress_thread(self, meter, _("Migrating domain"))
-
-        params = {}
-        if dest_uri and not tunnel:
-            params[libvirt.VIR_MIGRATE_PARAM_URI] = dest_uri
-        if xml:
-            params[libvirt.VIR_MIGRATE_PARAM_DEST_XML] = xml
-
-        if self.conn.is_test() and "TESTSUITE-FAKE" in (dest_uri or ""):
-            # If using the test driver and a special URI, fake successful
-            # migration so we can test more of the migration wizard
-            time.sleep(1.2)
-            if not xml:
-                xml = self.get_xml_to_define()
-            destconn.define_domain(xml).create()
-            self.delete()
-        elif tunnel:
-            self._backend.migrateToURI3(dest_uri, params, flags)
-        else:
-            self._backend.migrate3(libvirt_destconn, params, flags)
+        iteration_cb = None
+        if tuning and tuning.postcopy:
+            iteration_cb = self._postcopy_iteration_cb
+        if meter or iteration_cb:
+            start_job_progress_thread(self, meter, _("Migrating domain"), iteration_cb=iteration_cb)
+
+        try:
+            if self.conn.is_test() and "TESTSUITE-FAKE" in (dest_uri or ""):
+                # If using the test driver and a special URI, fake successful
+                # migration so we can test more of the migration wizard
+                time.sleep(1.2)
+                if not xml:
+                    xml = self.get_xml_to_define()
+                destconn.define_domain(xml).create()
+                self.delete()
+            elif tunnel:
+                self._backend.migrateToURI3(dest_uri, params, flags)
+            else:
+                self._backend.migrate3(libvirt_destconn, params, flags)
+        finally:
+            self._stop_job_progress()
 
         # Don't schedule any conn update, migrate dialog handles it for us
 
+    def _postcopy_iteration_cb(self, iteration):
+        # Like virsh --postcopy-after-precopy: once the first full pass
+        # over guest memory is done, move the guest to the destination
+        # and fetch the remaining pages on demand
+        if iteration < 2:
+            return False
+        log.debug("Switching migration of %s to post-copy", self.get_name())
+        self._backend.migrateStartPostCopy(0)
+        return True
+
     ###################
     # Stats accessors #
     ###################
@@ -1618,6 +1649,16 @@ class vmmDomain(vmmLibvirtObject):
         stats = self._get_stats()
         return max(stats.diskRdMaxRate, stats.diskWrMaxRate, 10.0)
 
+    def stats_are_idle(self):
+        """
+        Whether the latest stats sample showed no meaningful activity
+        """
+        return (
+            self.host_cpu_time_percentage() < 1
+            and not self.disk_io_rate()
+            and not self.network_traffic_rate()
+        )
+
     def host_cpu_time_vector(self, limit=None):
         return self._get_stats().get_vector("cpuHostPercent", limit)
 
@@ -7,7 +7,6 @@
 import time
 
 from virtinst import log
-from virtinst import pollhelpers
 from virtinst import StoragePool, StorageVolume
 
 from .libvirtobject import vmmLibvirtObject
@@ -40,6 +39,10 @@ class vmmStorageVolume(vmmLibvirtObject):
     def __init__(self, conn, backend, key):
         vmmLibvirtObject.__init__(self, conn, backend, key, StorageVolume)
 
+        # Set when the pool was refreshed, so sizes are re-checked with
+        # libvirt's cheap info() call the next time we are accessed
+        self._sizes_stale = False
+
     ##########################
     # Required class methods #
     ##########################
@@ -75,6 +78,35 @@ class vmmStorageVolume(vmmLibvirtObject):
         self._backend.delete(0)
         self._backend = None
 
+    def mark_sizes_stale(self):
+        """
+        Called on pool refresh. The capacity and allocation are
+        compared against info() lazily, next time the XML is accessed.
+        """
+        self._sizes_stale = True
+
+    def _check_sizes(self):
+        if not self._sizes_stale:
+            return
+        self._sizes_stale = False
+        if self._xmlobj is None:
+            return
+
+        try:
+            info = self._backend.info()
+        except Exception as e:  # pragma: no cover
+            log.debug("info for vol=%s failed: %s", self._backend.key(), e)
+            self._invalidate_xml()
+            return
+
+        xmlobj = self._xmlobj
+        if (info[1], info[2]) != (xmlobj.capacity, xmlobj.allocation):
+            self._invalidate_xml()
+
+    def get_xmlobj(self, *args, **kwargs):
+        self._check_sizes()
+        return vmmLibvirtObject.get_xmlobj(self, *args, **kwargs)
+
     #################
     # XML accessors #
     #################
@@ -144,6 +176,7 @@ class vmmStoragePool(vmmLibvirtObject):
 
         self._last_refresh_time = 0
         self._volumes = None
+        self._volumes_stale = False
 
     ##########################
     # Required class methods #
@@ -180,7 +213,9 @@ class vmmStoragePool(vmmLibvirtObject):
 
     def _invalidate_xml(self):
         vmmLibvirtObject._invalidate_xml(self)
-        self._volumes = None
+        # Don't throw away the volume objects, they are diffed against
+        # the new volume list on next access
+        self._volumes_stale = True
 
     def _cleanup(self):
         vmmLibvirtObject._cleanup(self)
@@ -248,21 +283,53 @@ class vmmStoragePool(vmmLibvirtObject):
         return self._volumes[:]
 
     def _update_volumes(self, force):
+        """
+        Sync our volume list with libvirt. libvirt has no volume
+        lifecycle events, and pool refresh events don't say what
+        changed, so we diff the listAllVolumes result by volume key.
+        Known volumes keep their vmmStorageVolume and cached XML, their
+        sizes are only re-checked when the volume is next accessed, so
+        this doesn't make a libvirt call per volume.
+        """
         if not self.is_active():
             self._volumes = []
             return
-        if not force and self._volumes is not None:
+        if not force and not self._volumes_stale and self._volumes is not None:
             return
+        self._volumes_stale = False
 
-        keymap = dict((o.get_name(), o) for o in self._volumes or [])
-
-        def cb(obj, key):
-            return vmmStorageVolume(self.conn, obj, key)
+        objs = []
+        try:
+            if self.conn.support.conn_storage():
+                objs = self._backend.listAllVolumes(0)
+        except Exception as e:  # pragma: no cover
+            log.debug("Unable to list all volumes: %s", e)
 
-        (dummy1, dummy2, allvols) = pollhelpers.fetch_volumes(
-            self.conn.get_backend(), self.get_backend(), keymap, cb
-        )
-        self._volumes = allvols
+        keymap = {}
+        for vol in self._volumes or []:
+            keymap[(vol.get_backend().key(), vol.get_name())] = vol
+
+        newvols = []
+        added = 0
+        for obj in objs:
+            name = obj.name()
+            vol = keymap.pop((obj.key(), name), None)
+            if not vol:
+                vol = vmmStorageVolume(self.conn, obj, name)
+                added += 1
+            elif force:
+                vol.mark_sizes_stale()
+            newvols.append(vol)
+
+        if added or keymap:
+            log.debug(
+                "pool=%s volumes added=%d removed=%d total=%d",
+                self.get_name(),
+                added,
+                len(keymap),
+                len(newvols),
+            )
+        self._volumes = newvols
 
     #########################
     # XML/config operations #
@@ -4,6 +4,7 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import bisect
 import os
 
 import gi
@@ -216,11 +217,27 @@ class _TrayMainMenu(vmmGObject):
         vmmGObject.__init__(self)
         self.topwin = None  # Need this for error callbacks from VMActionMenu
 
+        # uri -> conn menu item, and the sorted (sortkey, uri) list
+        # matching the order of conn items in the top level menu
+        self._conn_items = {}
+        self._conn_sortkeys = []
+
+        # uri -> {vm uuid -> vm menu item}, and uri -> sorted
+        # (sortkey, uuid) list matching the order in the conn submenu
+        self._vm_items = {}
+        self._vm_sortkeys = {}
+
+        # VMs with a pending vm_change, handled together from idle
+        self._changed_vms = {}
+
         self._menu = self._build_menu()
 
     def _cleanup(self):
         self._menu.destroy()
         self._menu = None
+        self._conn_items = {}
+        self._vm_items = {}
+        self._changed_vms = {}
 
     ###########
     # UI init #
@@ -245,11 +262,11 @@ class _TrayMainMenu(vmmGObject):
     ######################
 
     # Helpers for stashing identifying data in the menu item objects
-    def _get_lookupkey(self, child):
-        return getattr(child, "_vmlookupkey", None)
+    def _get_conn_action_items(self, child):
+        return getattr(child, "_vmconnactionitems", None)
 
-    def _set_lookupkey(self, child, val):
-        return setattr(child, "_vmlookupkey", val)
+    def _set_conn_action_items(self, child, val):
+        return setattr(child, "_vmconnactionitems", val)
 
     def _get_sortkey(self, child):
         return getattr(child, "_vmsortkey", None)
@@ -271,7 +288,6 @@ class _TrayMainMenu(vmmGObject):
         menu_item.set_use_underline(False)
         vm_action_menu = vmmenu.VMActionMenu(self, lambda: vm)
         menu_item.set_submenu(vm_action_menu)
-        self._set_lookupkey(menu_item, vm)
         self._set_sortkey(menu_item, vm.get_name_or_title())
         self._set_vm_state(menu_item, vm)
         menu_item.show_all()
@@ -286,10 +302,9 @@ class _TrayMainMenu(vmmGObject):
         else:
             label.set_text(conn.get_pretty_desc())
 
-        connect_item = self._find_lookupkey(menu_item.get_submenu(), 1)
-        disconnect_item = self._find_lookupkey(menu_item.get_submenu(), 2)
-        connect_item.set_visible(conn.is_active())
-        disconnect_item.set_visible(not conn.is_active())
+        disconnect_item, connect_item = self._get_conn_action_items(menu_item)
+        disconnect_item.set_visible(conn.is_active())
+        connect_item.set_visible(not conn.is_active())
 
     def _build_conn_menuitem(self, conn):
         """
@@ -297,7 +312,6 @@ class _TrayMainMenu(vmmGObject):
         all its VMs as items in a sub menu
         """
         menu_item = Gtk.MenuItem.new_with_label("FOO")
-        self._set_lookupkey(menu_item, conn.get_uri())
 
         # Group active conns first
         # Sort by pretty desc within those categories
@@ -311,28 +325,47 @@ class _TrayMainMenu(vmmGObject):
         menu.add(Gtk.SeparatorMenuItem())
         citem1 = Gtk.ImageMenuItem.new_from_stock(Gtk.STOCK_DISCONNECT, None)
         citem1.connect("activate", _conn_disconnect_cb, conn.get_uri())
-        self._set_lookupkey(citem1, 1)
         menu.add(citem1)
         citem2 = Gtk.ImageMenuItem.new_from_stock(Gtk.STOCK_CONNECT, None)
         citem2.connect("activate", _conn_connect_cb, conn.get_uri())
-        self._set_lookupkey(citem2, 2)
         menu.add(citem2)
+        self._set_conn_action_items(menu_item, (citem1, citem2))
 
         menu_item.show_all()
         self._set_conn_state(menu_item, conn)
         return menu_item
 
-    def _find_lookupkey(self, parent, key):
-        for child in parent.get_children():
-            if self._get_lookupkey(child) == key:
-                return child
-
     def _find_conn_menuitem(self, uri):
-        return self._find_lookupkey(self._menu, uri)
+        return self._conn_items.get(uri)
 
     def _find_vm_menuitem(self, uri, vm):
-        connmenu = self._find_conn_menuitem(uri)
-        return self._find_lookupkey(connmenu.get_submenu(), vm)
+        return self._vm_items.get(uri, {}).get(vm.get_uuid())
+
+    def _insert_sorted(self, sortkeys, entry):
+        """
+        Add entry to the sorted sortkeys list, returning its index,
+        which is also its position in the menu. Entries are
+        (sortkey, unique id) so ties have a stable order
+        """
+        idx = bisect.bisect_right(sortkeys, entry)
+        sortkeys.insert(idx, entry)
+        return idx
+
+    def _remove_sorted(self, sortkeys, entry):
+        idx = bisect.bisect_left(sortkeys, entry)
+        if idx < len(sortkeys) and sortkeys[idx] == entry:
+            sortkeys.pop(idx)
+
+    def _flush_vm_changes(self):
+        changed = self._changed_vms
+        self._changed_vms = {}
+        if not self._menu:
+            return  # pragma: no cover
+
+        for vm in changed.values():
+            vmitem = self._find_vm_menuitem(vm.conn.get_uri(), vm)
+            if vmitem:
+                self._set_vm_state(vmitem, vm)
 
     ################
     # UI listeners #
@@ -351,20 +384,21 @@ class _TrayMainMenu(vmmGObject):
         return self._menu
 
     def conn_add(self, conn):
+        uri = conn.get_uri()
         connmenu = self._build_conn_menuitem(conn)
-        sortkey = self._get_sortkey(connmenu)
-
-        idx = 0
-        for idx, child in enumerate(list(self._menu.get_children())):
-            checksort = self._get_sortkey(child)
-            if checksort is None or checksort > sortkey:
-                break
+        idx = self._insert_sorted(self._conn_sortkeys, (self._get_sortkey(connmenu), uri))
 
+        self._conn_items[uri] = connmenu
+        self._vm_items[uri] = {}
+        self._vm_sortkeys[uri] = []
         self._menu.insert(connmenu, idx)
 
     def conn_remove(self, uri):
-        connmenu = self._find_conn_menuitem(uri)
+        connmenu = self._conn_items.pop(uri, None)
         if connmenu:
+            self._remove_sorted(self._conn_sortkeys, (self._get_sortkey(connmenu), uri))
+            self._vm_items.pop(uri, None)
+            self._vm_sortkeys.pop(uri, None)
             self._menu.remove(connmenu)
             connmenu.destroy()
 
@@ -373,29 +407,33 @@ class _TrayMainMenu(vmmGObject):
         self._set_conn_state(connmenu, conn)
 
     def vm_add(self, vm):
-        connmenu = self._find_conn_menuitem(vm.conn.get_uri())
+        uri = vm.conn.get_uri()
+        connmenu = self._find_conn_menuitem(uri)
         menu_item = self._build_vm_menuitem(vm)
-        sortkey = self._get_sortkey(menu_item)
-
-        vmsubmenu = connmenu.get_submenu()
-        idx = 0
-        for idx, child in enumerate(list(vmsubmenu.get_children())):
-            checksort = self._get_sortkey(child)
-            if checksort is None or checksort > sortkey:
-                break
+        idx = self._insert_sorted(
+            self._vm_sortkeys[uri], (self._get_sortkey(menu_item), vm.get_uuid())
+        )
 
-        vmsubmenu.insert(menu_item, idx)
+        self._vm_items[uri][vm.get_uuid()] = menu_item
+        connmenu.get_submenu().insert(menu_item, idx)
 
     def vm_remove(self, vm):
-        conn = vm.conn
-        connmenu = self._find_conn_menuitem(conn.get_uri())
-        vmitem = self._find_vm_menuitem(conn.get_uri(), vm)
+        uri = vm.conn.get_uri()
+        connmenu = self._find_conn_menuitem(uri)
+        vmitem = self._vm_items[uri].pop(vm.get_uuid())
+        self._remove_sorted(self._vm_sortkeys[uri], (self._get_sortkey(vmitem), vm.get_uuid()))
+        self._changed_vms.pop(vm, None)
         connmenu.get_submenu().remove(vmitem)
         vmitem.destroy()
 
     def vm_change(self, vm):
-        vmitem = self._find_vm_menuitem(vm.conn.get_uri(), vm)
-        self._set_vm_state(vmitem, vm)
+        """
+        Queue a menu update for vm. A burst of state changes, like
+        connecting to a host with many VMs, is handled in one idle pass
+        """
+        if not self._changed_vms:
+            self.idle_add(self._flush_vm_changes)
+        self._changed_vms[vm] = vm
 
 
 class vmmSystray(vmmGObject):
@@ -179,6 +179,7 @@ class vmmVMWindow(vmmGObjectUI):
             return
 
         vmmEngine.get_instance().increment_window_counter()
+        self.vm.conn.watch_vm_stats(self.vm)
         self._refresh_vm_state()
 
     def customize_finish(self, src):
@@ -246,6 +247,8 @@ class vmmVMWindow(vmmGObjectUI):
         self._console.vmwindow_close()
         self._details.vmwindow_close()
 
+        # Before emitting closed, handlers may cleanup() the window
+        self.vm.conn.unwatch_vm_stats(self.vm)
         self.emit("closed")
         vmmEngine.get_instance().decrement_window_counter()
         return 1
@@ -5,6 +5,8 @@
 
 # pylint: disable=wrong-import-position
 
+import importlib
+
 import gi
 
 gi.require_version("Libosinfo", "1.0")
@@ -46,25 +48,72 @@ _set_libvirt_error_handler()
 
 
 from virtinst import xmlutil
-from virtinst.uri import URI
-from virtinst.osdict import OSDB
-
-from virtinst.domain import *  # pylint: disable=wildcard-import
-
-from virtinst.capabilities import Capabilities
-from virtinst.domcapabilities import DomainCapabilities
-from virtinst.network import Network
-from virtinst.nodedev import NodeDevice
-from virtinst.storage import StoragePool, StorageVolume
-
-from virtinst.devices import *  # pylint: disable=wildcard-import
-
-from virtinst.install.installer import Installer
-
-from virtinst.guest import Guest
-from virtinst.cloner import Cloner
-from virtinst.snapshot import DomainSnapshot
+from virtinst.logger import log, reset_logging
 
-from virtinst.connection import VirtinstConnection
 
-from virtinst.logger import log, reset_logging
+# Everything below is loaded on first access via the module __getattr__
+# (PEP 562). Pulling in the whole device/domain tree, libosinfo, and
+# the installer is a noticeable chunk of startup time for CLI paths like
+# `virt-xml --print-xml` or `--disk help` which never touch most of it.
+_LAZY_ATTRS = {
+    "URI": "virtinst.uri",
+    "OSDB": "virtinst.osdict",
+    "Capabilities": "virtinst.capabilities",
+    "DomainCapabilities": "virtinst.domcapabilities",
+    "Network": "virtinst.network",
+    "NodeDevice": "virtinst.nodedev",
+    "StoragePool": "virtinst.storage",
+    "StorageVolume": "virtinst.storage",
+    "Installer": "virtinst.install.installer",
+    "Guest": "virtinst.guest",
+    "Cloner": "virtinst.cloner",
+    "DomainSnapshot": "virtinst.snapshot",
+    "VirtinstConnection": "virtinst.connection",
+}
+
+# Wildcard exported packages. Names are resolved against the package
+# __all__ on first lookup
+_LAZY_PACKAGES = {
+    "Domain": "virtinst.domain",
+    "Device": "virtinst.devices",
+}
+
+
+def _lazy_lookup_module(name):
+    if name in _LAZY_ATTRS:
+        return importlib.import_module(_LAZY_ATTRS[name])
+
+    for prefix, modname in _LAZY_PACKAGES.items():
+        if not name.startswith(prefix):
+            continue
+        mod = importlib.import_module(modname)
+        if name in mod.__all__:
+            return mod
+    return None
+
+
+def __getattr__(name):
+    mod = _lazy_lookup_module(name)
+    if mod:
+        value = getattr(mod, name)
+        globals()[name] = value
+        return value
+
+    # Historically every submodule was imported as a side effect of
+    # `import virtinst`, so keep `virtinst.progress` and friends working
+    if not name.startswith("_"):
+        fullname = "%s.%s" % (__name__, name)
+        try:
+            return importlib.import_module(fullname)
+        except ModuleNotFoundError as e:
+            if e.name != fullname:
+                raise
+
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def __dir__():
+    ret = set(globals()) | set(_LAZY_ATTRS)
+    for modname in _LAZY_PACKAGES.values():
+        ret.update(importlib.import_module(modname).__all__)
+    return sorted(ret)
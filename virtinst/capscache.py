@@ -0,0 +1,158 @@
+#
+# Persistent cache of static connection data
+#
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import hashlib
+import json
+import os
+import tempfile
+
+from .buildconfig import BuildConfig
+from .logger import log
+
+
+def _get_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _domcaps_key(emulator, arch, machine, hvtype):
+    return json.dumps([emulator, arch, machine, hvtype])
+
+
+class CapsCache:
+    """
+    On disk cache of the capabilities XML, domain capabilities XML, and
+    connection support check results for a single libvirt URI.
+
+    The cache file is only used when the passed key matches the stored
+    key exactly, so any change to the URI, remote hostname, libvirt or
+    hypervisor versions, or our own version throws away everything.
+    For local connections the mtime of every emulator we have seen is
+    tracked as well, so reinstalling qemu invalidates the cache even
+    if the version string didn't change.
+
+    Changes are only kept in memory until flush() is called, which
+    VirtinstConnection does when it is closed.
+    """
+
+    def __init__(self, cachedir, key):
+        self._key = key
+        self._cachedir = cachedir
+        self._path = os.path.join(
+            cachedir, hashlib.sha256(key["uri"].encode("utf-8")).hexdigest() + ".json"
+        )
+        self._data = self._load()
+        self._dirty = False
+
+    def _empty(self):
+        return {"key": self._key, "emulators": {}, "caps": None, "domcaps": {}, "support": {}}
+
+    def _load(self):
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return self._empty()
+        except Exception as e:
+            log.debug("Error reading caps cache %s: %s", self._path, e)
+            return self._empty()
+
+        if not isinstance(data, dict) or data.get("key") != self._key:
+            log.debug("Caps cache %s key mismatch, discarding", self._path)
+            return self._empty()
+
+        for path, mtime in data.get("emulators", {}).items():
+            if _get_mtime(path) != mtime:
+                log.debug("Emulator %s changed, discarding caps cache %s", path, self._path)
+                return self._empty()
+
+        log.debug("Loaded caps cache %s", self._path)
+        return data
+
+    def _save(self):
+        tmppath = None
+        try:
+            os.makedirs(self._cachedir, 0o751, exist_ok=True)
+            fd, tmppath = tempfile.mkstemp(dir=self._cachedir, prefix=".capscache")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._data, f)
+            os.replace(tmppath, self._path)
+        except Exception as e:
+            log.debug("Error writing caps cache %s: %s", self._path, e)
+            if tmppath and os.path.exists(tmppath):
+                os.unlink(tmppath)
+
+    ##############
+    # Public API #
+    ##############
+
+    def get_path(self):
+        return self._path
+
+    def flush(self):
+        """
+        Write out any changes made since the last flush
+        """
+        if not self._dirty:
+            return
+        self._save()
+        self._dirty = False
+
+    def track_emulator(self, path):
+        """
+        Invalidate the cache if the local file at path changes
+        """
+        if not path or path in self._data["emulators"]:
+            return
+        self._data["emulators"][path] = _get_mtime(path)
+        self._dirty = True
+
+    def get_caps(self):
+        return self._data["caps"]
+
+    def set_caps(self, xml):
+        self._data["caps"] = xml
+        self._dirty = True
+
+    def get_domcaps(self, emulator, arch, machine, hvtype):
+        return self._data["domcaps"].get(_domcaps_key(emulator, arch, machine, hvtype))
+
+    def set_domcaps(self, emulator, arch, machine, hvtype, xml):
+        self._data["domcaps"][_domcaps_key(emulator, arch, machine, hvtype)] = xml
+        self._dirty = True
+
+    def get_support(self, name):
+        return self._data["support"].get(name)
+
+    def set_support(self, name, value):
+        self._data["support"][name] = bool(value)
+        self._dirty = True
+
+    def invalidate(self):
+        self._data = self._empty()
+        self._dirty = True
+
+
+def build_cache_key(conn):
+    """
+    Build the invalidation key for the passed open VirtinstConnection
+    """
+    hostname = None
+    try:
+        hostname = conn.getHostname()
+    except Exception:  # pragma: no cover
+        log.debug("Error calling getHostname", exc_info=True)
+
+    return {
+        "uri": conn.uri,
+        "hostname": hostname or conn.get_uri_hostname(),
+        "library": conn.local_libvirt_version(),
+        "daemon": conn.daemon_version(),
+        "hypervisor": conn.conn_version(),
+        "virtinst": BuildConfig.version,
+    }
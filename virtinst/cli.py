@@ -7,6 +7,7 @@
 # See the COPYING file in the top-level directory.
 
 import argparse
+import atexit
 import collections
 import os
 import re
@@ -215,15 +216,33 @@ def setupLogging(appname, debug_stdout, do_quiet, cli_app=True):
 ##############################
 
 
-def getConnection(uri, conn=None):
+def _get_caps_cache_dir(use_cache):
+    """
+    The persistent capabilities cache is opt in, either with --cache
+    or by setting VIRTINST_CAPS_CACHE in the environment. --no-cache
+    overrides the environment.
+    """
+    if use_cache is None:
+        use_cache = bool(os.environ.get("VIRTINST_CAPS_CACHE"))
+    if not use_cache:
+        return None
+    return os.path.join(VirtinstConnection.get_app_cache_dir(), "capscache")
+
+
+def getConnection(uri, conn=None, use_cache=None):
     if conn:
         # preopened connection passed in via test suite
         return conn
 
     log.debug("Requesting libvirt URI %s", (uri or "default"))
     conn = VirtinstConnection(uri)
-    conn.open(_openauth_cb, None)
+    cachedir = _get_caps_cache_dir(use_cache)
+    conn.open(_openauth_cb, None, cachedir=cachedir)
     log.debug("Received libvirt URI %s", conn.uri)
+    if cachedir:
+        # The CLI tools never close their connection, write out
+        # everything probed during the run once at exit
+        atexit.register(conn.flush_caps_cache)
 
     return conn
 
@@ -515,6 +534,7 @@ def _virtparser_completer(prefix, **kwargs):
     sub_options = []
     for parserclass in _get_completer_parsers():
         if kwargs["action"].dest == parserclass.cli_arg_name:
+            parserclass._virtcli_ensure_init()
             # pylint: disable=protected-access
             for virtarg in sorted(parserclass._virtargs, key=lambda p: p.nonregex_cliname()):
                 sub_options.append(virtarg.nonregex_cliname() + "=")
@@ -613,6 +633,20 @@ def add_connect_option(parser, invoker=None):
             "--connect", metavar="URI", help=_("Connect to hypervisor with libvirt URI")
         )
 
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        dest="use_cache",
+        default=None,
+        help=_("Reuse hypervisor capabilities cached by previous runs"),
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_false",
+        dest="use_cache",
+        help=_("Don't use or update the cached hypervisor capabilities"),
+    )
+
 
 def add_misc_options(
     grp,
@@ -1165,6 +1199,9 @@ class _SuboptCheckerClass:
         self._seen.add(name)
 
     def get_unseen(self):
+        # Parsers register their suboptions lazily, make sure
+        # we know about all of them
+        _virtcli_init_all_parsers()
         return self._all - self._seen  # pragma: no cover
 
 
@@ -1451,6 +1488,10 @@ class _InitClass(type):
     '__init_subclass__' (see https://www.python.org/dev/peps/pep-0487/),
     but without giving us an explicit dep on python 3.6
 
+    The actual _virtcli_class_init call is deferred until the parser
+    is first used, via _virtcli_ensure_init. Registering every suboption
+    of every parser is a measurable part of CLI startup, and most
+    invocations only touch a handful of parsers.
     """
 
     def __new__(cls, *args, **kwargs):  # pylint: disable=bad-mcs-classmethod-argument
@@ -1461,13 +1502,41 @@ class _InitClass(type):
         init = ns.get("_virtcli_class_init")
         if isinstance(init, types.FunctionType):
             raise RuntimeError("_virtcli_class_init must be a @classmethod")  # pragma: no cover
-        self = super().__new__(cls, name, bases, ns)
-        self._virtcli_class_init()  # pylint: disable=protected-access
+        return super().__new__(cls, name, bases, ns)
+
+    def _virtcli_ensure_init(cls):
+        """
+        Run _virtcli_class_init for this class if it hasn't happened yet.
+        Parent classes are initialized first, to match the ordering
+        subclasses saw when this ran at class creation time.
+        """
+        if cls.__dict__.get("_virtcli_init_done"):
+            return
+
+        for parent in reversed(cls.__mro__[1:]):
+            if isinstance(parent, _InitClass):
+                parent._virtcli_ensure_init()
+
+        cls._virtcli_init_done = True
+        cls._virtcli_class_init()  # pylint: disable=protected-access
 
         # Check for leftover aliases
-        if self.aliases:
-            raise xmlutil.DevError("class=%s leftover aliases=%s" % (self, self.aliases))
-        return self
+        if cls.aliases:
+            raise xmlutil.DevError("class=%s leftover aliases=%s" % (cls, cls.aliases))
+
+
+def _virtcli_init_all_parsers():
+    """
+    Force init of every parser class. Needed by anything that wants
+    the full list of registered suboptions
+    """
+
+    def _walk(parserclass):
+        parserclass._virtcli_ensure_init()
+        for subclass in parserclass.__subclasses__():
+            _walk(subclass)
+
+    _walk(VirtCLIParser)
 
 
 class VirtCLIParser(metaclass=_InitClass):
@@ -1555,6 +1624,7 @@ class VirtCLIParser(metaclass=_InitClass):
                 prefix = "2"
             return prefix + virtarg.cliname
 
+        cls._virtcli_ensure_init()
         print("%s options:" % cls.cli_flag_name())
         for arg in sorted(cls._virtargs, key=_sortkey):
             print("  %s" % arg.cliname)
@@ -1591,6 +1661,7 @@ class VirtCLIParser(metaclass=_InitClass):
             _add_xpath_args(subclass)
 
     def __init__(self, optstr, guest=None, editing=None):
+        type(self)._virtcli_ensure_init()
         self.optstr = optstr
         self.guest = guest
         self.editing = editing
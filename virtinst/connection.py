@@ -10,6 +10,7 @@ import weakref
 import libvirt
 
 from . import Capabilities
+from . import capscache
 from . import pollhelpers
 from . import support
 from . import xmlutil
@@ -76,6 +77,7 @@ class VirtinstConnection:
         self._libvirtconn = None
         self._uriobj = URI(self._uri)
         self._caps = None
+        self._capscache = None
 
         self._fetch_cache = {}
 
@@ -105,9 +107,18 @@ class VirtinstConnection:
 
     def _get_caps(self):
         if not self._caps:
+            capsxml = self._capscache and self._capscache.get_caps()
+            if capsxml:
+                self._caps = Capabilities(self, capsxml)
+                log.debug("Using cached capabilities for %s", self._uri)
+                return self._caps
+
             capsxml = self._libvirtconn.getCapabilities()
             self._caps = Capabilities(self, capsxml)
             log.debug("Fetched capabilities for %s: %s", self._uri, capsxml)
+            if self._capscache:
+                self._track_emulators(self._caps)
+                self._capscache.set_caps(capsxml)
         return self._caps
 
     caps = property(_get_caps)
@@ -133,29 +144,60 @@ class VirtinstConnection:
             format_version(self.conn_version()),
         )
 
+    def _track_emulators(self, caps):
+        if self.is_remote():
+            # We can't stat emulators on the remote host
+            return
+        for guest in caps.guests:
+            self._capscache.track_emulator(guest.emulator)
+            for domain in guest.domains:
+                self._capscache.track_emulator(domain.emulator)
+
+    def _open_capscache(self, cachedir):
+        key = capscache.build_cache_key(self)
+        self._capscache = capscache.CapsCache(cachedir, key)
+        self.support.set_persistent_cache(self._capscache)
+
     ##############
     # Public API #
     ##############
 
     def close(self):
         ret = 0
+        self.flush_caps_cache()
         if self._libvirtconn:
             ret = self._libvirtconn.close()
         self._libvirtconn = None
         self._uri = None
         self._fetch_cache = {}
+        self._capscache = None
+        self.support.set_persistent_cache(None)
         return ret
 
     def fake_conn_predictable(self):
         return self._fake_conn_predictable
 
+    def flush_caps_cache(self):
+        """
+        Write out the persistent capabilities cache, if in use
+        """
+        if self._capscache:
+            self._capscache.flush()
+
     def invalidate_caps(self):
         self._caps = None
+        if self._capscache:
+            self._capscache.invalidate()
 
     def is_open(self):
         return bool(self._libvirtconn)
 
-    def open(self, authcb, cbdata):
+    def open(self, authcb, cbdata, cachedir=None):
+        """
+        :param cachedir: If specified, persist capabilities, domain
+            capabilities, and support check results in this directory,
+            and reuse them on the next open
+        """
         if self._magic_uri:
             self._magic_uri.validate()
 
@@ -173,6 +215,7 @@ class VirtinstConnection:
         conn = libvirt.openAuth(self._open_uri, [valid_auth_options, authcb, cbdata], open_flags)
 
         if self._magic_uri:
+            conn = self._magic_uri.wrap_conn(conn)
             self._magic_uri.overwrite_conn_functions(conn)
 
         self._libvirtconn = conn
@@ -181,8 +224,34 @@ class VirtinstConnection:
             self._uriobj = URI(self._uri)
 
         self._log_versions()
+        if cachedir:
+            self._open_capscache(cachedir)
         self._get_caps()  # cache and log capabilities
 
+    def lookup_domain_capabilities(self, emulator, arch, machine, hvtype):
+        """
+        Return getDomainCapabilities XML, from the persistent cache
+        if possible
+        """
+        if self._capscache:
+            xml = self._capscache.get_domcaps(emulator, arch, machine, hvtype)
+            if xml:
+                log.debug(
+                    "Using cached domain capabilities for (%s,%s,%s,%s)",
+                    emulator,
+                    arch,
+                    machine,
+                    hvtype,
+                )
+                return xml
+
+        xml = self._libvirtconn.getDomainCapabilities(emulator, arch, machine, hvtype)
+        if self._capscache:
+            if not self.is_remote():
+                self._capscache.track_emulator(emulator)
+            self._capscache.set_domcaps(emulator, arch, machine, hvtype, xml)
+        return xml
+
     def get_libvirt_data_root_dir(self):
         if self.is_privileged():
             return "/var/lib/libvirt"
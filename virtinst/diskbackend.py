@@ -6,10 +6,16 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import collections
+import errno
 import os
+import pwd
 import re
 import stat
+import struct
 import subprocess
+import threading
+import time
 
 import libvirt
 
@@ -259,8 +265,107 @@ def path_definitely_exists(conn, path):
 
 SETFACL = "setfacl"
 
-
-def _fix_perms_acl(dirname, username):
+# Binary format of the system.posix_acl_access xattr: a little endian
+# u32 version header, followed by (u16 tag, u16 perm, u32 id) entries
+# sorted by tag, then id. See linux include/uapi/linux/posix_acl_xattr.h
+_ACL_XATTR = "system.posix_acl_access"
+_ACL_VERSION = 2
+_ACL_HEADER = struct.Struct("<I")
+_ACL_ENTRY = struct.Struct("<HHI")
+_ACL_USER_OBJ = 0x01
+_ACL_USER = 0x02
+_ACL_GROUP_OBJ = 0x04
+_ACL_GROUP = 0x08
+_ACL_MASK = 0x10
+_ACL_OTHER = 0x20
+_ACL_EXECUTE = 0x01
+_ACL_UNDEFINED_ID = 0xFFFFFFFF
+
+# (dirname, inode, ctime, uid) -> searchable, least recently used
+# first. Changing perms or ACLs bumps ctime, so stale entries aren't
+# hit. With coarse timestamps a change may not bump ctime if it lands
+# in the same tick as the cached check, so dirs changed in the last
+# _SEARCHABLE_RACY_NS aren't cached, like git does for its index.
+_searchable_cache = collections.OrderedDict()
+_searchable_cache_lock = threading.Lock()
+_SEARCHABLE_CACHE_SIZE = 1024
+_SEARCHABLE_RACY_NS = 2 * 1000 * 1000 * 1000
+
+
+def _parse_acl(data):
+    """
+    Parse a system.posix_acl_access xattr value into a list of
+    (tag, perm, id) tuples
+    """
+    if len(data) < _ACL_HEADER.size or (len(data) - _ACL_HEADER.size) % _ACL_ENTRY.size:
+        raise ValueError("Invalid ACL xattr length %d" % len(data))
+    version = _ACL_HEADER.unpack_from(data)[0]
+    if version != _ACL_VERSION:
+        raise ValueError("Unknown ACL xattr version %d" % version)
+    return [
+        _ACL_ENTRY.unpack_from(data, offset)
+        for offset in range(_ACL_HEADER.size, len(data), _ACL_ENTRY.size)
+    ]
+
+
+def _build_acl(entries):
+    return _ACL_HEADER.pack(_ACL_VERSION) + b"".join(
+        _ACL_ENTRY.pack(*entry) for entry in sorted(entries, key=lambda e: (e[0], e[2]))
+    )
+
+
+def _xattr_unsupported(e):
+    return e.errno in [errno.ENOTSUP, errno.EOPNOTSUPP, errno.ENOSYS]
+
+
+def _read_acl(dirname):
+    """
+    Return the parsed access ACL of dirname, or an empty list if it
+    has none. Raises OSError if the filesystem doesn't do xattrs
+    """
+    if not hasattr(os, "getxattr"):  # pragma: no cover
+        raise OSError(errno.ENOTSUP, "xattrs are not supported on this platform")
+    try:
+        return _parse_acl(os.getxattr(dirname, _ACL_XATTR))
+    except OSError as e:
+        if e.errno == errno.ENODATA:
+            return []
+        raise
+
+
+def _set_acl_xattr(dirname, uid):
+    """
+    Grant uid search access to dirname, the same as
+    'setfacl --modify user:$uid:x' would: any existing entry for uid
+    is replaced with x only
+    """
+    entries = _read_acl(dirname)
+    if not entries:
+        mode = os.stat(dirname).st_mode
+        entries = [
+            (_ACL_USER_OBJ, (mode >> 6) & 7, _ACL_UNDEFINED_ID),
+            (_ACL_GROUP_OBJ, (mode >> 3) & 7, _ACL_UNDEFINED_ID),
+            (_ACL_OTHER, mode & 7, _ACL_UNDEFINED_ID),
+        ]
+
+    entries = [
+        e for e in entries if e[0] != _ACL_MASK and not (e[0] == _ACL_USER and e[2] == uid)
+    ]
+    entries.append((_ACL_USER, _ACL_EXECUTE, uid))
+
+    # Like setfacl, recalculate the mask as the union of all group
+    # class entries, so the new entry is effective
+    mask = 0
+    for tag, perm, ignore in entries:
+        if tag in [_ACL_USER, _ACL_GROUP_OBJ, _ACL_GROUP]:
+            mask |= perm
+    entries.append((_ACL_MASK, mask, _ACL_UNDEFINED_ID))
+
+    os.setxattr(dirname, _ACL_XATTR, _build_acl(entries))
+    log.debug("Set ACL user:%s:x on %s", uid, dirname)
+
+
+def _fix_perms_acl_cmd(dirname, username):
     cmd = [SETFACL, "--modify", "user:%s:x" % username, dirname]
     proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     out, err = proc.communicate()
@@ -273,6 +378,19 @@ def _fix_perms_acl(dirname, username):
         raise ValueError(err)
 
 
+def _fix_perms_acl(dirname, username):
+    try:
+        uid = pwd.getpwnam(username).pw_uid
+        _set_acl_xattr(dirname, uid)
+        return
+    except KeyError:  # pragma: no cover
+        log.debug("Unknown user %s, can't set ACL in process", username)
+    except OSError as e:
+        if not _xattr_unsupported(e):
+            raise ValueError(str(e)) from None
+    _fix_perms_acl_cmd(dirname, username)
+
+
 def _fix_perms_chmod(dirname):
     log.debug("Setting +x on %s", dirname)
     mode = os.stat(dirname).st_mode
@@ -306,6 +424,39 @@ def set_dirs_searchable(dirlist, username):
     return errdict
 
 
+def _acl_allows_search(entries, uid):
+    userperm = None
+    mask = None
+    for tag, perm, entryid in entries:
+        if tag == _ACL_USER and entryid == uid:
+            userperm = perm
+        elif tag == _ACL_MASK:
+            mask = perm
+
+    if userperm is None:
+        return False
+    if mask is not None:
+        userperm &= mask
+    return bool(userperm & _ACL_EXECUTE)
+
+
+def _is_dir_searchable_cmd(dirname, username):
+    cmd = ["getfacl", dirname]
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = proc.communicate()
+    except OSError:  # pragma: no cover
+        log.debug("Didn't find the getfacl command.")
+        return False
+
+    if proc.returncode != 0:  # pragma: no cover
+        log.debug("Cmd '%s' failed: %s", cmd, err)
+        return False
+
+    pattern = "user:%s:..x" % username
+    return bool(re.search(pattern.encode("utf-8", "replace"), out))
+
+
 def _is_dir_searchable(dirname, uid, username):
     """
     Check if passed directory is searchable by uid
@@ -325,21 +476,30 @@ def _is_dir_searchable(dirname, uid, username):
     if bool(statinfo.st_mode & flag):
         return True
 
+    key = (dirname, statinfo.st_ino, statinfo.st_ctime_ns, uid)
+    with _searchable_cache_lock:
+        if key in _searchable_cache:
+            _searchable_cache.move_to_end(key)
+            return _searchable_cache[key]
+
     # Check POSIX ACL (since that is what we use to 'fix' access)
-    cmd = ["getfacl", dirname]
     try:
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        out, err = proc.communicate()
-    except OSError:  # pragma: no cover
-        log.debug("Didn't find the getfacl command.")
-        return False
-
-    if proc.returncode != 0:  # pragma: no cover
-        log.debug("Cmd '%s' failed: %s", cmd, err)
-        return False
-
-    pattern = "user:%s:..x" % username
-    return bool(re.search(pattern.encode("utf-8", "replace"), out))
+        ret = _acl_allows_search(_read_acl(dirname), uid)
+    except ValueError as e:  # pragma: no cover
+        log.debug("Error parsing ACL of %s: %s", dirname, e)
+        ret = False
+    except OSError as e:
+        if not _xattr_unsupported(e):  # pragma: no cover
+            log.debug("Error reading ACL of %s: %s", dirname, e)
+            return False
+        ret = _is_dir_searchable_cmd(dirname, username)
+
+    if time.time_ns() - statinfo.st_ctime_ns > _SEARCHABLE_RACY_NS:
+        with _searchable_cache_lock:
+            _searchable_cache[key] = ret
+            while len(_searchable_cache) > _SEARCHABLE_CACHE_SIZE:
+                _searchable_cache.popitem(last=False)
+    return ret
 
 
 def is_path_searchable(path, uid, username):
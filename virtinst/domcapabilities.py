@@ -252,7 +252,7 @@ class DomainCapabilities(XMLBuilder):
         xml = None
         if conn.support.conn_domain_capabilities():
             try:
-                xml = conn.getDomainCapabilities(emulator, arch, machine, hvtype)
+                xml = conn.lookup_domain_capabilities(emulator, arch, machine, hvtype)
                 log.debug(
                     "Fetched domain capabilities for (%s,%s,%s,%s): %s",
                     emulator,
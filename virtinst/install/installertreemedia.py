@@ -207,15 +207,15 @@ class InstallerTreeMedia:
         ignore = guest
 
         def _check_kernel_pairs():
+            found = fetcher.hasFiles([path for pair in cache.kernel_pairs for path in pair])
             for kpath, ipath in cache.kernel_pairs:
-                if fetcher.hasFile(kpath) and fetcher.hasFile(ipath):
+                if found[kpath] and found[ipath]:
                     return kpath, ipath
             raise RuntimeError(_("Couldn't find kernel for install tree."))  # pragma: no cover
 
         kernelpath, initrdpath = _check_kernel_pairs()
-        kernel = fetcher.acquireFile(kernelpath)
+        kernel, initrd = fetcher.acquireFiles([kernelpath, initrdpath])
         self._tmpfiles.append(kernel)
-        initrd = fetcher.acquireFile(initrdpath)
         self._tmpfiles.append(initrd)
 
         perform_initrd_injections(initrd, self._initrd_injections, fetcher.scratchdir)
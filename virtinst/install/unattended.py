@@ -13,11 +13,10 @@ import pwd
 import re
 import tempfile
 
-from gi.repository import Libosinfo
-
 from . import urlfetcher
 from .. import progress
 from ..logger import log
+from ..osdict import Libosinfo
 
 
 def _is_user_login_safe(login):
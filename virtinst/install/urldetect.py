@@ -5,12 +5,18 @@
 # See the COPYING file in the top-level directory.
 
 import configparser
+import hashlib
+import json
 import os
 import re
+import tempfile
 
 from ..logger import log
 from ..osdict import OSDB
 
+# Where the treeinfo file can be found, in order of preference
+_TREEINFO_FILES = [".treeinfo", "treeinfo"]
+
 
 ###############################################
 # Helpers for detecting distro from given URL #
@@ -47,6 +53,24 @@ class _DistroCache:
             self._filecache[path] = content
         return self._filecache[path]
 
+    def prefetch(self, paths):
+        """
+        Fetch all the passed paths up front, in parallel, so the
+        is_valid checks don't each pay for a sequential round trip.
+        Fetchers that can't do parallel requests are left to fetch
+        lazily, since that usually means fewer requests overall.
+        """
+        if not self._fetcher.supports_parallel_fetch():
+            return
+        paths = [p for p in paths if p not in self._filecache]
+        self._filecache.update(self._fetcher.acquireFileContents(paths))
+
+    def get_cached_files(self):
+        return self._filecache.copy()
+
+    def set_cached_files(self, files):
+        self._filecache.update(files)
+
     @property
     def treeinfo(self):
         if self._treeinfo:
@@ -60,9 +84,11 @@ class _DistroCache:
         #
         # Anaconda is the canonical treeinfo consumer and they check for both
         # locations, so we need to do the same
-        treeinfostr = self.acquire_file_content(".treeinfo") or self.acquire_file_content(
-            "treeinfo"
-        )
+        treeinfostr = None
+        for path in _TREEINFO_FILES:
+            treeinfostr = self.acquire_file_content(path)
+            if treeinfostr:
+                break
         if treeinfostr is None:
             return None
 
@@ -284,6 +310,121 @@ class _SUSEContent:
         return distro_version
 
 
+######################################
+# Persistent detection results cache #
+######################################
+
+
+def _sha256(content):
+    return hashlib.sha256((content or "").encode("utf-8")).hexdigest()
+
+
+def _get_iso_stat(location):
+    # Block devices like /dev/cdrom can change media without changing
+    # size or mtime, so only regular files are cacheable
+    if not os.path.isfile(location):
+        return None
+    st = os.stat(location)
+    return [st.st_size, st.st_mtime_ns]
+
+
+class _DetectCache:
+    """
+    On disk cache of distro detection results, keyed by location.
+
+    Alongside the detected distro class we store the content of every
+    probe file that was fetched, so on a cache hit the detection code
+    runs against the same data without touching the network. Entries are
+    validated before use: for ISOs by comparing size+mtime, for trees
+    by refetching the treeinfo (or the first probe file that was found)
+    and comparing checksums.
+    """
+
+    def __init__(self, cachedir, location, distro_hint):
+        self._cachedir = cachedir
+        self._location = location
+        self._distro_hint = distro_hint
+        self._path = os.path.join(cachedir, _sha256(location) + ".json")
+
+    def _read(self):
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.debug("Error reading detect cache %s: %s", self._path, e)
+            return None
+
+        if (
+            not isinstance(data, dict)
+            or data.get("location") != self._location
+            or data.get("distro_hint") != self._distro_hint
+        ):
+            return None
+        return data
+
+    def lookup(self, cache):
+        """
+        Return the cached distro class name if the entry is still
+        valid, and seed the _DistroCache with the stored file content
+        """
+        data = self._read()
+        if not data:
+            return None
+
+        if cache.fetcher_is_iso():
+            if data.get("iso_stat") != _get_iso_stat(self._location):
+                log.debug("ISO %s changed, ignoring detect cache", self._location)
+                return None
+        else:
+            checkfile = data.get("checkfile")
+            content = cache.acquire_file_content(checkfile)
+            if content is None or _sha256(content) != data.get("checksum"):
+                log.debug("%s changed, ignoring detect cache", checkfile)
+                return None
+
+        log.debug("Using detect cache %s distro=%s", self._path, data["distro"])
+        cache.set_cached_files(data["files"])
+        return data["distro"]
+
+    def store(self, cache, sclass):
+        files = cache.get_cached_files()
+        data = {
+            "location": self._location,
+            "distro_hint": self._distro_hint,
+            "distro": sclass.__name__,
+            "files": files,
+        }
+
+        if cache.fetcher_is_iso():
+            data["iso_stat"] = _get_iso_stat(self._location)
+            if not data["iso_stat"]:
+                return
+        else:
+            checkfiles = [p for p in _TREEINFO_FILES + sclass.probe_files if files.get(p)]
+            if not checkfiles:
+                # Nothing we can validate a future lookup against
+                return
+            data["checkfile"] = checkfiles[0]
+            data["checksum"] = _sha256(files[checkfiles[0]])
+
+        try:
+            os.makedirs(self._cachedir, 0o751, exist_ok=True)
+            fd, tmppath = tempfile.mkstemp(dir=self._cachedir, prefix=".detectcache")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmppath, self._path)
+        except Exception as e:  # pragma: no cover
+            log.debug("Error writing detect cache %s: %s", self._path, e)
+
+
+def _get_detect_cache_dir(guest):
+    if guest.conn.in_testsuite():
+        return None
+    return os.path.join(guest.conn.get_app_cache_dir(), "detectcache")  # pragma: no cover
+
+
 def getDistroStore(guest, fetcher, skip_error):
     log.debug("Finding distro store for location=%s", fetcher.location)
 
@@ -293,6 +434,25 @@ def getDistroStore(guest, fetcher, skip_error):
     stores = _build_distro_list(osobj)
     cache = _DistroCache(fetcher)
 
+    detectcache = None
+    cachedir = _get_detect_cache_dir(guest)
+    if cachedir:
+        detectcache = _DetectCache(cachedir, fetcher.location, osobj.distro)
+
+    cached_distro = detectcache and detectcache.lookup(cache)
+    if cached_distro:
+        # Every store ahead of this one rejected the same file content
+        # last time, so check it first
+        for sclass in stores[:]:
+            if sclass.__name__ == cached_distro:
+                stores.remove(sclass)
+                stores.insert(0, sclass)
+    else:
+        probe_files = list(_TREEINFO_FILES)
+        for sclass in stores:
+            probe_files += sclass.probe_files
+        cache.prefetch(probe_files)
+
     for sclass in stores:
         if not sclass.is_valid(cache):
             continue
@@ -301,6 +461,8 @@ def getDistroStore(guest, fetcher, skip_error):
         log.debug(
             "Detected class=%s osvariant=%s", store.__class__.__name__, store.get_osdict_info()
         )
+        if detectcache and not cached_distro:
+            detectcache.store(cache, sclass)
         return store
 
     if skip_error:
@@ -337,6 +499,9 @@ class _DistroTree:
 
     PRETTY_NAME = None
     matching_distros = []
+    # Files is_valid may fetch, beyond the treeinfo. These are
+    # prefetched in parallel when possible
+    probe_files = []
 
     def __init__(self, location, arch, vmtype, cache):
         self.type = vmtype
@@ -491,6 +656,7 @@ class _SuseDistro(_RHELDistro):
     matching_distros = []
     _variant_prefix = NotImplementedError
     famregex = NotImplementedError
+    probe_files = ["content"]
 
     @classmethod
     def is_valid(cls, cache):
@@ -635,6 +801,12 @@ class _DebianDistro(_DistroTree):
     PRETTY_NAME = "Debian"
     matching_distros = ["debian"]
     _debname = "debian"
+    probe_files = [
+        "current/images/MANIFEST",
+        "current/legacy-images/MANIFEST",
+        "daily/MANIFEST",
+        ".disk/info",
+    ]
 
     @classmethod
     def is_valid(cls, cache):
@@ -782,6 +954,7 @@ class _MageiaDistro(_DistroTree):
     # https://distro.ibiblio.org/mageia/distrib/cauldron/x86_64/
     PRETTY_NAME = "Mageia"
     matching_distros = ["mageia"]
+    probe_files = ["VERSION"]
 
     @classmethod
     def is_valid(cls, cache):
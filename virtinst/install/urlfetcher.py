@@ -6,15 +6,16 @@
 #
 # Backends for the various URL types we support (http, https, ftp, local)
 
+import concurrent.futures
 import ftplib
 import io
 import os
 import subprocess
 import tempfile
+import threading
 import urllib
 
-import requests
-
+from .. import progress
 from ..logger import log
 
 
@@ -50,6 +51,69 @@ class _XorrisoReader:
         return ("'.%s'" % url) in self._cache_file_list
 
 
+##########################
+# Combined progress meter #
+##########################
+
+
+class _CombinedMeter:
+    """
+    Feeds progress from several concurrent downloads into a single
+    progress.Meter. The real meter is started once every download
+    has reported its size, so the total is known up front.
+    """
+
+    def __init__(self, meter, text, count):
+        self._meter = meter
+        self._text = text
+        self._count = count
+        self._lock = threading.Lock()
+        self._sizes = {}
+        self._totals = {}
+        self._started = False
+
+    def _child_start(self, key, size):
+        with self._lock:
+            self._sizes[key] = size
+            self._totals[key] = 0
+            if self._started or len(self._sizes) < self._count:
+                return
+            self._started = True
+            sizes = list(self._sizes.values())
+            total_size = None if None in sizes else sum(sizes)
+            self._meter.start(self._text, total_size)
+
+    def _child_update(self, key, total):
+        with self._lock:
+            self._totals[key] = total
+            if self._started:
+                self._meter.update(sum(self._totals.values()))
+
+    def child(self, key):
+        return _CombinedMeterChild(self, key)
+
+    def end(self):
+        with self._lock:
+            if self._started:
+                self._meter.end()
+
+
+class _CombinedMeterChild:
+    def __init__(self, combined, key):
+        self._combined = combined
+        self._key = key
+
+    def start(self, text, size):
+        ignore = text
+        self._combined._child_start(self._key, size)  # pylint: disable=protected-access
+
+    def update(self, new_total):
+        self._combined._child_update(self._key, new_total)  # pylint: disable=protected-access
+
+    def end(self):
+        pass
+
+
 ###########################
 # Fetcher implementations #
 ###########################
@@ -63,6 +127,8 @@ class _URLFetcher:
 
     _block_size = 16384
     _is_iso = False
+    # Max number of concurrent requests acquireFileContents will make
+    _max_parallel = 1
 
     def __init__(self, location, scratchdir, meter):
         self.location = location
@@ -85,11 +151,12 @@ class _URLFetcher:
             return self.location
         return os.path.join(self.location, filename)
 
-    def _grabURL(self, filename, fileobj, fullurl=None):
+    def _grabURL(self, filename, fileobj, fullurl=None, meter=None):
         """
         Download the filename from self.location, and write contents to
         fileobj
         """
+        meter = meter or self.meter
         if fullurl:
             url = fullurl
         else:
@@ -103,12 +170,12 @@ class _URLFetcher:
 
         log.debug("Fetching URI: %s", url)
         msg = _("Retrieving '%(filename)s'") % {"filename": os.path.basename(filename)}
-        self.meter.start(msg, size)
+        meter.start(msg, size)
 
-        self._write(urlobj, fileobj)
-        self.meter.end()
+        self._write(urlobj, fileobj, meter)
+        meter.end()
 
-    def _write(self, urlobj, fileobj):
+    def _write(self, urlobj, fileobj, meter):
         """
         Write the contents of urlobj to python file like object fileobj
         """
@@ -119,7 +186,7 @@ class _URLFetcher:
                 break
             fileobj.write(buff)
             total += len(buff)
-            self.meter.update(total)
+            meter.update(total)
         fileobj.flush()
         return total
 
@@ -140,6 +207,12 @@ class _URLFetcher:
         """
         return self._is_iso
 
+    def supports_parallel_fetch(self):
+        """
+        If acquireFileContents will actually fetch files concurrently
+        """
+        return self._max_parallel > 1
+
     def _prepare(self):
         """
         Perform any necessary setup
@@ -159,6 +232,17 @@ class _URLFetcher:
         """
         return True
 
+    def _map_parallel(self, func, items):
+        """
+        Return [func(item) for item in items], running up to
+        _max_parallel calls concurrently
+        """
+        workers = min(self._max_parallel, len(items))
+        if workers <= 1:
+            return [func(item) for item in items]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(func, items))
+
     def _hasFile(self, url):
         raise NotImplementedError("Must be implemented in subclass")
 
@@ -171,7 +255,15 @@ class _URLFetcher:
         log.debug("hasFile(%s) returning %s", url, ret)
         return ret
 
-    def acquireFile(self, filename, fullurl=None):
+    def hasFiles(self, filenames):
+        """
+        Return a dict of filename->hasFile(filename), checking
+        concurrently if the fetcher supports it
+        """
+        filenames = list(dict.fromkeys(filenames))
+        return dict(zip(filenames, self._map_parallel(self.hasFile, filenames)))
+
+    def acquireFile(self, filename, fullurl=None, meter=None):
         """
         Grab the passed filename from self.location and save it to
         a temporary file, returning the temp filename
@@ -186,7 +278,7 @@ class _URLFetcher:
             )
             fn = fileobj.name
 
-            self._grabURL(filename, fileobj, fullurl=fullurl)
+            self._grabURL(filename, fileobj, fullurl=fullurl, meter=meter)
             log.debug("Saved file to %s", fn)
             return fn
         except BaseException:  # pragma: no cover
@@ -194,6 +286,37 @@ class _URLFetcher:
                 os.unlink(fn)
             raise
 
+    def acquireFiles(self, filenames):
+        """
+        acquireFile for every passed filename, downloading concurrently
+        if the fetcher supports it, with combined progress reported
+        to self.meter. Returns the list of temp filenames.
+        """
+        if not self.supports_parallel_fetch() or len(filenames) < 2:
+            return [self.acquireFile(filename) for filename in filenames]
+
+        text = _("Retrieving '%(filename)s'") % {
+            "filename": "', '".join(os.path.basename(f) for f in filenames)
+        }
+        combined = _CombinedMeter(self.meter, text, len(filenames))
+        workers = min(self._max_parallel, len(filenames))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(self.acquireFile, filename, meter=combined.child(idx))
+                for idx, filename in enumerate(filenames)
+            ]
+            concurrent.futures.wait(futures)
+        combined.end()
+
+        ret = [f.result() for f in futures if not f.exception()]
+        for future in futures:
+            if future.exception():
+                # Don't leave the successful downloads lying around
+                for fn in ret:
+                    os.unlink(fn)
+                raise future.exception()
+        return ret
+
     def acquireFileContent(self, filename):
         """
         Grab the passed filename from self.location and return it as a string
@@ -202,12 +325,52 @@ class _URLFetcher:
         self._grabURL(filename, fileobj)
         return fileobj.getvalue().decode("utf-8")
 
+    def acquireFileContents(self, filenames):
+        """
+        Grab all the passed filenames from self.location, using up to
+        _max_parallel concurrent requests. Returns a dict of
+        filename->string, with None for any file that couldn't be fetched.
+
+        Progress isn't reported for these, they are expected to be
+        small files probed during distro detection.
+        """
+
+        def _fetch(filename):
+            fileobj = io.BytesIO()
+            try:
+                self._grabURL(filename, fileobj, meter=progress.make_meter(quiet=True))
+                return fileobj.getvalue().decode("utf-8")
+            except ValueError as e:
+                log.debug("Failed to acquire file=%s: %s", filename, e)
+                return None
+
+        filenames = list(dict.fromkeys(filenames))
+        log.debug("Fetching files=%s", filenames)
+        return dict(zip(filenames, self._map_parallel(_fetch, filenames)))
+
 
 class _HTTPURLFetcher(_URLFetcher):
     _session = None
+    _max_parallel = 8
+    # Files at least this big are downloaded as _range_parts parallel
+    # range requests, if the server supports it
+    _range_min_size = 32 * 1024 * 1024
+    _range_parts = 4
 
     def _prepare(self):
+        # requests is slow to import and only needed for HTTP installs
+        import requests
+        import requests.adapters
+
+        # requests.Session is safe to share between threads for plain
+        # GET/HEAD requests. Size the connection pool so that parallel
+        # probing reuses keepalive connections instead of discarding them.
         self._session = requests.Session()
+        for prefix in ["http://", "https://"]:
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=1, pool_maxsize=self._max_parallel
+            )
+            self._session.mount(prefix, adapter)
 
     def _cleanup(self):
         if self._session:
@@ -244,73 +407,259 @@ class _HTTPURLFetcher(_URLFetcher):
             size = None
         return response, size
 
-    def _write(self, urlobj, fileobj):
+    def _write(self, urlobj, fileobj, meter):
         """
         The requests object doesn't have a file-like read() option, so
         we need to implement it ourselves
         """
+        size = self._get_range_size(urlobj, fileobj)
+        if size:
+            url = urlobj.url
+            urlobj.close()
+            try:
+                return self._write_ranges(url, size, fileobj, meter)
+            except Exception as e:
+                log.debug("Range download of %s failed, using a single request: %s", url, e)
+            fileobj.seek(0)
+            fileobj.truncate()
+            urlobj = self._session.get(url, stream=True)
+            urlobj.raise_for_status()
+
         total = 0
         for data in urlobj.iter_content(chunk_size=self._block_size):
             fileobj.write(data)
             total += len(data)
-            self.meter.update(total)
+            meter.update(total)
         fileobj.flush()
         return total
 
+    def _get_range_size(self, response, fileobj):
+        """
+        Return the file size if we should download it as multiple
+        parallel range requests, otherwise None. Only done for big
+        files going to a real file, when the server says it supports
+        byte ranges and isn't compressing the response.
+        """
+        headers = response.headers
+        if "bytes" not in (headers.get("accept-ranges") or ""):
+            return None
+        if headers.get("content-encoding"):
+            return None  # pragma: no cover
+        try:
+            size = int(headers.get("content-length"))
+            fileobj.fileno()
+        except Exception:  # pragma: no cover
+            return None
+        if size < self._range_min_size:
+            return None
+        return size
+
+    def _write_ranges(self, url, size, fileobj, meter):
+        fd = fileobj.fileno()
+        os.ftruncate(fd, size)
+
+        chunk = -(-size // self._range_parts)
+        ranges = [(start, min(start + chunk, size) - 1) for start in range(0, size, chunk)]
+        lock = threading.Lock()
+        done = [0]
+        # Set when any range fails, so the others stop early and the
+        # caller can fall back to a single request
+        failed = threading.Event()
+        log.debug("Downloading %s with %d range requests", url, len(ranges))
+
+        def _fetch_range(byterange):
+            start, end = byterange
+            response = self._session.get(
+                url, stream=True, headers={"Range": "bytes=%d-%d" % (start, end)}
+            )
+            try:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise RuntimeError("Server ignored range request for %s" % url)
+
+                offset = start
+                for data in response.iter_content(chunk_size=self._block_size):
+                    if failed.is_set():
+                        break
+                    os.pwrite(fd, data, offset)
+                    offset += len(data)
+                    with lock:
+                        done[0] += len(data)
+                        meter.update(done[0])
+            except Exception:
+                failed.set()
+                raise
+            finally:
+                response.close()
+
+            if offset != end + 1:
+                failed.set()
+                raise RuntimeError(
+                    "Short read for %s range %d-%d: got %d bytes"
+                    % (url, start, end, offset - start)
+                )
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            list(executor.map(_fetch_range, ranges))
+        return size
+
 
 class _FTPURLFetcher(_URLFetcher):
-    _ftp = None
+    """
+    Keeps a small pool of logged in FTP connections, so parallel probes
+    and downloads don't pay for connect+login each time, and caches
+    directory listings so repeated hasFile checks cost one NLST.
+    """
+
+    _max_parallel = 4
+    _ftp_lock = None
+    _ftp_idle = None
 
     def _prepare(self):
-        if self._ftp:
+        if self._ftp_idle is not None:
             return  # pragma: no cover
 
+        self._ftp_lock = threading.Lock()
+        self._ftp_idle = []
+        self._listings = {}
+        # Serializes listings, so parallel hasFile checks of files in
+        # the same directory share one NLST
+        self._listing_lock = threading.Lock()
+        # Open the first connection now, so a bad URL errors early
+        self._put_ftp(self._connect())
+
+    def _connect(self):
         try:
             parsed = urllib.parse.urlparse(self.location)
-            self._ftp = ftplib.FTP()
+            ftp = ftplib.FTP()
             username = urllib.parse.unquote(parsed.username or "")
             password = urllib.parse.unquote(parsed.password or "")
-            self._ftp.connect(parsed.hostname, parsed.port or 0)
-            self._ftp.login(username, password)
+            ftp.connect(parsed.hostname, parsed.port or 0)
+            ftp.login(username, password)
             # Force binary mode
-            self._ftp.voidcmd("TYPE I")
+            ftp.voidcmd("TYPE I")
         except Exception as e:  # pragma: no cover
             msg = _("Opening URL %(url)s failed: %(error)s") % {
                 "url": self.location,
                 "error": str(e),
             }
             raise ValueError(msg) from None
+        return ftp
+
+    def _get_ftp(self):
+        with self._ftp_lock:
+            if self._ftp_idle:
+                return self._ftp_idle.pop()
+        return self._connect()
+
+    def _put_ftp(self, ftp, error=None):
+        """
+        Return a connection to the pool. If the command failed with
+        anything other than a plain FTP error reply, the connection
+        state is unknown, so close it instead.
+        """
+        if error is not None and not isinstance(error, ftplib.Error):
+            self._quit_ftp(ftp)
+            return
+        with self._ftp_lock:
+            if self._ftp_idle is not None and len(self._ftp_idle) < self._max_parallel:
+                self._ftp_idle.append(ftp)
+                return
+        self._quit_ftp(ftp)  # pragma: no cover
+
+    def _quit_ftp(self, ftp):
+        try:
+            ftp.quit()
+        except Exception:  # pragma: no cover
+            log.debug("Error quitting ftp connection", exc_info=True)
+
+    def _run_ftp(self, func):
+        ftp = self._get_ftp()
+        try:
+            ret = func(ftp)
+        except Exception as e:
+            self._put_ftp(ftp, error=e)
+            raise
+        self._put_ftp(ftp)
+        return ret
 
     def _grabber(self, url):
         """
-        Use urllib and ftplib to grab the file
+        Start a RETR on a pooled connection. The connection is
+        returned to the pool by _write once the transfer finishes
         """
-        request = urllib.request.Request(url)
-        urlobj = urllib.request.urlopen(request)
-        size = self._ftp.size(urllib.parse.urlparse(url)[2])
-        return urlobj, size
+        path = urllib.parse.urlparse(url)[2]
+        ftp = self._get_ftp()
+        try:
+            size = ftp.size(path)
+            sock = ftp.transfercmd("RETR " + path)
+        except Exception as e:
+            self._put_ftp(ftp, error=e)
+            raise
+        return (ftp, sock), size
+
+    def _write(self, urlobj, fileobj, meter):
+        ftp, sock = urlobj
+        try:
+            with sock, sock.makefile("rb") as sockfile:
+                total = super()._write(sockfile, fileobj, meter)
+            ftp.voidresp()
+        except Exception as e:  # pragma: no cover
+            self._put_ftp(ftp, error=e)
+            raise
+        self._put_ftp(ftp)
+        return total
 
     def _cleanup(self):
-        if not self._ftp:
+        if self._ftp_idle is None:
             return  # pragma: no cover
 
-        try:
-            self._ftp.quit()
-        except Exception:  # pragma: no cover
-            log.debug("Error quitting ftp connection", exc_info=True)
+        with self._ftp_lock:
+            idle = self._ftp_idle
+            self._ftp_idle = None
+        for ftp in idle:
+            self._quit_ftp(ftp)
 
-        self._ftp = None
+    def _list_dir(self, dirpath):
+        """
+        Return the set of file names in dirpath, or None if the
+        server won't give us a listing
+        """
+        with self._listing_lock:
+            if dirpath not in self._listings:
+                try:
+                    names = self._run_ftp(lambda ftp: ftp.nlst(dirpath))
+                    listing = set(os.path.basename(n.rstrip("/")) for n in names)
+                except ftplib.all_errors as e:
+                    log.debug("FTP listing %s failed: %s", dirpath, str(e))
+                    listing = None
+                self._listings[dirpath] = listing
+            return self._listings[dirpath]
 
     def _hasFile(self, url):
         path = urllib.parse.urlparse(url)[2]
+        dirpath, basename = os.path.split(path.rstrip("/"))
+
+        # Many servers hide dotfiles from NLST, so only trust a
+        # negative listing result for regular names
+        listing = None
+        if basename:
+            listing = self._list_dir(dirpath or "/")
+        if listing is not None and basename in listing:
+            return True
+        if listing is not None and not basename.startswith("."):
+            return False
 
-        try:
+        def _check(ftp):
             try:
                 # If it's a file
-                self._ftp.size(path)
+                ftp.size(path)
             except ftplib.all_errors:  # pragma: no cover
                 # If it's a dir
-                self._ftp.cwd(path)
+                ftp.cwd(path)
+
+        try:
+            self._run_ftp(_check)
         except ftplib.all_errors as e:  # pragma: no cover
             log.debug("FTP hasFile: couldn't access %s: %s", url, str(e))
             return False
@@ -358,15 +707,18 @@ class _ISOURLFetcher(_URLFetcher):
 
 
 class DirectFetcher(_URLFetcher):
+    # Each file gets its own fetcher, so they can always run in parallel
+    _max_parallel = 2
+
     def _make_full_url(self, filename):
         return filename
 
-    def acquireFile(self, filename, fullurl=None):
+    def acquireFile(self, filename, fullurl=None, meter=None):
         if not fullurl:
             fullurl = filename
         filename = os.path.basename(filename)
         fetcher = fetcherForURI(fullurl, self.scratchdir, self.meter, direct=True)
-        return fetcher.acquireFile(filename, fullurl)  # pylint: disable=protected-access
+        return fetcher.acquireFile(filename, fullurl, meter=meter)
 
     def _hasFile(self, url):
         return True
@@ -4,7 +4,12 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import errno
 import os
+import queue
+import threading
+
+import libvirt
 
 from .. import progress
 from ..devices import DeviceDisk
@@ -36,23 +41,193 @@ def _build_pool(conn, meter, path):
     return ret
 
 
+# Size of each read from the source file
+DEFAULT_BLOCK_SIZE = 4 * 1024 * 1024
+# Max bytes passed to a single stream.send(). libvirt splits sends into
+# RPC messages of at most 256KiB, and the python bindings need a bytes
+# object, so this bounds how much is copied per send
+_SEND_CHUNK_SIZE = 256 * 1024
+# Number of blocks the reader thread may have read ahead of the sender
+_READ_AHEAD = 2
+
+
 class _MockStream:
-    _data_size = None
+    """
+    virStream stand in for the test suite. Like a real stream it may
+    accept less than it's passed per send() call
+    """
 
-    def send(self, data):
-        if self._data_size is None:
-            self._data_size = len(data)
+    _max_send = 64 * 1024
+
+    def __init__(self):
+        self.data_bytes = 0
+        self.hole_bytes = 0
+        # List of ("data"|"hole", length), adjacent sends merged
+        self.extents = []
+
+    def _add_extent(self, kind, length):
+        if self.extents and self.extents[-1][0] == kind:
+            length += self.extents.pop()[1]
+        self.extents.append((kind, length))
 
-        block_size = 128
-        ret = min(self._data_size, block_size)
-        self._data_size = max(0, self._data_size - block_size)
+    def send(self, data):
+        ret = min(len(data), self._max_send)
+        self.data_bytes += ret
+        self._add_extent("data", ret)
         return ret
 
+    def sendHole(self, length, flags=0):
+        ignore = flags
+        self.hole_bytes += length
+        self._add_extent("hole", length)
+        return 0
+
     def finish(self):
         pass
 
 
-def _upload_file(conn, meter, destpool, src):
+def _is_sparse(path):
+    if not hasattr(os, "SEEK_DATA"):
+        return False  # pragma: no cover
+    st = os.stat(path)
+    return st.st_blocks * 512 < st.st_size
+
+
+def _file_extents(fileobj, size, sparse):
+    """
+    Yield (offset, length, is_data) for the file. If sparse, holes are
+    found with SEEK_DATA/SEEK_HOLE, otherwise it's all one data extent
+    """
+    if not sparse:
+        yield 0, size, True
+        return
+
+    fd = fileobj.fileno()
+    offset = 0
+    while offset < size:
+        try:
+            data = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno != errno.ENXIO:
+                raise  # pragma: no cover
+            # Only a hole left until EOF
+            data = size
+        data = min(data, size)
+        if data > offset:
+            yield offset, data - offset, False
+        if data >= size:
+            break
+
+        hole = min(os.lseek(fd, data, os.SEEK_HOLE), size)
+        yield data, hole - data, True
+        offset = hole
+
+
+class _FileReader:
+    """
+    Reads the source file in a separate thread into a small set of
+    reusable buffers, so disk reads overlap with stream sends.
+    Consumers iterate over ("data", buffer, nbytes) and
+    ("hole", length) items, and must hand data buffers back with
+    release() once sent.
+    """
+
+    def __init__(self, fileobj, size, block_size, sparse):
+        self._fileobj = fileobj
+        self._size = size
+        self._block_size = block_size
+        self._sparse = sparse
+        self._queue = queue.Queue()
+        self._free = queue.Queue()
+        for dummy in range(_READ_AHEAD):
+            self._free.put(bytearray(block_size))
+        self._stopped = False
+        self._thread = threading.Thread(
+            target=self._read_thread, name="Volume upload reader", daemon=True
+        )
+
+    def _read_blocks(self):
+        for offset, length, is_data in _file_extents(self._fileobj, self._size, self._sparse):
+            if not is_data:
+                self._queue.put(("hole", length))
+                continue
+
+            self._fileobj.seek(offset)
+            while length > 0:
+                buf = self._free.get()
+                if self._stopped:
+                    return
+                nbytes = self._fileobj.readinto(memoryview(buf)[: min(self._block_size, length)])
+                if not nbytes:
+                    # File shrunk underneath us
+                    self._free.put(buf)  # pragma: no cover
+                    return  # pragma: no cover
+                self._queue.put(("data", buf, nbytes))
+                length -= nbytes
+
+    def _read_thread(self):
+        try:
+            self._read_blocks()
+            self._queue.put(None)
+        except Exception as e:  # pragma: no cover
+            self._queue.put(("error", e))
+
+    def __iter__(self):
+        self._thread.start()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                if item[0] == "error":
+                    raise item[1]  # pragma: no cover
+                yield item
+        finally:
+            # Unblock the reader if the consumer bailed early
+            self._stopped = True
+            self._free.put(bytearray(0))
+
+    def release(self, buf):
+        self._free.put(buf)
+
+
+def _send_all(stream, buf, nbytes):
+    """
+    Send nbytes of buf, handling partial sends. Slicing the memoryview
+    doesn't copy, but libvirt requires a bytes object, so each send
+    copies up to _SEND_CHUNK_SIZE bytes. After a partial send, only the
+    unsent rest of that chunk is copied again, never the whole buffer.
+    """
+    view = memoryview(buf)[:nbytes]
+    while view:
+        ret = stream.send(bytes(view[:_SEND_CHUNK_SIZE]))
+        if ret <= 0:  # pragma: no cover
+            # Our stream is blocking, so -2 (would block) is an error too
+            raise RuntimeError("Stream send failed with %d, %d bytes unsent" % (ret, len(view)))
+        view = view[ret:]
+
+
+def _stream_file(stream, fileobj, size, meter, block_size, sparse):
+    """
+    Send the contents of fileobj over stream, reporting to meter.
+    Returns the number of bytes covered, including skipped holes
+    """
+    total = 0
+    reader = _FileReader(fileobj, size, block_size, sparse)
+    for item in reader:
+        if item[0] == "hole":
+            stream.sendHole(item[1], 0)
+            total += item[1]
+        else:
+            dummy, buf, nbytes = item
+            _send_all(stream, buf, nbytes)
+            reader.release(buf)
+            total += nbytes
+        meter.update(total)
+    return total
+
+
+def _upload_file(conn, meter, destpool, src, block_size):
     """
     Helper for uploading a file to a pool, via libvirt. Used for
     kernel/initrd upload when we can't access the system scratchdir
@@ -63,13 +238,6 @@ def _upload_file(conn, meter, destpool, src):
     else:
         stream = conn.newStream(0)  # pragma: no cover
 
-    def safe_send(data):
-        while True:
-            ret = stream.send(data)
-            if ret == 0 or ret == len(data):
-                break
-            data = data[ret:]
-
     meter = progress.ensure_meter(meter)
 
     # Build placeholder volume
@@ -96,25 +264,18 @@ def _upload_file(conn, meter, destpool, src):
         offset = 0
         length = size
         flags = 0
+        sparse = _is_sparse(src) and conn.support.conn_sparse_stream()
+        if sparse:
+            log.debug("Uploading %s as a sparse stream", src)
+            flags |= libvirt.VIR_STORAGE_VOL_UPLOAD_SPARSE_STREAM
         if not conn.in_testsuite():
             vol.upload(stream, offset, length, flags)  # pragma: no cover
 
-        # Open source file
-        fileobj = open(src, "rb")
-
         # Start transfer
-        total = 0
         msg = _("Transferring '%(filename)s'") % {"filename": os.path.basename(src)}
         meter.start(msg, size)
-        while True:
-            blocksize = 1024 * 1024  # 1 MiB
-            data = fileobj.read(blocksize)
-            if not data:
-                break
-
-            safe_send(data)
-            total += len(data)
-            meter.update(total)
+        with open(src, "rb") as fileobj:
+            _stream_file(stream, fileobj, size, meter, block_size, sparse)
 
         # Cleanup
         stream.finish()
@@ -126,9 +287,11 @@ def _upload_file(conn, meter, destpool, src):
     return vol
 
 
-def upload_paths(conn, system_scratchdir, meter, pathlist):
+def upload_paths(conn, system_scratchdir, meter, pathlist, block_size=DEFAULT_BLOCK_SIZE):
     """
     Upload passed paths to the connection scratchdir
+
+    :param block_size: Size of each read from the source files
     """
     # Build pool
     log.debug("Uploading kernel/initrd media")
@@ -138,7 +301,7 @@ def upload_paths(conn, system_scratchdir, meter, pathlist):
     newpaths = []
     try:
         for path in pathlist:
-            vol = _upload_file(conn, meter, pool, path)
+            vol = _upload_file(conn, meter, pool, path, block_size)
             newpaths.append(vol.path())
             tmpvols.append(vol)
     except Exception:  # pragma: no cover
@@ -10,21 +10,37 @@ import uuid
 from .xmlbuilder import XMLBuilder, XMLProperty, XMLChildProperty
 
 
-def _compare_int(nodedev_val, hostdev_val):
-    def _intify(val):
-        try:
-            if "0x" in str(val):
-                return int(val or "0x00", 16)
-            else:
-                return int(val)
-        except Exception:
-            return -1
+def _intify(val):
+    try:
+        if "0x" in str(val):
+            return int(val or "0x00", 16)
+        else:
+            return int(val)
+    except Exception:
+        return -1
 
+
+def _compare_int(nodedev_val, hostdev_val):
     nodedev_val = _intify(nodedev_val)
     hostdev_val = _intify(hostdev_val)
     return nodedev_val == hostdev_val or hostdev_val == -1
 
 
+def _normalize_uuid(val):
+    try:
+        return str(uuid.UUID(val))
+    except Exception:
+        return None
+
+
+def _make_hostdev_key(hostdev_type, *values):
+    # Any unset value acts as a wildcard in compare_to_hostdev, so
+    # those hostdevs are filed under the bare type
+    if any(val in [-1, None] for val in values):
+        return (hostdev_type,)
+    return (hostdev_type,) + values
+
+
 def _compare_uuid(nodedev_val, hostdev_val):
     try:
         nodedev_val = uuid.UUID(nodedev_val)
@@ -116,6 +132,48 @@ class NodeDevice(XMLBuilder):
 
         return False
 
+    @staticmethod
+    def get_hostdev_key(hostdev):
+        """
+        Return a hashable key for the host device address the passed
+        DeviceHostdev refers to, or None if it isn't a type that
+        compare_to_hostdev handles. Hostdevs that don't specify a full
+        address get a key of just (type,), and may match any nodedev
+        of that type.
+        """
+        if hostdev.type == "pci":
+            return _make_hostdev_key(
+                "pci",
+                _intify(hostdev.bus),
+                _intify(hostdev.slot),
+                _intify(hostdev.function),
+            )
+        if hostdev.type == "usb":
+            return _make_hostdev_key("usb", _intify(hostdev.vendor), _intify(hostdev.product))
+        if hostdev.type == "mdev":
+            return _make_hostdev_key("mdev", _normalize_uuid(hostdev.uuid))
+        return None
+
+    def get_hostdev_lookup_keys(self):
+        """
+        Return the get_hostdev_key() values of every hostdev that may
+        match this nodedev in compare_to_hostdev
+        """
+        if self.device_type == "pci":
+            key = _make_hostdev_key(
+                "pci", _intify(self.bus), _intify(self.slot), _intify(self.function)
+            )
+        elif self.device_type == "usb_device":
+            key = _make_hostdev_key("usb", _intify(self.vendor_id), _intify(self.product_id))
+        elif self.device_type == "mdev":
+            key = _make_hostdev_key("mdev", _normalize_uuid(self.get_mdev_uuid()))
+        else:
+            return []
+
+        if len(key) == 1:
+            return [key]  # pragma: no cover
+        return [key, key[:1]]
+
     ########################
     # XML helper functions #
     ########################
@@ -10,12 +10,30 @@ import datetime
 import os
 import re
 
-from gi.repository import Libosinfo
-
 from . import xmlutil
 from .logger import log
 
 
+class _LazyLibosinfo:
+    """
+    Stand-in for the Libosinfo gi module that only loads the typelib
+    on first attribute access. Loading it is one of the most expensive
+    parts of virtinst startup, and lots of CLI paths never need it.
+    """
+
+    _module = None
+
+    def __getattr__(self, name):
+        if _LazyLibosinfo._module is None:
+            from gi.repository import Libosinfo as _Libosinfo
+
+            _LazyLibosinfo._module = _Libosinfo
+        return getattr(_LazyLibosinfo._module, name)
+
+
+Libosinfo = _LazyLibosinfo()
+
+
 def _media_create_from_location(location):
     if not hasattr(Libosinfo.Media, "create_from_location_with_flags"):
         return Libosinfo.Media.create_from_location(location, None)  # pragma: no cover
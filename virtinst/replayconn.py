@@ -0,0 +1,599 @@
+#
+# Record and replay libvirt connection traffic
+#
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import atexit
+import gzip
+import json
+import os
+import threading
+import time
+import uuid
+
+from .logger import log
+
+FIXTURE_VERSION = 1
+
+# Fixture entries with this args key match any arguments
+ANY_ARGS = "*"
+
+# Method used to build a stable identity for each libvirt object type
+_KEY_METHODS = {
+    "virDomain": "UUIDString",
+    "virNetwork": "UUIDString",
+    "virStoragePool": "UUIDString",
+    "virStorageVol": "key",
+    "virNodeDevice": "name",
+    "virDomainSnapshot": "getName",
+    "virInterface": "MACString",
+    "virSecret": "UUIDString",
+}
+
+# Calls that only make sense against a live connection. They are passed
+# through when recording, and fail as unsupported when replaying, so
+# virt-manager falls back to polling.
+_UNRECORDED_METHODS = ["newStream", "openConsole", "openGraphicsFD", "screenshot"]
+
+
+def _is_recordable(name):
+    if name in _UNRECORDED_METHODS:
+        return False
+    return not ("Event" in name or "Callback" in name)
+
+
+def _raise_nosupport_error(msg):
+    import libvirt
+
+    err = [libvirt.VIR_ERR_NO_SUPPORT, None, msg, None, None, None]
+    exc = libvirt.libvirtError(msg)
+    exc.err = err
+    raise exc
+
+
+def _libvirt_kind(obj):
+    name = type(obj).__name__
+    if name in _KEY_METHODS or name == "virConnect":
+        return name
+    return None
+
+
+def _args_key(args):
+    return json.dumps(args, sort_keys=True)
+
+
+def load_fixture(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("version") != FIXTURE_VERSION:
+        raise RuntimeError("Unsupported fixture version in %s" % path)
+    return data
+
+
+def save_fixture(path, data):
+    tmppath = path + ".tmp"
+    with gzip.open(tmppath, "wt", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmppath, path)
+
+
+def _new_fixture(uri):
+    return {"version": FIXTURE_VERSION, "uri": uri, "objects": {}}
+
+
+def _set_result(data, ref, name, argskey, result):
+    objkey = "%s:%s" % tuple(ref)
+    methods = data["objects"].setdefault(objkey, {})
+    methods.setdefault(name, {})[argskey] = result
+
+
+#############
+# Recording #
+#############
+
+
+class _RecordingProxy:
+    """
+    Wrap a libvirt object, passing every call through to it and
+    recording the results with the owning FixtureRecorder
+    """
+
+    def __init__(self, recorder, obj, ref):
+        self.__dict__["_recorder"] = recorder
+        self.__dict__["_obj"] = obj
+        self.__dict__["_ref"] = ref
+
+    @property
+    def __class__(self):
+        # Keep isinstance checks against libvirt classes working
+        return type(self._obj)
+
+    def __getattr__(self, name):
+        attr = getattr(self._obj, name)
+        if name.startswith("_") or not callable(attr) or not _is_recordable(name):
+            return attr
+
+        def _record_wrapper(*args):
+            result = attr(*args)
+            self._recorder.record(self._ref, name, args, result)
+            return self._recorder.wrap(result)
+
+        return _record_wrapper
+
+    def __setattr__(self, name, value):
+        setattr(self._obj, name, value)
+
+    def __eq__(self, other):
+        return self._ref == getattr(other, "_ref", None)
+
+    def __hash__(self):
+        return hash(tuple(self._ref))
+
+
+class FixtureRecorder:
+    """
+    Record libvirt API responses into a fixture file which can be
+    served offline by ReplayConnection. The file is written when the
+    connection is closed, and at exit.
+    """
+
+    def __init__(self, path, uri):
+        self._path = path
+        self._data = _new_fixture(uri)
+        self._lock = threading.Lock()
+        self._saved = False
+        self._seen = set()
+        atexit.register(self.save)
+
+    def _get_ref(self, obj):
+        kind = _libvirt_kind(obj)
+        if kind == "virConnect":
+            return [kind, ""]
+        return [kind, getattr(obj, _KEY_METHODS[kind])()]
+
+    def _encode(self, value):
+        if isinstance(value, _RecordingProxy):
+            return {"__ref__": value._ref}  # pylint: disable=protected-access
+        if _libvirt_kind(value):
+            return {"__ref__": self._get_ref(value)}
+        if isinstance(value, (list, tuple)):
+            return [self._encode(v) for v in value]
+        if isinstance(value, dict):
+            return {str(k): self._encode(v) for k, v in value.items()}
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return value
+        return "<%s>" % type(value).__name__
+
+    def _record_identity(self, obj, ref):
+        # Lookups go through name() a lot, record it up front so replay
+        # works even if nothing called it while recording
+        if tuple(ref) in self._seen or not hasattr(obj, "name"):
+            return
+        self._seen.add(tuple(ref))
+        self.record(ref, "name", (), obj.name())
+
+    def wrap(self, value):
+        if _libvirt_kind(value):
+            ref = self._get_ref(value)
+            self._record_identity(value, ref)
+            return _RecordingProxy(self, value, ref)
+        if isinstance(value, list):
+            return [self.wrap(v) for v in value]
+        if isinstance(value, tuple):
+            return tuple(self.wrap(v) for v in value)
+        return value
+
+    def record(self, ref, name, args, result):
+        argskey = _args_key(self._encode(args))
+        with self._lock:
+            _set_result(self._data, ref, name, argskey, self._encode(result))
+            self._saved = False
+
+    def save(self):
+        with self._lock:
+            if self._saved:
+                return
+            try:
+                save_fixture(self._path, self._data)
+                self._saved = True
+                log.debug("Saved libvirt fixture to %s", self._path)
+            except Exception:  # pragma: no cover
+                log.debug("Error saving fixture %s", self._path, exc_info=True)
+
+    def wrap_conn(self, conn):
+        proxy = _RecordingProxy(self, conn, ["virConnect", ""])
+        origclose = conn.close
+
+        def _close():
+            ret = origclose()
+            self.save()
+            return ret
+
+        proxy.__dict__["close"] = _close
+        return proxy
+
+
+#############
+# Replaying #
+#############
+
+
+class _ReplayObject:
+    """
+    Stand in for a libvirt object, answering calls from a fixture
+    """
+
+    def __init__(self, replay, kind, key):
+        self._replay = replay
+        self._kind = kind
+        self._key = key
+
+    @property
+    def __class__(self):
+        import libvirt
+
+        return getattr(libvirt, self._kind)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def _replay_wrapper(*args):
+            return self._replay.call(self._kind, self._key, name, args)
+
+        return _replay_wrapper
+
+    def __eq__(self, other):
+        return (self._kind, self._key) == (
+            getattr(other, "_kind", None),
+            getattr(other, "_key", None),
+        )
+
+    def __hash__(self):
+        return hash((self._kind, self._key))
+
+
+class ReplayConnection(_ReplayObject):
+    """
+    Fake virConnect serving the contents of a fixture, sleeping for
+    latency seconds on every call to simulate a remote host. Calls
+    with no recorded result fail with VIR_ERR_NO_SUPPORT.
+    """
+
+    def __init__(self, fixture, latency=0):
+        _ReplayObject.__init__(self, self, "virConnect", "")
+        self._objects = fixture["objects"]
+        self._latency = latency
+        self._uri = fixture.get("uri")
+
+    def _encode_arg(self, value):
+        if isinstance(value, _ReplayObject):
+            return {"__ref__": [value._kind, value._key]}  # pylint: disable=protected-access
+        if isinstance(value, (list, tuple)):
+            return [self._encode_arg(v) for v in value]
+        if isinstance(value, dict):
+            return {str(k): self._encode_arg(v) for k, v in value.items()}
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return value
+        return "<%s>" % type(value).__name__
+
+    def _decode(self, value):
+        if isinstance(value, dict):
+            if "__ref__" in value:
+                kind, key = value["__ref__"]
+                return _ReplayObject(self, kind, key)
+            return {k: self._decode(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._decode(v) for v in value]
+        return value
+
+    def _filter_all_stats(self, doms):
+        # Serve stats for a subset of domains from getAllDomainStats
+        results = self._objects.get("virConnect:", {}).get("getAllDomainStats", {})
+        if not results:
+            _raise_nosupport_error("getAllDomainStats not in replay fixture")
+        wanted = set(tuple(self._encode_arg(dom)["__ref__"]) for dom in doms)
+        allstats = list(results.values())[-1]
+        return self._decode(
+            [entry for entry in allstats if tuple(entry[0]["__ref__"]) in wanted]
+        )
+
+    def call(self, kind, key, name, args):
+        if self._latency:
+            time.sleep(self._latency)
+
+        methods = self._objects.get("%s:%s" % (kind, key), {})
+        results = methods.get(name, {})
+        argskey = _args_key(self._encode_arg(args))
+        if argskey in results:
+            return self._decode(results[argskey])
+        if ANY_ARGS in results:
+            return self._decode(results[ANY_ARGS])
+
+        if name == _KEY_METHODS.get(kind):
+            return key
+
+        if kind == "virConnect" and name == "domainListGetStats" and args:
+            return self._filter_all_stats(args[0])
+        if kind == "virConnect" and name == "close":
+            return 0
+        _raise_nosupport_error("%s.%s%s not in replay fixture" % (kind, name, args))
+
+
+######################
+# Synthetic fixtures #
+######################
+
+
+_CAPS_XML = """<capabilities>
+  <host>
+    <uuid>%(uuid)s</uuid>
+    <cpu><arch>x86_64</arch></cpu>
+  </host>
+  <guest>
+    <os_type>hvm</os_type>
+    <arch name="x86_64">
+      <wordsize>64</wordsize>
+      <emulator>/usr/bin/qemu-system-x86_64</emulator>
+      <machine canonical="pc-q35-8.2">q35</machine>
+      <domain type="qemu"/>
+      <domain type="kvm"/>
+    </arch>
+    <features><acpi default="on" toggle="yes"/><apic default="on" toggle="no"/></features>
+  </guest>
+</capabilities>"""
+
+_DOMAIN_XML = """<domain type="kvm"%(id)s>
+  <name>%(name)s</name>
+  <uuid>%(uuid)s</uuid>
+  <memory unit="KiB">1048576</memory>
+  <currentMemory unit="KiB">1048576</currentMemory>
+  <vcpu placement="static">2</vcpu>
+  <os><type arch="x86_64" machine="pc-q35-8.2">hvm</type></os>
+  <devices>
+    <emulator>/usr/bin/qemu-system-x86_64</emulator>
+    <disk type="file" device="disk">
+      <driver name="qemu" type="qcow2"/>
+      <source file="%(disk)s"/>
+      <target dev="vda" bus="virtio"/>
+    </disk>
+    <interface type="network">
+      <mac address="%(mac)s"/>
+      <source network="default"/>
+      <model type="virtio"/>
+    </interface>
+    <graphics type="vnc" port="-1" autoport="yes"/>
+  </devices>
+</domain>"""
+
+_POOL_XML = """<pool type="dir">
+  <name>default</name>
+  <uuid>%(uuid)s</uuid>
+  <capacity unit="bytes">%(capacity)d</capacity>
+  <allocation unit="bytes">%(allocation)d</allocation>
+  <available unit="bytes">%(available)d</available>
+  <target><path>/var/lib/libvirt/images</path></target>
+</pool>"""
+
+_VOL_XML = """<volume type="file">
+  <name>%(name)s</name>
+  <key>%(path)s</key>
+  <capacity unit="bytes">%(capacity)d</capacity>
+  <allocation unit="bytes">%(allocation)d</allocation>
+  <target>
+    <path>%(path)s</path>
+    <format type="qcow2"/>
+  </target>
+</volume>"""
+
+_NETWORK_XML = """<network>
+  <name>default</name>
+  <uuid>%(uuid)s</uuid>
+  <forward mode="nat"/>
+  <bridge name="virbr0"/>
+  <ip address="192.168.122.1" netmask="255.255.255.0">
+    <dhcp><range start="192.168.122.2" end="192.168.122.254"/></dhcp>
+  </ip>
+</network>"""
+
+_NODEDEV_XML = """<device>
+  <name>%(name)s</name>
+  <parent>computer</parent>
+  <capability type="pci">
+    <domain>0</domain>
+    <bus>%(bus)d</bus>
+    <slot>%(slot)d</slot>
+    <function>0</function>
+    <product id="0x1000">Synthetic device</product>
+    <vendor id="0x1af4">Red Hat, Inc.</vendor>
+  </capability>
+</device>"""
+
+
+class _FixtureBuilder:
+    def __init__(self, uri):
+        self.data = _new_fixture(uri)
+
+    def set(self, ref, name, result, args=None):
+        argskey = ANY_ARGS if args is None else _args_key(args)
+        _set_result(self.data, ref, name, argskey, result)
+
+    def set_many(self, ref, results):
+        for name, result in results.items():
+            self.set(ref, name, result)
+
+
+def generate_fixture(ndomains, nvolumes, nnodedevs=0, uri="qemu:///system"):
+    """
+    Build a fixture for a fake host with ndomains domains, half of them
+    running, nvolumes volumes in the default pool, and nnodedevs PCI
+    devices. Everything is derived from the indexes, so output is
+    reproducible.
+    """
+    builder = _FixtureBuilder(uri)
+    conn = ["virConnect", ""]
+
+    def _uuid(kind, idx):
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, "virtinst-fixture/%s/%d" % (kind, idx)))
+
+    domrefs = []
+    allstats = []
+    for idx in range(ndomains):
+        name = "vm-%05d" % idx
+        domuuid = _uuid("domain", idx)
+        active = idx % 2 == 0
+        domid = active and idx + 1 or -1
+        ref = ["virDomain", domuuid]
+        domrefs.append({"__ref__": ref})
+
+        xml = _DOMAIN_XML % {
+            "id": active and (' id="%d"' % domid) or "",
+            "name": name,
+            "uuid": domuuid,
+            "disk": "/var/lib/libvirt/images/vol-%05d.qcow2" % idx,
+            "mac": "52:54:00:%02x:%02x:%02x" % ((idx >> 16) & 0xFF, (idx >> 8) & 0xFF, idx & 0xFF),
+        }
+        state = active and 1 or 5
+        cputime = active and (idx + 1) * 1000000000 or 0
+        builder.set_many(
+            ref,
+            {
+                "name": name,
+                "UUIDString": domuuid,
+                "ID": domid,
+                "XMLDesc": xml,
+                "info": [state, 1048576, 1048576, 2, cputime],
+                "state": [state, 1],
+                "isActive": int(active),
+                "isPersistent": 1,
+                "autostart": 0,
+                "hasManagedSaveImage": 0,
+                "hasCurrentSnapshot": 0,
+                "listAllSnapshots": [],
+                "memoryStats": {},
+            },
+        )
+        allstats.append(
+            [
+                {"__ref__": ref},
+                {
+                    "state.state": state,
+                    "state.reason": 1,
+                    "cpu.time": cputime,
+                    "balloon.current": 1048576,
+                    "balloon.maximum": 1048576,
+                    "vcpu.current": 2,
+                    "vcpu.maximum": 2,
+                    "net.count": 1,
+                    "net.0.rx.bytes": idx * 1024,
+                    "net.0.tx.bytes": idx * 512,
+                    "block.count": 1,
+                    "block.0.rd.bytes": idx * 4096,
+                    "block.0.wr.bytes": idx * 2048,
+                },
+            ]
+        )
+
+    volcapacity = 10 * 1024 * 1024 * 1024
+    volalloc = 1024 * 1024 * 1024
+    volrefs = []
+    for idx in range(nvolumes):
+        name = "vol-%05d.qcow2" % idx
+        path = "/var/lib/libvirt/images/" + name
+        ref = ["virStorageVol", path]
+        volrefs.append({"__ref__": ref})
+        builder.set_many(
+            ref,
+            {
+                "name": name,
+                "key": path,
+                "path": path,
+                "XMLDesc": _VOL_XML
+                % {"name": name, "path": path, "capacity": volcapacity, "allocation": volalloc},
+                "info": [0, volcapacity, volalloc],
+            },
+        )
+        builder.set(conn, "storageVolLookupByPath", {"__ref__": ref}, args=[path])
+        builder.set(conn, "storageVolLookupByKey", {"__ref__": ref}, args=[path])
+
+    pooluuid = _uuid("pool", 0)
+    poolref = ["virStoragePool", pooluuid]
+    poolcapacity = max(nvolumes * volcapacity, volcapacity) * 2
+    poolalloc = nvolumes * volalloc
+    builder.set_many(
+        poolref,
+        {
+            "name": "default",
+            "UUIDString": pooluuid,
+            "XMLDesc": _POOL_XML
+            % {
+                "uuid": pooluuid,
+                "capacity": poolcapacity,
+                "allocation": poolalloc,
+                "available": poolcapacity - poolalloc,
+            },
+            "info": [2, poolcapacity, poolalloc, poolcapacity - poolalloc],
+            "isActive": 1,
+            "isPersistent": 1,
+            "autostart": 1,
+            "refresh": 0,
+            "listAllVolumes": volrefs,
+        },
+    )
+    builder.set(conn, "storagePoolLookupByName", {"__ref__": poolref}, args=["default"])
+
+    netuuid = _uuid("network", 0)
+    netref = ["virNetwork", netuuid]
+    builder.set_many(
+        netref,
+        {
+            "name": "default",
+            "UUIDString": netuuid,
+            "XMLDesc": _NETWORK_XML % {"uuid": netuuid},
+            "isActive": 1,
+            "isPersistent": 1,
+            "autostart": 1,
+        },
+    )
+    builder.set(conn, "networkLookupByName", {"__ref__": netref}, args=["default"])
+
+    devrefs = []
+    for idx in range(nnodedevs):
+        bus = idx // 32
+        slot = idx % 32
+        name = "pci_0000_%02x_%02x_0" % (bus, slot)
+        ref = ["virNodeDevice", name]
+        devrefs.append({"__ref__": ref})
+        builder.set_many(
+            ref,
+            {
+                "name": name,
+                "XMLDesc": _NODEDEV_XML % {"name": name, "bus": bus, "slot": slot},
+                "listCaps": ["pci"],
+                "parent": "computer",
+                "isActive": 1,
+            },
+        )
+
+    builder.set_many(
+        conn,
+        {
+            "getURI": uri,
+            "getHostname": "fixture-host",
+            "getVersion": 8002000,
+            "getLibVersion": 10000000,
+            "getCapabilities": _CAPS_XML % {"uuid": _uuid("host", 0)},
+            "getInfo": ["x86_64", 262144, 64, 2400, 1, 2, 16, 2],
+            "isAlive": 1,
+            "setKeepAlive": 0,
+            "listAllDomains": domrefs,
+            "listAllStoragePools": [{"__ref__": poolref}],
+            "listAllNetworks": [{"__ref__": netref}],
+            "listAllDevices": devrefs,
+            "listAllInterfaces": [],
+            "getAllDomainStats": allstats,
+            "close": 0,
+        },
+    )
+    return builder.data
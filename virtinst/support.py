@@ -109,6 +109,8 @@ class _SupportCheck:
         hv_version=None,
         hv_libvirt_version=None,
     ):
+        # Set to the SupportCache attribute name after class creation
+        self.name = None
         self.function = function
         self.run_args = run_args
         self.flag = flag
@@ -189,10 +191,20 @@ def _make(*args, **kwargs):
 
     def cache_wrapper(self, data=None):
         if support_obj not in self._cache:
-            support_ret = support_obj(self._virtconn, data or self._virtconn)
+            support_ret = None
+            # Only connection wide results are persisted, checks against
+            # a specific object like a virDomain can vary
+            persist = bool(self._persistent and not data)
+            if persist:
+                support_ret = self._persistent.get_support(support_obj.name)
+            if support_ret is None:
+                support_ret = support_obj(self._virtconn, data or self._virtconn)
+                if persist:
+                    self._persistent.set_support(support_obj.name, support_ret)
             self._cache[support_obj] = support_ret
         return self._cache[support_obj]
 
+    cache_wrapper.support_obj = support_obj
     return cache_wrapper
 
 
@@ -234,14 +246,23 @@ class SupportCache:
 
     def __init__(self, virtconn):
         self._cache = {}
+        self._persistent = None
         self._virtconn = virtconn
 
+    def set_persistent_cache(self, capscache):
+        """
+        Store connection wide results in the passed CapsCache, and
+        use any results already stored there
+        """
+        self._persistent = capscache
+
     conn_domain = _make(function="virConnect.listAllDomains", run_args=())
     conn_storage = _make(function="virConnect.listAllStoragePools", run_args=())
     conn_nodedev = _make(function="virConnect.listDevices", run_args=(None, 0))
     conn_network = _make(function="virConnect.listNetworks", run_args=())
 
     conn_stream = _make(function="virConnect.newStream", run_args=(0,))
+    conn_sparse_stream = _make(version="3.4.0")
     conn_working_xen_events = _make(hv_version={"xen": "4.0.0", "all": 0})
     # This is an arbitrary check to say whether it's a good idea to
     # default to qcow2. It might be fine for xen or qemu older than the versions
@@ -292,6 +313,7 @@ class SupportCache:
     )
     domain_managed_save = _make(function="virDomain.hasManagedSaveImage", run_args=(0,))
     domain_job_info = _make(function="virDomain.jobInfo", run_args=())
+    domain_job_stats = _make(function="virDomain.jobStats", run_args=())
     domain_list_snapshots = _make(function="virDomain.listAllSnapshots", run_args=())
     domain_memory_stats = _make(function="virDomain.memoryStats", run_args=())
     domain_state = _make(function="virDomain.state", run_args=())
@@ -300,6 +322,36 @@ class SupportCache:
     )
     domain_undefine_keep_tpm = _make(hv_libvirt_version={"qemu": "8.9.0"})
 
+    # Migration tuning options
+    domain_migrate_auto_converge = _make(
+        function="virDomain.migrate3",
+        flag="VIR_MIGRATE_AUTO_CONVERGE",
+        version="1.2.3",
+        hv_version={"qemu": "1.6.0", "test": 0},
+    )
+    domain_migrate_compression = _make(
+        function="virDomain.migrate3",
+        flag="VIR_MIGRATE_COMPRESSED",
+        version="1.3.4",
+        hv_version={"qemu": 0, "test": 0},
+    )
+    domain_migrate_postcopy = _make(
+        function="virDomain.migrateStartPostCopy",
+        flag="VIR_MIGRATE_POSTCOPY",
+        version="1.3.3",
+        hv_version={"qemu": "2.5.0", "test": 0},
+    )
+    domain_migrate_parallel = _make(
+        function="virDomain.migrate3",
+        flag="VIR_MIGRATE_PARALLEL",
+        version="5.2.0",
+        hv_version={"qemu": "4.0.0", "test": 0},
+    )
+    # zlib and zstd compression over multifd connections
+    domain_migrate_multifd_compression = _make(
+        version="9.4.0", hv_version={"qemu": "5.0.0", "test": 0}
+    )
+
     # Pool checks
     pool_metadata_prealloc = _make(flag="VIR_STORAGE_VOL_CREATE_PREALLOC_METADATA", version="1.0.1")
 
@@ -314,3 +366,8 @@ class SupportCache:
         """
         sobj = _SupportCheck(version=version)
         return sobj(self._virtconn, None)
+
+
+for _name, _value in list(vars(SupportCache).items()):
+    if hasattr(_value, "support_obj"):
+        _value.support_obj.name = _name
@@ -112,6 +112,11 @@ class MagicURI:
                      files in test/capabilities-xml/
         * 'domcaps=%s': Points to a file with domain capabilities XML, that
                         will be returned in conn.getDomainCapabilities
+        * 'record=%s': Record libvirt API responses to this fixture file,
+                       for use with 'replay'
+        * 'replay=%s': Serve the libvirt connection offline from this
+                       fixture file, see virtinst/replayconn.py
+        * 'latency=%d': Milliseconds to sleep on every replayed API call
 
     See tests/utils.py for example URLs
     """
@@ -141,6 +146,9 @@ class MagicURI:
         self.fakeuri = opts.pop("fakeuri", None)
         self.capsfile = opts.pop("caps", None)
         self.domcapsfile = opts.pop("domcaps", None)
+        self.recordfile = opts.pop("record", None)
+        self.replayfile = opts.pop("replay", None)
+        self.latency = int(opts.pop("latency", 0)) / 1000.0
 
         self.conn_version = opts.pop("connver", None)
         if self.conn_version:
@@ -164,6 +172,22 @@ class MagicURI:
         if self._err:
             raise RuntimeError(self._err)
 
+    def wrap_conn(self, conn):
+        """
+        Return the object that should stand in for the opened libvirt
+        connection, for record and replay support
+        """
+        from . import replayconn
+
+        if self.replayfile:
+            conn.close()
+            fixture = replayconn.load_fixture(self.replayfile)
+            return replayconn.ReplayConnection(fixture, self.latency)
+        if self.recordfile:
+            recorder = replayconn.FixtureRecorder(self.recordfile, self.open_uri)
+            return recorder.wrap_conn(conn)
+        return conn
+
     def overwrite_conn_functions(self, conn):
         """
         After the connection is open, we need to stub out various functions
@@ -206,7 +230,8 @@ class MagicURI:
             # we can keep getting code coverage of the old code paths
             _raise_nosupport_error("virtinst test driver fake domcaps nosupport")
 
-        conn.getDomainCapabilities = fake_domcaps
+        if domcapsxml or not (self.recordfile or self.replayfile):
+            conn.getDomainCapabilities = fake_domcaps
 
         if self.fakeuri:
             origcreate = conn.createXML
@@ -171,7 +171,7 @@ def main(conn=None):
     cli.convert_old_force(options)
     cli.parse_check(options.check)
     cli.set_prompt(options.prompt)
-    conn = cli.getConnection(options.connect, conn=conn)
+    conn = cli.getConnection(options.connect, conn=conn, use_cache=options.use_cache)
 
     if options.new_diskfile is None and options.auto_clone is False:
         fail(
@@ -1286,7 +1286,7 @@ def main(conn=None):
     set_test_stub_options(options)
     convert_old_os_options(options)
 
-    conn = cli.getConnection(options.connect, conn=conn)
+    conn = cli.getConnection(options.connect, conn=conn, use_cache=options.use_cache)
 
     if options.test_media_detection:
         do_test_media_detection(conn, options)
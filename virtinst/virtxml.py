@@ -615,7 +615,7 @@ def main(conn=None):
     if options.confirm and not options.print_xml:
         options.print_diff = True
 
-    conn = cli.getConnection(options.connect, conn)
+    conn = cli.getConnection(options.connect, conn, use_cache=options.use_cache)
     action = parse_action(conn, options)
 
     domain = None